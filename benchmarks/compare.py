@@ -0,0 +1,78 @@
+"""
+Diff two benchmark result files written by benchmarks/run.py.
+
+    python -m benchmarks.compare before.json after.json --fail-above 10
+
+Throughputs (*_per_second) should go up and latencies (*_ms) and stage
+durations (seconds) down; a change in the wrong direction is a regression.
+With --fail-above the exit status is 1 when any regression exceeds that
+many percent.
+"""
+import argparse
+import json
+import sys
+
+SECTIONS = ("crawl", "index", "export", "search")
+
+
+def flatten(results, prefix=""):
+    """Numeric leaves of the result sections as {"search.postgres.p95_ms": value}."""
+    metrics = {}
+    for key, value in results.items():
+        if not prefix and key not in SECTIONS:
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            metrics.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[name] = value
+    return metrics
+
+
+def direction(name):
+    """1 when a higher value is better, -1 when lower is better, 0 for plain counts."""
+    leaf = name.rsplit(".", 1)[-1]
+    if leaf.endswith("_per_second"):
+        return 1
+    if leaf.endswith("_ms") or leaf == "seconds":
+        return -1
+    return 0
+
+
+def compare(before, after):
+    """Rows of (metric, before, after, percent change, regression percent) for metrics in both files."""
+    old, new = flatten(before), flatten(after)
+    rows = []
+    for name in sorted(old.keys() & new.keys()):
+        change = (new[name] - old[name]) / old[name] * 100 if old[name] else None
+        regression = 0.0
+        if change is not None and direction(name):
+            regression = max(-change * direction(name), 0.0)
+        rows.append((name, old[name], new[name], change, regression))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two Gibble benchmark results")
+    parser.add_argument("before", help="Baseline results JSON")
+    parser.add_argument("after", help="Candidate results JSON")
+    parser.add_argument("--fail-above", type=float, default=None, help="Exit with status 1 on a regression above this percent")
+    args = parser.parse_args()
+
+    with open(args.before) as handle:
+        before = json.load(handle)
+    with open(args.after) as handle:
+        after = json.load(handle)
+
+    print(f"before: {before.get('revision')}  after: {after.get('revision')}")
+    rows = compare(before, after)
+    width = max((len(row[0]) for row in rows), default=10)
+    worst = 0.0
+    for name, old, new, change, regression in rows:
+        change_text = f"{change:+8.1f}%" if change is not None else "       -"
+        marker = "  REGRESSION" if regression and args.fail_above is not None and regression > args.fail_above else ""
+        print(f"{name:<{width}}  {old:>14.3f}  {new:>14.3f}  {change_text}{marker}")
+        worst = max(worst, regression)
+
+    if args.fail_above is not None and worst > args.fail_above:
+        sys.exit(1)
@@ -0,0 +1,81 @@
+import os
+import random
+from itertools import accumulate
+
+SYLLABLES = [
+    "ka", "lo", "mi", "ren", "tar", "vo", "shi", "dan", "el", "or", "qui", "zen", "ba", "tor",
+    "ul", "gra", "fen", "pol", "sa", "ny", "cor", "wik", "do", "hal", "ter", "ion", "mar", "sel",
+]
+
+
+def make_vocabulary(rng, size):
+    """Distinct pronounceable words the indexer keeps (ASCII letters, longer than 3 characters)."""
+    words = set()
+    while len(words) < size:
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if len(word) > 3:
+            words.add(word)
+    return sorted(words)
+
+
+def generate_corpus(directory, pages=1000, seed=0, vocabulary_size=20000):
+    """
+    Write a deterministic, Wikipedia-like HTML corpus into directory.
+
+    Words follow a Zipf distribution, so the index gets a few very common
+    terms and a long tail of rare ones. Every page links to other pages of
+    the corpus plus some links the crawler must skip. Returns the file names.
+    """
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng, vocabulary_size)
+    rng.shuffle(vocabulary)
+    cumulative_weights = list(accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+
+    def words(count):
+        return rng.choices(vocabulary, cum_weights=cumulative_weights, k=count)
+
+    os.makedirs(directory, exist_ok=True)
+    names = [f"page_{number:06d}.html" for number in range(pages)]
+
+    for name in names:
+        title = " ".join(word.capitalize() for word in words(rng.randint(2, 4)))
+        paragraphs = [" ".join(words(rng.randint(20, 120))) for _ in range(rng.randint(5, 40))]
+        links = [f'<a href="{rng.choice(names)}">{" ".join(words(2))}</a>' for _ in range(rng.randint(10, 50))]
+        links += ['<a href="#top">Top</a>', '<a href="image.png">Image</a>', '<a href="mailto:editor@example.com">Mail</a>']
+
+        description = ""
+        if rng.random() < 0.7:
+            description = f'<meta property="og:description" content="{" ".join(words(25))}">'
+
+        html = f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title} - Gibblepedia</title>
+{description}
+<style>body {{ font-family: sans-serif; }}</style>
+<script>window.pageName = "{title}";</script>
+</head>
+<body>
+<h1>{title}</h1>
+<table class="infobox"><tr><th>Known as</th><td>{" ".join(words(3))}</td></tr></table>
+{"".join(f"<p>{paragraph}</p>" for paragraph in paragraphs)}
+<div class="links">{" ".join(links)}</div>
+</body>
+</html>
+"""
+        with open(os.path.join(directory, name), "w", encoding="utf-8") as handle:
+            handle.write(html)
+
+    return names
+
+
+def load_corpus(directory):
+    """File names of a recorded corpus: every .html file under directory, sorted."""
+    names = []
+    for root, _, files in os.walk(directory):
+        names.extend(
+            os.path.relpath(os.path.join(root, name), directory)
+            for name in files if name.endswith((".html", ".htm"))
+        )
+    return sorted(names)
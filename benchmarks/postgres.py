@@ -0,0 +1,79 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import uuid
+from contextlib import contextmanager
+import psycopg2
+
+
+def find_pg_binary(name, pg_bin=None):
+    """Locate a Postgres server binary in pg_bin, $PG_BIN or on the PATH."""
+    for directory in (pg_bin, os.getenv("PG_BIN")):
+        if directory and os.path.exists(os.path.join(directory, name)):
+            return os.path.join(directory, name)
+    return shutil.which(name)
+
+
+@contextmanager
+def temporary_cluster(pg_bin=None):
+    """Run a private Postgres cluster in a temporary directory, listening on a Unix socket only."""
+    initdb, pg_ctl = find_pg_binary("initdb", pg_bin), find_pg_binary("pg_ctl", pg_bin)
+    directory = tempfile.mkdtemp(prefix="gibble-bench-pg-")
+    data = os.path.join(directory, "data")
+    try:
+        subprocess.run(
+            [initdb, "-D", data, "-U", "postgres", "--auth=trust", "-E", "UTF8", "--no-sync"],
+            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+        # Durability does not matter for a throwaway database, speed and repeatability do
+        options = f"-k {directory} -c listen_addresses='' -c fsync=off -c synchronous_commit=off -c full_page_writes=off"
+        subprocess.run(
+            [pg_ctl, "-D", data, "-o", options, "-l", os.path.join(directory, "postgres.log"), "-w", "start"],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        try:
+            # Trust authentication ignores the password, but the services refuse to start without one
+            yield {"DB_HOST": directory, "DB_PORT": "5432", "DB_USER": "postgres", "DB_PASSWORD": "postgres"}
+        finally:
+            subprocess.run([pg_ctl, "-D", data, "-m", "fast", "-w", "stop"], stdout=subprocess.DEVNULL)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+@contextmanager
+def throwaway_postgres(pg_bin=None):
+    """
+    Yield the DB_* environment of an empty database that is dropped afterwards.
+
+    A private cluster is started when initdb is available (and allowed: it
+    refuses to run as root). Otherwise a uniquely named database is created
+    on the server the DB_* environment variables point at.
+    """
+    if find_pg_binary("initdb", pg_bin) and find_pg_binary("pg_ctl", pg_bin) and os.geteuid() != 0:
+        with temporary_cluster(pg_bin) as server:
+            yield {**server, "DB_NAME": "postgres"}
+        return
+
+    server = {key: os.getenv(key) for key in ("DB_HOST", "DB_PORT", "DB_USER", "DB_PASSWORD")}
+    name = f"gibble_bench_{uuid.uuid4().hex[:12]}"
+
+    def admin_connection():
+        connection = psycopg2.connect(
+            dbname=os.getenv("BENCH_ADMIN_DB", "postgres"),
+            host=server["DB_HOST"], port=server["DB_PORT"], user=server["DB_USER"], password=server["DB_PASSWORD"],
+        )
+        connection.autocommit = True
+        return connection
+
+    connection = admin_connection()
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE DATABASE {name};")
+    connection.close()
+    try:
+        yield {**server, "DB_NAME": name}
+    finally:
+        connection = admin_connection()
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP DATABASE IF EXISTS {name} WITH (FORCE);")
+        connection.close()
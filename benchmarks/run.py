@@ -0,0 +1,300 @@
+"""
+Offline end-to-end benchmark of the crawler, the indexer and search.
+
+A deterministic corpus (or a recorded one, --corpus-dir) is served from a
+local HTTP server, crawled by GibbleCrawler, indexed by the Indexer and
+queried through frontend/database.py, all against a throwaway Postgres.
+Every stage runs as its own process, the way it runs in production.
+
+Run from the repository root:
+
+    python -m benchmarks.run --pages 2000 --output results.json
+    python -m benchmarks.compare before.json results.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import shutil
+import numpy as np
+import psycopg2
+from benchmarks.corpus import generate_corpus, load_corpus
+from benchmarks.postgres import throwaway_postgres
+from benchmarks.server import CorpusServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def revision():
+    """The git commit benchmarked, marked dirty when the tree has local changes."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def latency_summary(latencies):
+    values = np.asarray(latencies, dtype=np.float64)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+def per_second(count, seconds):
+    return round(count / seconds, 2) if seconds > 0 else None
+
+
+class Benchmark:
+    def __init__(self, workdir, db_env, log, shards=0):
+        self.workdir = workdir
+        self.env = {**os.environ, **db_env, "PYTHONPATH": ROOT, "INDEX_SHARDS": str(shards or "")}
+        self.db_env = db_env
+        self.log = log
+        self.shards = shards
+
+    def index_table(self, name):
+        """An index table in a FROM clause, the union of the schema shards when the index is sharded."""
+        if not self.shards:
+            return name
+        return "(" + " UNION ALL ".join(f"SELECT * FROM shard_{number}.{name}" for number in range(self.shards)) + f") {name}"
+
+    def query(self, sql, params=None):
+        connection = psycopg2.connect(
+            dbname=self.db_env["DB_NAME"], host=self.db_env["DB_HOST"], port=self.db_env["DB_PORT"],
+            user=self.db_env["DB_USER"], password=self.db_env["DB_PASSWORD"],
+        )
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+        finally:
+            connection.close()
+
+    def run_stage(self, name, command, cwd, env=None):
+        """Run one stage to completion in its own process; returns the wall-clock seconds it took."""
+        log_path = os.path.join(self.workdir, f"{name}.log")
+        started = time.perf_counter()
+        with open(log_path, "w") as log_file:
+            process = subprocess.run(
+                [sys.executable] + command, cwd=cwd, env=env or self.env,
+                stdout=subprocess.DEVNULL, stderr=log_file,
+            )
+        elapsed = time.perf_counter() - started
+        if process.returncode != 0:
+            with open(log_path) as log_file:
+                tail = log_file.read()[-2000:]
+            raise RuntimeError(f"{name} stage exited with status {process.returncode}:\n{tail}")
+        self.log(f"{name}: {elapsed:.2f}s")
+        return elapsed
+
+    def crawl(self, urls, corpus_bytes, mode, concurrency, extractor, page_storage):
+        seed_file = os.path.join(self.workdir, "seeds.txt")
+        with open(seed_file, "w") as handle:
+            handle.write("\n".join(urls) + "\n")
+
+        # The corpus server is the only host, politeness delays would only measure themselves
+        command = [
+            "main.py", "--mode", mode, "--seed-file", seed_file, "--extractor", extractor, "--flush-interval", "1",
+            "--host-delay", "0", "--host-concurrency", str(concurrency if mode == "async" else 1), "--stats-interval", "0",
+        ]
+        if mode == "async":
+            command += ["--concurrency", str(concurrency)]
+        elapsed = self.run_stage(
+            "crawl", command, os.path.join(ROOT, "crawler"), env={**self.env, "PAGE_STORAGE": page_storage}
+        )
+
+        (fetched,), = self.query("SELECT COUNT(*) FROM urls WHERE crawled;")
+        (stored,), = self.query("SELECT COUNT(*) FROM pages;")
+        (stored_bytes,), = self.query(
+            "SELECT pg_total_relation_size('pages') + COALESCE(pg_total_relation_size(to_regclass('page_bodies')), 0);"
+        )
+        return {
+            "seconds": round(elapsed, 3),
+            "mode": mode,
+            "extractor": extractor,
+            "urls_crawled": fetched,
+            "pages_stored": stored,
+            "page_storage": page_storage,
+            "page_storage_megabytes": round(stored_bytes / 1e6, 3),
+            "pages_per_second": per_second(fetched, elapsed),
+            "megabytes_per_second": per_second(corpus_bytes / 1e6, elapsed),
+        }
+
+    def index(self, workers, batch_size):
+        elapsed = self.run_stage(
+            "index", ["main.py", "--workers", str(workers), "--batch-size", str(batch_size)], os.path.join(ROOT, "indexer")
+        )
+        (documents,), = self.query(f"SELECT COUNT(*) FROM {self.index_table('documents')};")
+        (postings,), = self.query(f"SELECT COUNT(*) FROM {self.index_table('postings')};")
+        (terms,), = self.query(f"SELECT COUNT(DISTINCT term) FROM {self.index_table('terms')};")
+        return {
+            "seconds": round(elapsed, 3),
+            "workers": workers,
+            "shards": self.shards,
+            "documents": documents,
+            "postings": postings,
+            "terms": terms,
+            "pages_per_second": per_second(documents, elapsed),
+            "postings_per_second": per_second(postings, elapsed),
+        }
+
+    def export_segments(self, segment_dir):
+        elapsed = self.run_stage(
+            "export", ["main.py", "--export-segments", "--segment-dir", segment_dir], os.path.join(ROOT, "indexer")
+        )
+        return {"seconds": round(elapsed, 3)}
+
+    def make_queries(self, count, seed, vocabulary_size=5000):
+        """
+        A deterministic query workload drawn from the indexed dictionary.
+
+        Terms are picked with a Zipf skew over the most frequent ones, queries
+        have one to three words and about one in ten ends in a truncated word,
+        exercising the partial match path.
+        """
+        vocabulary = [term for term, in self.query(
+            f"SELECT term FROM {self.index_table('terms')} GROUP BY term HAVING SUM(df) > 0 ORDER BY SUM(df) DESC, term LIMIT %s;",
+            (vocabulary_size,),
+        )]
+        if not vocabulary:
+            raise RuntimeError("The index is empty, nothing to query")
+
+        rng = random.Random(seed)
+        cumulative_weights = np.cumsum(1 / np.arange(1, len(vocabulary) + 1)).tolist()
+        queries = []
+        for _ in range(count):
+            words = rng.choices(vocabulary, cum_weights=cumulative_weights, k=rng.choice((1, 1, 2, 2, 2, 3)))
+            if rng.random() < 0.1 and len(words[-1]) > 5:
+                words[-1] = words[-1][:rng.randint(4, len(words[-1]) - 1)]
+            queries.append(" ".join(words))
+        return queries
+
+    def search(self, backend, queries, warmup, segment_dir=None, page_size=0):
+        queries_path = os.path.join(self.workdir, "queries.json")
+        with open(queries_path, "w") as handle:
+            json.dump(queries, handle)
+
+        output_path = os.path.join(self.workdir, f"search-{backend}.json")
+        env = {**self.env, "SEARCH_BACKEND": backend, "SEARCH_CACHE_BACKEND": "none"}
+        if segment_dir:
+            env["SEARCH_SEGMENT_DIR"] = segment_dir
+        elapsed = self.run_stage(
+            f"search-{backend}",
+            [
+                "-m", "benchmarks.search", "--queries", queries_path, "--warmup", str(warmup),
+                "--page-size", str(page_size), "--output", output_path,
+            ],
+            ROOT, env=env,
+        )
+
+        with open(output_path) as handle:
+            measured = json.load(handle)
+        latencies = measured["latencies_ms"]
+        return {
+            "seconds": round(elapsed, 3),
+            "queries": len(latencies),
+            "queries_per_second": per_second(len(latencies), sum(latencies) / 1000),
+            **latency_summary(latencies),
+            "mean_results": round(float(np.mean(measured["result_counts"])), 2),
+            "steps_mean_ms": {
+                name: round(float(np.mean(values)), 3) for name, values in sorted(measured["steps_ms"].items())
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gibble offline crawl, index and search benchmark")
+    parser.add_argument("--pages", type=int, default=1000, help="Pages in the generated corpus")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated corpus and query workload")
+    parser.add_argument("--corpus-dir", default=None, help="Benchmark a recorded corpus of .html files instead")
+    parser.add_argument("--crawl-mode", choices=["sync", "async"], default="async", help="Crawler mode")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent fetches in async mode")
+    parser.add_argument("--extractor", default="streaming", help="HTML extraction backend of the crawler")
+    parser.add_argument("--page-storage", choices=["jsonb", "zstd"], default="jsonb", help="How the crawler stores page text")
+    parser.add_argument("--index-workers", type=int, default=2, help="Indexer tokenizer processes")
+    parser.add_argument("--index-shards", type=int, default=0, help="Split the index across this many schemas (0 keeps it unsharded)")
+    parser.add_argument("--index-batch-size", type=int, default=100, help="Pages per indexer transaction")
+    parser.add_argument("--queries", type=int, default=500, help="Timed queries per search backend")
+    parser.add_argument("--warmup", type=int, default=50, help="Untimed queries per search backend")
+    parser.add_argument("--page-size", type=int, default=0, help="Time only the first page of this many results per query (0 times all results)")
+    parser.add_argument("--backends", default="postgres,segments", help="Comma separated search backends to query")
+    parser.add_argument("--pg-bin", default=None, help="Directory with initdb and pg_ctl for a private cluster")
+    parser.add_argument("--output", default=None, help="Write the JSON results here instead of stdout")
+    parser.add_argument("--keep-workdir", action="store_true", help="Keep the corpus, logs and segments")
+    args = parser.parse_args()
+
+    def log(message):
+        print(message, file=sys.stderr, flush=True)
+
+    backends = [backend.strip() for backend in args.backends.split(",") if backend.strip()]
+    if args.index_shards and "segments" in backends:
+        parser.error("Segments are exported from an unsharded index only, pass --backends postgres")
+    workdir = tempfile.mkdtemp(prefix="gibble-bench-")
+    try:
+        if args.corpus_dir:
+            corpus_dir = os.path.abspath(args.corpus_dir)
+            names = load_corpus(corpus_dir)
+        else:
+            corpus_dir = os.path.join(workdir, "corpus")
+            names = generate_corpus(corpus_dir, pages=args.pages, seed=args.seed)
+        corpus_bytes = sum(os.path.getsize(os.path.join(corpus_dir, name)) for name in names)
+        log(f"corpus: {len(names)} pages, {corpus_bytes / 1e6:.1f} MB")
+
+        results = {
+            "revision": revision(),
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": {"platform": platform.platform(), "cpus": os.cpu_count()},
+            "parameters": {**vars(args), "corpus_pages": len(names), "corpus_bytes": corpus_bytes},
+        }
+
+        with CorpusServer(corpus_dir) as server, throwaway_postgres(args.pg_bin) as db_env:
+            benchmark = Benchmark(workdir, db_env, log, args.index_shards)
+            results["crawl"] = benchmark.crawl(
+                [server.url + name for name in names], corpus_bytes, args.crawl_mode, args.concurrency, args.extractor,
+                args.page_storage,
+            )
+            results["index"] = benchmark.index(args.index_workers, args.index_batch_size)
+
+            segment_dir = None
+            if "segments" in backends:
+                segment_dir = os.path.join(workdir, "segments")
+                results["export"] = benchmark.export_segments(segment_dir)
+
+            queries = benchmark.make_queries(args.queries, args.seed)
+            results["search"] = {
+                backend: benchmark.search(backend, queries, args.warmup, segment_dir, args.page_size) for backend in backends
+            }
+    finally:
+        if args.keep_workdir:
+            log(f"workdir kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Replay a query workload against frontend.database.Database.
+
+Run by benchmarks/run.py in its own process, with the DB_* and SEARCH_*
+environment of the backend under test; writes per-query latencies as JSON.
+"""
+import argparse
+import json
+import time
+from frontend.database import Database
+
+
+def replay(db, queries, warmup, page_size=0):
+    """
+    Search every query once after warmup untimed ones; returns latencies, result counts and step timings.
+
+    With a page_size, only the first page of each query is fetched, as the
+    search page and the JSON API do, instead of all its results.
+    """
+    def search(query):
+        if page_size:
+            page, timings = db.search_page(query, limit=page_size)
+            return page["results"], timings
+        return db.search_with_timings(query)
+
+    for query in queries[:warmup]:
+        search(query)
+
+    latencies, result_counts, steps = [], [], {}
+    for query in queries:
+        started = time.perf_counter()
+        results, timings = search(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+        result_counts.append(len(results))
+        for name, elapsed in timings.items():
+            steps.setdefault(name, []).append(elapsed)
+    return latencies, result_counts, steps
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gibble search benchmark worker")
+    parser.add_argument("--queries", required=True, help="JSON file with the list of queries")
+    parser.add_argument("--warmup", type=int, default=20, help="Untimed queries run first")
+    parser.add_argument("--page-size", type=int, default=0, help="Fetch only the first page of this many results (0 fetches them all)")
+    parser.add_argument("--output", required=True, help="Where to write the JSON measurements")
+    args = parser.parse_args()
+
+    with open(args.queries) as handle:
+        queries = json.load(handle)
+
+    db = Database()
+    latencies, result_counts, steps = replay(db, queries, args.warmup, args.page_size)
+    db.close()
+
+    with open(args.output, "w") as handle:
+        json.dump({"latencies_ms": latencies, "result_counts": result_counts, "steps_ms": steps}, handle)
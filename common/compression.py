@@ -0,0 +1,76 @@
+import hashlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Zstandard's default dictionary size, plenty for the boilerplate shared by Wikipedia-like pages
+DICTIONARY_SIZE = 112640
+
+
+def require_zstandard():
+    if zstandard is None:
+        raise RuntimeError("Compressed page storage needs the zstandard package (pip install zstandard)")
+
+
+def text_hash(text):
+    """Digest of a page text, compared to tell whether a stored body changed."""
+    return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+
+def train_dictionary(texts, size=DICTIONARY_SIZE):
+    """Train a zstd dictionary on sample page texts."""
+    require_zstandard()
+    return zstandard.train_dictionary(size, [text.encode() for text in texts]).as_bytes()
+
+
+class PageCodec:
+    """Compresses page text with zstd, against a trained dictionary when one is given."""
+
+    name = "zstd"
+
+    def __init__(self, level=3, dictionary=None, dictionary_id=None):
+        require_zstandard()
+        self.dictionary_id = dictionary_id if dictionary else None
+        self.compressor = zstandard.ZstdCompressor(
+            level=level,
+            dict_data=zstandard.ZstdCompressionDict(dictionary) if dictionary else None,
+        )
+
+    def compress(self, text):
+        return self.compressor.compress(text.encode())
+
+
+class BodyReader:
+    """
+    Decompresses stored page bodies, loading each dictionary once.
+
+    load_dictionary is called with a dictionary id and returns its bytes.
+    """
+
+    def __init__(self, load_dictionary):
+        self.load_dictionary = load_dictionary
+        self.decompressors = {}  # dictionary id -> ZstdDecompressor
+
+    def decompress(self, codec, dictionary_id, body):
+        if codec != PageCodec.name:
+            raise ValueError(f"Unknown page body codec {codec!r}")
+        require_zstandard()
+
+        decompressor = self.decompressors.get(dictionary_id)
+        if decompressor is None:
+            dictionary = self.load_dictionary(dictionary_id) if dictionary_id is not None else None
+            decompressor = zstandard.ZstdDecompressor(
+                dict_data=zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            )
+            self.decompressors[dictionary_id] = decompressor
+        try:
+            return decompressor.decompress(bytes(body)).decode()
+        except zstandard.ZstdError as error:
+            # Most likely a body compressed with another dictionary than the one it names
+            raise ValueError(f"Cannot decompress a page body with dictionary {dictionary_id}: {error}") from error
+
+    def page_text(self, text, codec, dictionary_id, body):
+        """The text of a page: text when stored uncompressed as JSONB, as older pages are, else its body's."""
+        return text if text is not None else self.decompress(codec, dictionary_id, body)
@@ -0,0 +1,102 @@
+"""
+Compressed word positions and the phrase queries they answer.
+
+The positions of a posting are stored as unsigned LEB128 varints of the
+gaps between them, the first gap counted from zero, which takes one byte
+per position for all but the longest pages.
+"""
+
+import numpy as np
+
+
+def encode_varints(values, out):
+    """Append unsigned LEB128 varints to a bytearray."""
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+
+
+def decode_varints(buffer):
+    """Decode a run of unsigned LEB128 varints into a uint64 array, without a Python loop."""
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    if len(data) == 0:
+        return np.zeros(0, dtype=np.uint64)
+
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+
+    shifts = np.arange(len(data), dtype=np.uint64) - np.repeat(starts, ends - starts + 1).astype(np.uint64)
+    payload = (data & 0x7F).astype(np.uint64) << (shifts * np.uint64(7))
+    return np.add.reduceat(payload, starts)
+
+
+def encode_positions(positions):
+    """The ascending word positions of one posting as varint gaps."""
+    gaps = []
+    previous = 0
+    for position in positions:
+        gaps.append(position - previous)
+        previous = position
+    out = bytearray()
+    encode_varints(gaps, out)
+    return bytes(out)
+
+
+def positions_from_gaps(gaps, counts):
+    """
+    Positions of consecutive postings, flattened, from their concatenated gaps.
+
+    counts holds how many positions each posting has; the gaps of every
+    posting restart from zero.
+    """
+    gaps = np.asarray(gaps, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    totals = np.cumsum(gaps)
+    starts = np.cumsum(counts) - counts
+    bases = np.zeros(len(counts), dtype=np.int64)
+    later = starts > 0
+    bases[later] = totals[starts[later] - 1]
+    return totals - np.repeat(bases, counts)
+
+
+def decode_positions(blobs, counts):
+    """Positions of several postings, flattened, from their encode_positions() blobs and position counts."""
+    return positions_from_gaps(decode_varints(b"".join(blobs)), counts)
+
+
+def match_phrase(terms, slop=0):
+    """
+    Sorted doc_ids of the documents a phrase occurs in.
+
+    terms holds (offset, doc_ids, counts, positions) for every indexed word
+    of the phrase: the word's offset within the phrase and its postings,
+    counts[i] positions of doc_ids[i] flattened into positions. A document
+    matches where every word sits at its offset from the rarest one, give or
+    take slop words: slop=0 is an exact phrase, a larger slop a proximity
+    query. Every position is keyed by (doc_id, position - offset), so the
+    work is a sort and a binary search per position, about the cost of
+    intersecting the posting lists.
+    """
+    if not terms:
+        return np.zeros(0, dtype=np.int64)
+    shift = max(offset for offset, _, _, _ in terms) + slop  # keeps every key non-negative
+
+    def keys(offset, doc_ids, counts, positions):
+        doc_ids = np.repeat(np.asarray(doc_ids, dtype=np.int64), counts)
+        return np.sort((doc_ids << 32) | (np.asarray(positions, dtype=np.int64) - offset + shift))
+
+    terms = sorted(terms, key=lambda term: len(term[3]))
+    candidates = keys(*terms[0])
+    for term in terms[1:]:
+        other = keys(*term)
+        if len(candidates) == 0 or len(other) == 0:
+            return np.zeros(0, dtype=np.int64)
+        index = np.searchsorted(other, candidates - slop)
+        found = index < len(other)
+        found[found] = other[index[found]] <= candidates[found] + slop
+        candidates = candidates[found]
+    return np.unique(candidates >> 32)
@@ -0,0 +1,615 @@
+"""
+Immutable on-disk index segments.
+
+A segment is a single file holding a slice of the index:
+
+    header            magic, version, counts and the offset of every section
+    doc_ids           u64 global doc_id of every document, ascending
+    doc_lengths       u32 indexed length of every document
+    doc_offsets       u64 offsets into doc_blob (doc_count + 1 entries)
+    doc_blob          the result card of every document as UTF-8 JSON
+    postings_docs     per term: varint (doc ordinal delta, tf) pairs
+    postings_positions  per posting: varint position count, then position deltas
+    term_offsets      u64 offsets into term_blob (term_count + 1 entries)
+    term_blob         the sorted terms as UTF-8
+    term_records      per term: where its postings live, df, max tf and min length
+
+Segments are opened with mmap and read in place. A directory of segments is
+described by manifest.json; a document in a newer segment supersedes the
+same doc_id in every older one, and merging folds neighbouring segments
+together.
+"""
+
+import fcntl
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from common.positions import decode_varints, encode_varints, positions_from_gaps
+
+MAGIC = b"GSEG"
+VERSION = 1
+HEADER = struct.Struct("<4sIIIQ10Q")
+
+TERM_RECORD = np.dtype([
+    ("docs_offset", "<u8"),
+    ("docs_length", "<u4"),
+    ("positions_offset", "<u8"),
+    ("positions_length", "<u4"),
+    ("df", "<u4"),
+    ("max_tf", "<u4"),
+    ("min_length", "<u4"),
+])
+
+MANIFEST = "manifest.json"
+
+
+def _pad(handle):
+    """Keep every section 8-byte aligned so numpy can view it in place."""
+    padding = -handle.tell() % 8
+    if padding:
+        handle.write(b"\0" * padding)
+
+
+def write_segment(path, documents, postings):
+    """
+    Write a segment file atomically.
+
+    documents is a list of (doc_id, length, card) sorted by doc_id; postings
+    yields (term, [(doc ordinal, tf, positions), ...]) in ascending term order,
+    where a doc ordinal is the document's index in documents.
+    """
+    lengths = [length for _, length, _ in documents]
+    directory = os.path.dirname(os.path.abspath(path))
+    handle = tempfile.NamedTemporaryFile(dir=directory, suffix=".tmp", delete=False)
+    positions_file = tempfile.TemporaryFile(dir=directory)
+
+    try:
+        offsets = []
+        handle.write(b"\0" * HEADER.size)
+        _pad(handle)
+
+        offsets.append(handle.tell())
+        handle.write(np.asarray([doc_id for doc_id, _, _ in documents], dtype="<u8").tobytes())
+        _pad(handle)
+
+        offsets.append(handle.tell())
+        handle.write(np.asarray(lengths, dtype="<u4").tobytes())
+        _pad(handle)
+
+        cards = [json.dumps(card, default=str).encode("utf-8") for _, _, card in documents]
+        offsets.append(handle.tell())
+        handle.write(np.cumsum([0] + [len(card) for card in cards], dtype="<u8").astype("<u8").tobytes())
+        offsets.append(handle.tell())
+        handle.write(b"".join(cards))
+        _pad(handle)
+
+        terms = []
+        records = []
+        offsets.append(handle.tell())
+        docs_start = handle.tell()
+        for term, term_postings in postings:
+            docs_stream = bytearray()
+            positions_stream = bytearray()
+            previous = 0
+            for ordinal, tf, positions in term_postings:
+                encode_varints((ordinal - previous, tf), docs_stream)
+                previous = ordinal
+
+                encode_varints((len(positions),), positions_stream)
+                last = 0
+                for position in positions:
+                    encode_varints((position - last,), positions_stream)
+                    last = position
+
+            records.append((
+                handle.tell() - docs_start,
+                len(docs_stream),
+                positions_file.tell(),
+                len(positions_stream),
+                len(term_postings),
+                max(tf for _, tf, _ in term_postings),
+                min(lengths[ordinal] for ordinal, _, _ in term_postings),
+            ))
+            terms.append(term.encode("utf-8"))
+            handle.write(docs_stream)
+            positions_file.write(positions_stream)
+        _pad(handle)
+
+        offsets.append(handle.tell())
+        positions_file.seek(0)
+        shutil.copyfileobj(positions_file, handle)
+        _pad(handle)
+
+        offsets.append(handle.tell())
+        handle.write(np.cumsum([0] + [len(term) for term in terms], dtype="<u8").astype("<u8").tobytes())
+        offsets.append(handle.tell())
+        handle.write(b"".join(terms))
+        _pad(handle)
+
+        offsets.append(handle.tell())
+        handle.write(np.asarray(records, dtype=TERM_RECORD).tobytes())
+        offsets.append(handle.tell())
+
+        handle.seek(0)
+        handle.write(HEADER.pack(MAGIC, VERSION, len(documents), len(terms), sum(lengths), *offsets))
+        handle.flush()
+        os.fsync(handle.fileno())
+        handle.close()
+        os.replace(handle.name, path)
+    except BaseException:
+        handle.close()
+        os.unlink(handle.name)
+        raise
+    finally:
+        positions_file.close()
+
+
+class Segment:
+    """A read-only, memory-mapped segment file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(path, "rb") as handle:
+            self.buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.doc_count, self.term_count, self.total_length, *offsets = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} segment")
+
+        (doc_ids, doc_lengths, doc_offsets, doc_blob, postings_docs,
+         postings_positions, term_offsets, term_blob, term_records, _) = offsets
+
+        self.doc_ids = np.frombuffer(self.buffer, dtype="<u8", count=self.doc_count, offset=doc_ids)
+        self.doc_lengths = np.frombuffer(self.buffer, dtype="<u4", count=self.doc_count, offset=doc_lengths)
+        self.doc_offsets = np.frombuffer(self.buffer, dtype="<u8", count=self.doc_count + 1, offset=doc_offsets)
+        self.doc_blob = doc_blob
+        self.postings_docs = postings_docs
+        self.postings_positions = postings_positions
+        self.term_offsets = np.frombuffer(self.buffer, dtype="<u8", count=self.term_count + 1, offset=term_offsets)
+        self.term_blob = term_blob
+        self.term_records = np.frombuffer(self.buffer, dtype=TERM_RECORD, count=self.term_count, offset=term_records)
+
+    def term(self, index):
+        start = self.term_blob + int(self.term_offsets[index])
+        end = self.term_blob + int(self.term_offsets[index + 1])
+        return self.buffer[start:end].decode("utf-8")
+
+    def _lower_bound(self, term):
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.term(middle) < term:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def find(self, term):
+        """Index of a term in the dictionary, or -1."""
+        index = self._lower_bound(term)
+        return index if index < self.term_count and self.term(index) == term else -1
+
+    def prefix_range(self, prefix):
+        """The [start, end) range of dictionary indexes whose terms start with prefix."""
+        start = self._lower_bound(prefix)
+        end = self._lower_bound(prefix + "\U0010ffff")
+        return start, end
+
+    def postings(self, index):
+        """Doc ordinals and term frequencies of a term."""
+        record = self.term_records[index]
+        start = self.postings_docs + int(record["docs_offset"])
+        values = decode_varints(self.buffer[start:start + int(record["docs_length"])])
+        return np.cumsum(values[0::2]).astype(np.int64), values[1::2].astype(np.int64)
+
+    def positions(self, index):
+        """Positions of a term, one array per posting."""
+        record = self.term_records[index]
+        start = self.postings_positions + int(record["positions_offset"])
+        values = decode_varints(self.buffer[start:start + int(record["positions_length"])])
+
+        result = []
+        cursor = 0
+        for _ in range(int(record["df"])):
+            count = int(values[cursor])
+            result.append(np.cumsum(values[cursor + 1:cursor + 1 + count]).astype(np.int64))
+            cursor += count + 1
+        return result
+
+    def flat_positions(self, index, tfs):
+        """
+        Position counts of a term's postings and all their positions, flattened.
+
+        tfs, from postings(), is where the counts are expected; a posting with
+        another count (e.g. a migrated one without positions) falls back to
+        walking the stream.
+        """
+        record = self.term_records[index]
+        start = self.postings_positions + int(record["positions_offset"])
+        values = decode_varints(self.buffer[start:start + int(record["positions_length"])]).astype(np.int64)
+
+        count_indexes = np.cumsum(tfs + 1) - (tfs + 1)
+        if len(values) != int(np.sum(tfs + 1)) or not np.array_equal(values[count_indexes], tfs):
+            counts = np.empty(len(tfs), dtype=np.int64)
+            cursor = 0
+            for posting in range(len(tfs)):
+                counts[posting] = values[cursor]
+                cursor += int(values[cursor]) + 1
+            count_indexes = np.cumsum(counts + 1) - (counts + 1)
+        else:
+            counts = tfs
+
+        gaps = np.delete(values, count_indexes)
+        return counts, positions_from_gaps(gaps, counts)
+
+    def card(self, ordinal):
+        start = self.doc_blob + int(self.doc_offsets[ordinal])
+        end = self.doc_blob + int(self.doc_offsets[ordinal + 1])
+        return json.loads(self.buffer[start:end])
+
+    def close(self):
+        # Views handed out by numpy may still be alive, the mapping goes away with them
+        self.doc_ids = self.doc_lengths = self.doc_offsets = self.term_offsets = self.term_records = None
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return {"segments": [], "next_segment": 1, "generation": 0}
+
+
+def write_manifest(directory, manifest):
+    """Replace the manifest atomically; readers see either the old or the new one."""
+    path = os.path.join(directory, MANIFEST)
+    with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False) as handle:
+        json.dump(manifest, handle)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(handle.name, path)
+
+
+@contextmanager
+def locked_manifest(directory):
+    """Read-modify-write the manifest while holding the directory lock."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            manifest = read_manifest(directory)
+            yield manifest
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def add_segment(directory, documents, postings):
+    """Write a new, newest segment into a directory and publish it in the manifest."""
+    with locked_manifest(directory) as manifest:
+        name = f"segment_{manifest['next_segment']:08d}.gseg"
+        write_segment(os.path.join(directory, name), documents, postings)
+        manifest["segments"].append(name)
+        manifest["next_segment"] += 1
+        manifest["generation"] += 1
+        write_manifest(directory, manifest)
+        return name
+
+
+def merge_segments(directory, names):
+    """
+    Fold a run of neighbouring segments into one.
+
+    Within the run, the newest copy of every document wins, so the merged
+    segment keeps the place of the run in the manifest without changing
+    which copy of a document is live.
+    """
+    segments = [Segment(os.path.join(directory, name)) for name in names]
+
+    # Newest copy of each doc_id wins: walk the run from newest to oldest
+    live = {}
+    for position in range(len(segments) - 1, -1, -1):
+        segment = segments[position]
+        for ordinal, doc_id in enumerate(segment.doc_ids.tolist()):
+            live.setdefault(doc_id, (position, ordinal))
+
+    merged_doc_ids = sorted(live)
+    new_ordinals = [np.full(segment.doc_count, -1, dtype=np.int64) for segment in segments]
+    documents = []
+    for new_ordinal, doc_id in enumerate(merged_doc_ids):
+        position, ordinal = live[doc_id]
+        new_ordinals[position][ordinal] = new_ordinal
+        segment = segments[position]
+        documents.append((doc_id, int(segment.doc_lengths[ordinal]), segment.card(ordinal)))
+
+    def merged_postings():
+        cursors = [0] * len(segments)
+        while True:
+            candidates = [
+                segment.term(cursors[position])
+                for position, segment in enumerate(segments)
+                if cursors[position] < segment.term_count
+            ]
+            if not candidates:
+                return
+            term = min(candidates)
+
+            term_postings = []
+            for position, segment in enumerate(segments):
+                if cursors[position] < segment.term_count and segment.term(cursors[position]) == term:
+                    index = cursors[position]
+                    ordinals, tfs = segment.postings(index)
+                    for ordinal, tf, positions in zip(ordinals.tolist(), tfs.tolist(), segment.positions(index)):
+                        new_ordinal = int(new_ordinals[position][ordinal])
+                        if new_ordinal >= 0:
+                            term_postings.append((new_ordinal, tf, positions.tolist()))
+                    cursors[position] += 1
+
+            if term_postings:
+                term_postings.sort()
+                yield term, term_postings
+
+    # Write outside the lock so exports are not held up by a long merge
+    temporary = os.path.join(directory, f"merge_{os.getpid()}_{threading.get_ident()}.gseg.tmp")
+    write_segment(temporary, documents, merged_postings())
+
+    with locked_manifest(directory) as manifest:
+        start = manifest["segments"].index(names[0]) if names[0] in manifest["segments"] else -1
+        if start < 0 or manifest["segments"][start:start + len(names)] != list(names):
+            os.unlink(temporary)
+            raise ValueError("Segments to merge are no longer neighbours in the manifest")
+
+        name = f"segment_{manifest['next_segment']:08d}.gseg"
+        os.replace(temporary, os.path.join(directory, name))
+        manifest["segments"][start:start + len(names)] = [name]
+        manifest["next_segment"] += 1
+        manifest["generation"] += 1
+        write_manifest(directory, manifest)
+
+    for segment in segments:
+        segment.close()
+    for old_name in names:
+        # Readers that still map the old files keep them alive until they reload
+        os.unlink(os.path.join(directory, old_name))
+    return name
+
+
+class SegmentMerger:
+    """
+    Merges segments in the background.
+
+    Whenever a directory holds more than max_segments segments, the
+    merge_factor neighbouring segments with the fewest documents in total
+    are folded into one.
+    """
+
+    def __init__(self, directory, max_segments=8, merge_factor=4, interval=30.0, logger=None):
+        self.directory = directory
+        self.max_segments = max_segments
+        self.merge_factor = merge_factor
+        self.interval = interval
+        self.logger = logger
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._loop, name="segment-merger", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _loop(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                while self.merge_once():
+                    pass
+            except Exception as error:
+                if self.logger:
+                    self.logger.error(f"Error merging segments: {error}")
+
+    def merge_once(self):
+        """Run one merge if the directory needs it; returns whether it merged."""
+        names = read_manifest(self.directory)["segments"]
+        if len(names) <= self.max_segments:
+            return False
+
+        sizes = []
+        for name in names:
+            with open(os.path.join(self.directory, name), "rb") as handle:
+                sizes.append(HEADER.unpack(handle.read(HEADER.size))[2])
+
+        width = min(self.merge_factor, len(names))
+        start = min(range(len(names) - width + 1), key=lambda index: sum(sizes[index:index + width]))
+        merged = merge_segments(self.directory, names[start:start + width])
+        if self.logger:
+            self.logger.info(f"Merged {width} segments into {merged}.")
+        return True
+
+
+class SegmentIndex:
+    """
+    The live segments of a directory, for searching without a database.
+
+    Reloads itself when the manifest changes (checked at most every
+    reload_interval seconds). Documents superseded by a newer segment are
+    masked out of postings and lookups, so the document frequency of a term
+    is the length of its live postings.
+    """
+
+    def __init__(self, directory, reload_interval=5.0):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self.lock = threading.Lock()
+        self.segments = []
+        self.live = []
+        self.generation = None
+        self.manifest_mtime = None
+        self.checked_at = 0.0
+        self.doc_count = 0
+        self.total_length = 0
+        self.refresh(force=True)
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.checked_at < self.reload_interval:
+            return
+        self.checked_at = now
+
+        try:
+            mtime = os.stat(os.path.join(self.directory, MANIFEST)).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self.manifest_mtime and not force:
+            return
+
+        manifest = read_manifest(self.directory)
+        opened = {segment.name: segment for segment in self.segments}
+        try:
+            segments = [
+                opened.get(name) or Segment(os.path.join(self.directory, name))
+                for name in manifest["segments"]
+            ]
+        except FileNotFoundError:
+            # A merge replaced a segment after we read the manifest, retry on the next refresh
+            return
+
+        with self.lock:
+            # A document is live in the newest segment holding it
+            live = [None] * len(segments)
+            seen = np.zeros(0, dtype=np.uint64)
+            for position in range(len(segments) - 1, -1, -1):
+                doc_ids = segments[position].doc_ids
+                live[position] = ~np.isin(doc_ids, seen)
+                seen = np.union1d(seen, doc_ids)
+
+            self.segments = segments
+            self.live = live
+            self.doc_count = int(sum(mask.sum() for mask in live))
+            self.total_length = int(sum(
+                segment.doc_lengths[mask].sum(dtype=np.uint64) for segment, mask in zip(segments, live)
+            ))
+            self.generation = manifest["generation"]
+            self.manifest_mtime = mtime
+
+    def snapshot(self):
+        """The segments and live masks to use for one query."""
+        self.refresh()
+        with self.lock:
+            return list(zip(self.segments, self.live))
+
+    def contains(self, term, snapshot):
+        return any(segment.find(term) >= 0 for segment, _ in snapshot)
+
+    def prefix_terms(self, prefix, limit, snapshot, max_scan=10000):
+        """
+        Up to limit terms starting with prefix, most frequent first.
+
+        Unlike the Postgres backend, which also matches terms containing the
+        word or spelled like it, only prefixes are matched here. Each segment
+        looks at its first max_scan terms with the prefix, in dictionary
+        order, and contributes its limit most frequent ones.
+
+        Frequencies here are summed over segments and so may count superseded
+        copies; they only order the candidates.
+        """
+        frequencies = {}
+        for segment, _ in snapshot:
+            start, end = segment.prefix_range(prefix)
+            end = min(end, start + max_scan)
+            dfs = segment.term_records["df"][start:end]
+            # A stable sort keeps ties in dictionary order
+            for offset in np.argsort(-dfs.astype(np.int64), kind="stable")[:limit].tolist():
+                term = segment.term(start + offset)
+                frequencies[term] = frequencies.get(term, 0) + int(dfs[offset])
+        return sorted(frequencies.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+    def vocabulary(self, snapshot):
+        """
+        Every (term, df) of the segments, sorted by term.
+
+        Like in prefix_terms(), frequencies may count superseded copies.
+        """
+        frequencies = {}
+        for segment, _ in snapshot:
+            dfs = segment.term_records["df"].tolist()
+            for index in range(segment.term_count):
+                term = segment.term(index)
+                frequencies[term] = frequencies.get(term, 0) + dfs[index]
+        return sorted(frequencies.items())
+
+    def term_bounds(self, term, snapshot):
+        """
+        Largest term frequency and shortest document length of a term over all segments.
+
+        Superseded copies are included, which only loosens the bound.
+        """
+        max_tf, min_length = None, None
+        for segment, _ in snapshot:
+            index = segment.find(term)
+            if index < 0:
+                continue
+            record = segment.term_records[index]
+            max_tf = int(record["max_tf"]) if max_tf is None else max(max_tf, int(record["max_tf"]))
+            min_length = int(record["min_length"]) if min_length is None else min(min_length, int(record["min_length"]))
+        return max_tf, min_length
+
+    def postings(self, term, snapshot):
+        """Global doc_ids, term frequencies and document lengths of a term's live postings."""
+        doc_ids, tfs, lengths = [], [], []
+        for segment, mask in snapshot:
+            index = segment.find(term)
+            if index < 0:
+                continue
+            ordinals, term_tfs = segment.postings(index)
+            keep = mask[ordinals]
+            doc_ids.append(segment.doc_ids[ordinals[keep]].astype(np.int64))
+            tfs.append(term_tfs[keep])
+            lengths.append(segment.doc_lengths[ordinals[keep]].astype(np.int64))
+
+        if not doc_ids:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        return np.concatenate(doc_ids), np.concatenate(tfs), np.concatenate(lengths)
+
+    def positions(self, term, snapshot):
+        """Global doc_ids, position counts and flattened positions of a term's live postings."""
+        doc_ids, counts, positions = [], [], []
+        for segment, mask in snapshot:
+            index = segment.find(term)
+            if index < 0:
+                continue
+            ordinals, tfs = segment.postings(index)
+            term_counts, term_positions = segment.flat_positions(index, tfs)
+            keep = mask[ordinals]
+            doc_ids.append(segment.doc_ids[ordinals[keep]].astype(np.int64))
+            counts.append(term_counts[keep])
+            positions.append(term_positions[np.repeat(keep, term_counts)])
+
+        if not doc_ids:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        return np.concatenate(doc_ids), np.concatenate(counts), np.concatenate(positions)
+
+    def cards(self, doc_ids, snapshot):
+        """Result cards of the given documents, keyed by doc_id."""
+        cards = {}
+        for segment, mask in snapshot:
+            wanted = np.asarray([doc_id for doc_id in doc_ids if doc_id not in cards], dtype=np.uint64)
+            if len(wanted) == 0:
+                break
+            ordinals = np.searchsorted(segment.doc_ids, wanted)
+            for doc_id, ordinal in zip(wanted.tolist(), ordinals.tolist()):
+                if ordinal < segment.doc_count and int(segment.doc_ids[ordinal]) == doc_id and mask[ordinal]:
+                    cards[doc_id] = segment.card(ordinal)
+        return cards
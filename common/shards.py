@@ -0,0 +1,97 @@
+import os
+import hashlib
+
+
+class Shard:
+    """
+    One partition of the index: a schema of the main database, or a database of its own.
+
+    Every shard holds the documents, terms, postings, result_cards and
+    index_stats tables of the documents hashed to it, with a term dictionary
+    and statistics of its own; the frontend adds those up across shards.
+    """
+
+    def __init__(self, name, dsn=None, schema=None):
+        self.name = name
+        self.dsn = dsn
+        self.schema = schema
+
+    def __repr__(self):
+        return f"Shard({self.name!r})"
+
+    def connection_parameters(self):
+        """Keyword arguments for psycopg2.connect() and the connection pools."""
+        if self.dsn:
+            parameters = {"dsn": self.dsn}
+        else:
+            parameters = {
+                "dbname": os.getenv("DB_NAME"),
+                "host": os.getenv("DB_HOST"),
+                "password": os.getenv("DB_PASSWORD"),
+                "port": os.getenv("DB_PORT"),
+                "user": os.getenv("DB_USER"),
+            }
+            if not all(parameters.values()):
+                raise ValueError("One or more required environment variables are missing.")
+        if self.schema:
+            # public stays on the path for extensions such as pg_trgm
+            parameters["options"] = f"-c search_path={self.schema},public"
+        return parameters
+
+
+def parse_shards(value):
+    """
+    The shards described by an INDEX_SHARDS value, in order.
+
+    Either a shard count N, for the schemas shard_0 ... shard_N-1 of the main
+    database, or a semicolon separated list whose entries are schema names of
+    the main database or connection strings of other databases. An empty
+    value means an unsharded index, the tables of the main database; a value
+    naming no shard, or the same shard twice, raises ValueError.
+    """
+    value = (value or "").strip()
+    if not value:
+        return []
+    if value.isdigit():
+        if int(value) < 1:
+            raise ValueError(f"Invalid index shard count {value!r}: expected at least 1")
+        return [Shard(f"shard_{number}", schema=f"shard_{number}") for number in range(int(value))]
+
+    shards = []
+    for number, entry in enumerate(entry.strip() for entry in value.split(";") if entry.strip()):
+        if "://" in entry or "=" in entry:
+            shards.append(Shard(f"shard_{number}", dsn=entry))
+        elif entry.isidentifier() and entry == entry.lower():
+            shards.append(Shard(entry, schema=entry))
+        else:
+            raise ValueError(f"Invalid index shard {entry!r}: expected a lower case schema name or a connection string")
+    if not shards:
+        raise ValueError(f"Invalid index shards {value!r}: no schema name or connection string")
+
+    # Documents hashed to two entries for the same tables would be indexed twice
+    locations = [shard.dsn or shard.schema for shard in shards]
+    duplicates = sorted({location for location in locations if locations.count(location) > 1})
+    if duplicates:
+        raise ValueError(f"Invalid index shards: {', '.join(duplicates)} listed more than once")
+    return shards
+
+
+def load_shards():
+    return parse_shards(os.getenv("INDEX_SHARDS"))
+
+
+def shard_of(url, shard_count):
+    """
+    The shard a document belongs to, by jump consistent hashing of its URL.
+
+    Growing the shard list by one moves only the documents the new shard
+    takes over, about 1/shard_count of them, and removing the last shard only
+    moves its own documents.
+    """
+    key = int.from_bytes(hashlib.blake2b(url.encode(), digest_size=8).digest(), "little")
+    bucket, candidate = -1, 0
+    while candidate < shard_count:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((bucket + 1) * (2 ** 31 / ((key >> 33) + 1)))
+    return bucket
@@ -0,0 +1,65 @@
+import string
+
+STRIP_CHARACTERS = string.punctuation + string.whitespace
+
+# Common words that carry no meaning on their own and are never indexed
+COMMON_WORDS = frozenset({
+    'a', 'an', 'the', 'and', 'or', 'but', 'about', 'above', 'after', 'along',
+    'amid', 'among', 'as', 'at', 'by', 'for', 'from', 'in', 'into', 'like',
+    'minus', 'near', 'of', 'off', 'on', 'onto', 'out', 'over', 'past', 'per',
+    'plus', 'since', 'till', 'to', 'under', 'until', 'up', 'via', 'vs', 'with',
+    'that', 'can', 'cannot', 'could', 'may', 'might', 'must', 'need', 'ought',
+    'shall', 'should', 'will', 'would', 'have', 'had', 'has', 'having', 'be',
+    'is', 'am', 'are', 'was', 'were', 'being', 'been', 'get', 'gets', 'got',
+    'gotten', 'getting', 'use', 'uses', 'used', 'using', 'one', 'two', 'three',
+    'four', 'five', 'six', 'seven', 'eight', 'nine', 'ten', 'first', 'second',
+    'third', 'many', 'much', 'more', 'most', 'other', 'another'
+})
+
+# Words of a page kept with its result card, from which search builds snippets
+EXCERPT_WORDS = 100
+
+
+def index_term(word):
+    """
+    The term a word is indexed under, or None when it is not indexed.
+
+    A word is indexed when, lowercased and stripped of punctuation, it is
+    longer than 3 ASCII letters and not a common word.
+    """
+    word = word.lower().strip(STRIP_CHARACTERS)
+    # isascii() + isalpha() is the same test as re.fullmatch(r'[a-zA-Z]+')
+    if len(word) > 3 and word.isascii() and word.isalpha() and word not in COMMON_WORDS:
+        return word
+    return None
+
+
+def tokenize(text):
+    """
+    Map every indexable word of a text (see index_term()) to the word positions it occurs at.
+
+    Positions count every whitespace separated word, indexable or not.
+    """
+    term_positions = {}
+
+    for position, word in enumerate(text.split()):
+        term = index_term(word)
+        if term is not None:
+            positions = term_positions.get(term)
+            if positions is None:
+                term_positions[term] = [position]
+            else:
+                positions.append(position)
+
+    return term_positions
+
+
+def excerpt(text, words=EXCERPT_WORDS):
+    """The first words of a text, split like tokenize() so word positions line up."""
+    return " ".join(text.split(maxsplit=words)[:words])
+
+
+def tokenize_page(page):
+    """Tokenize a (url, content) pair into (url, term_positions, excerpt); the unit of work for the indexer's process pool."""
+    url, content = page
+    return url, tokenize(content["page_text"]), excerpt(content["page_text"])
@@ -1,12 +1,36 @@
 import os
+import io
+import csv
 from dotenv import load_dotenv
 import psycopg2
 import psycopg2.extras
 import json
+from common.compression import BodyReader, PageCodec, text_hash, train_dictionary
+
+PAGE_STORAGE_MODES = ("jsonb", "zstd")
+
+
+def to_bigint(fingerprint):
+    """Store an unsigned 64-bit fingerprint in a signed BIGINT column."""
+    if fingerprint is None:
+        return None
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
 
 class Database:
     def __init__(self):
         load_dotenv()
+        # Bounds of the interval between two crawls of a page, see _update_fetch_states
+        self.recrawl_min_seconds = int(os.getenv('RECRAWL_MIN_SECONDS', 6 * 60 * 60))
+        self.recrawl_max_seconds = int(os.getenv('RECRAWL_MAX_SECONDS', 30 * 24 * 60 * 60))
+        # Weights of a queued URL's priority, see _merge_links
+        self.depth_weight = float(os.getenv('FRONTIER_DEPTH_WEIGHT', 1.0))
+        self.inlink_weight = float(os.getenv('FRONTIER_INLINK_WEIGHT', 1.0))
+        # Page text is kept as JSONB in pages.content, or zstd-compressed in page_bodies
+        self.page_storage = os.getenv('PAGE_STORAGE', 'jsonb')
+        self.compression_level = int(os.getenv('PAGE_COMPRESSION_LEVEL', 3))
+        if self.page_storage not in PAGE_STORAGE_MODES:
+            raise ValueError(f"PAGE_STORAGE must be one of {', '.join(PAGE_STORAGE_MODES)}, not {self.page_storage!r}")
         self.connection = self.get_connection(
             os.getenv('DB_NAME'),
             os.getenv('DB_HOST'),
@@ -15,6 +39,7 @@ class Database:
             os.getenv('DB_USER')
         )
         self.construct_schema()
+        self.codec = self.load_codec() if self.page_storage == 'zstd' else None
 
     def get_connection(self, db_name, db_host, db_password, db_port, db_user):
         """Establish a database connection."""
@@ -65,6 +90,36 @@ class Database:
                 CREATE INDEX IF NOT EXISTS idx_urls_crawled ON urls (crawled);
                 CREATE INDEX IF NOT EXISTS idx_urls_added_at ON urls (added_at);
 
+                -- Leases let many crawler processes share the queue without duplicate work
+                ALTER TABLE urls ADD COLUMN IF NOT EXISTS lease_owner TEXT;
+                ALTER TABLE urls ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP;
+
+                CREATE INDEX IF NOT EXISTS idx_urls_claimable ON urls (lease_expires_at) WHERE crawled = FALSE;
+
+                -- Fetch state for incremental recrawls: HTTP validators, a hash of the
+                -- last body and how often it changed, which schedules the next crawl
+                ALTER TABLE urls ADD COLUMN IF NOT EXISTS etag TEXT;
+                ALTER TABLE urls ADD COLUMN IF NOT EXISTS last_modified TEXT;
+                ALTER TABLE urls ADD COLUMN IF NOT EXISTS content_hash TEXT;
+                ALTER TABLE urls ADD COLUMN IF NOT EXISTS first_crawled_at TIMESTAMP;
+                ALTER TABLE urls ADD COLUMN IF NOT EXISTS last_crawled_at TIMESTAMP;
+                ALTER TABLE urls ADD COLUMN IF NOT EXISTS last_changed_at TIMESTAMP;
+                ALTER TABLE urls ADD COLUMN IF NOT EXISTS next_crawl_at TIMESTAMP;
+                ALTER TABLE urls ADD COLUMN IF NOT EXISTS check_count INTEGER NOT NULL DEFAULT 0;
+                ALTER TABLE urls ADD COLUMN IF NOT EXISTS change_count INTEGER NOT NULL DEFAULT 0;
+
+                CREATE INDEX IF NOT EXISTS idx_urls_recrawl ON urls (next_crawl_at NULLS FIRST) WHERE crawled = TRUE;
+
+                -- Frontier scheduling: URLs are claimed by priority, scored from how many
+                -- links away from a seed they were found and how many pages link to them
+                ALTER TABLE urls ADD COLUMN IF NOT EXISTS host TEXT
+                    GENERATED ALWAYS AS (lower(substring(url FROM '^[A-Za-z][A-Za-z0-9+.-]*://([^/?#]*)'))) STORED;
+                ALTER TABLE urls ADD COLUMN IF NOT EXISTS depth INTEGER NOT NULL DEFAULT 0;
+                ALTER TABLE urls ADD COLUMN IF NOT EXISTS inlinks INTEGER NOT NULL DEFAULT 0;
+                ALTER TABLE urls ADD COLUMN IF NOT EXISTS priority REAL NOT NULL DEFAULT 0;
+
+                CREATE INDEX IF NOT EXISTS idx_urls_frontier ON urls (priority DESC, added_at) WHERE crawled = FALSE;
+
                 CREATE TABLE IF NOT EXISTS pages (
                     url TEXT UNIQUE NOT NULL PRIMARY KEY CHECK (url <> ''),
                     metadata JSONB,
@@ -74,6 +129,28 @@ class Database:
                 );
 
                 CREATE INDEX IF NOT EXISTS idx_pages_added_at ON pages (added_at);
+
+                -- SimHash of the page text, reloaded at start-up for near-duplicate detection
+                ALTER TABLE pages ADD COLUMN IF NOT EXISTS simhash BIGINT;
+
+                -- Compressed page text, kept apart from the small metadata rows. Bodies are
+                -- stored out of line as they are, zstd output does not compress any further
+                CREATE TABLE IF NOT EXISTS compression_dictionaries (
+                    dictionary_id SERIAL PRIMARY KEY,
+                    codec TEXT NOT NULL,
+                    dictionary BYTEA NOT NULL,
+                    created_at TIMESTAMP DEFAULT NOW()
+                );
+
+                CREATE TABLE IF NOT EXISTS page_bodies (
+                    url TEXT PRIMARY KEY REFERENCES pages (url) ON DELETE CASCADE,
+                    codec TEXT NOT NULL,
+                    dictionary_id INTEGER REFERENCES compression_dictionaries (dictionary_id),
+                    text_hash BYTEA NOT NULL,
+                    body BYTEA NOT NULL
+                );
+
+                ALTER TABLE page_bodies ALTER COLUMN body SET STORAGE EXTERNAL;
                 """)
                 self.connection.commit()
         except Exception as error:
@@ -103,35 +180,471 @@ class Database:
         try:
             with self.connection.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
                 cursor.execute("""
-                SELECT url FROM urls WHERE crawled = FALSE LIMIT 1;
+                UPDATE urls SET crawled = TRUE
+                WHERE url = (
+                    SELECT url FROM urls
+                    WHERE crawled = FALSE
+                    AND (lease_expires_at IS NULL OR lease_expires_at < NOW())
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING url;
                 """)
                 row = cursor.fetchone()
-                if row:
-                    cursor.execute("""
-                    UPDATE urls SET crawled = TRUE WHERE url = %s;
-                    """, (row['url'],))
-                    self.connection.commit()
-                    return row['url']
-                return None
+                self.connection.commit()
+                return row['url'] if row else None
         except Exception as error:
             print(f"Error fetching next URL: {error}")
             self.connection.rollback()
             return None
 
+    def claim_urls(self, n, worker_id, lease_seconds=600, exclude_hosts=()):
+        """
+        Lease up to n uncrawled URLs to a worker in a single round-trip, highest priority first.
+
+        Rows locked by another worker are skipped rather than waited on, and
+        a lease that expires (e.g. its worker crashed) makes the URL claimable
+        again, so URLs are only marked crawled through complete_urls().
+        URLs of exclude_hosts are left for later, so a worker with plenty of
+        work queued for a host claims URLs of other hosts instead.
+        Returns (url, depth, priority) tuples.
+        """
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("""
+                WITH claimable AS (
+                    SELECT url FROM urls
+                    WHERE crawled = FALSE
+                    AND (lease_expires_at IS NULL OR lease_expires_at < NOW())
+                    AND (host IS NULL OR host <> ALL(%s))
+                    ORDER BY priority DESC, added_at
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                UPDATE urls
+                SET lease_owner = %s, lease_expires_at = NOW() + make_interval(secs => %s)
+                FROM claimable
+                WHERE urls.url = claimable.url
+                RETURNING urls.url, urls.depth, urls.priority;
+                """, (list(exclude_hosts), n, worker_id, lease_seconds))
+                rows = cursor.fetchall()
+                self.connection.commit()
+                return rows
+        except Exception as error:
+            print(f"Error claiming URLs: {error}")
+            self.connection.rollback()
+            return []
+
+    def claim_recrawl_urls(self, n, worker_id, lease_seconds=600):
+        """
+        Lease up to n crawled URLs that are due for a recrawl, most overdue first.
+
+        Returns (url, depth, etag, last_modified, content_hash) tuples so the
+        fetch can be made conditional on what was seen last time.
+        """
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("""
+                WITH claimable AS (
+                    SELECT url FROM urls
+                    WHERE crawled = TRUE
+                    AND (next_crawl_at IS NULL OR next_crawl_at <= NOW())
+                    AND (lease_expires_at IS NULL OR lease_expires_at < NOW())
+                    ORDER BY next_crawl_at NULLS FIRST
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                UPDATE urls
+                SET lease_owner = %s, lease_expires_at = NOW() + make_interval(secs => %s)
+                FROM claimable
+                WHERE urls.url = claimable.url
+                RETURNING urls.url, urls.depth, urls.etag, urls.last_modified, urls.content_hash;
+                """, (n, worker_id, lease_seconds))
+                rows = cursor.fetchall()
+                self.connection.commit()
+                return rows
+        except Exception as error:
+            print(f"Error claiming URLs to recrawl: {error}")
+            self.connection.rollback()
+            return []
+
+    def complete_urls(self, urls):
+        """Mark leased URLs as crawled and drop their leases."""
+        if not urls:
+            return
+        try:
+            with self.connection.cursor() as cursor:
+                self._complete_urls(cursor, urls)
+                self.connection.commit()
+        except Exception as error:
+            print(f"Error completing URLs: {error}")
+            self.connection.rollback()
+
+    def _complete_urls(self, cursor, urls):
+        # A URL whose fetch state is not recorded (e.g. the fetch failed) is retried after the minimum interval
+        cursor.execute("""
+        UPDATE urls SET
+            crawled = TRUE, lease_owner = NULL, lease_expires_at = NULL,
+            next_crawl_at = GREATEST(next_crawl_at, NOW() + make_interval(secs => %s))
+        WHERE url = ANY(%s);
+        """, (self.recrawl_min_seconds, list(urls)))
+
+    def update_fetch_states(self, fetch_states):
+        """Record the outcome of fetching a batch of URLs, see _update_fetch_states."""
+        if not fetch_states:
+            return
+        try:
+            with self.connection.cursor() as cursor:
+                self._update_fetch_states(cursor, fetch_states)
+                self.connection.commit()
+        except Exception as error:
+            print(f"Error updating fetch states: {error}")
+            self.connection.rollback()
+
+    def _update_fetch_states(self, cursor, fetch_states):
+        """
+        Store (url, etag, last_modified, content_hash, changed) fetch outcomes.
+
+        The next crawl is scheduled after the mean time between observed
+        changes, i.e. the time since the first crawl divided by the number of
+        changes plus one, clamped to the recrawl interval bounds. A page that
+        never changes is revisited less and less often, one that changes on
+        every visit about every recrawl_min_seconds.
+        """
+        psycopg2.extras.execute_values(
+            cursor,
+            """
+            UPDATE urls SET
+                etag = new.etag,
+                last_modified = new.last_modified,
+                content_hash = new.content_hash,
+                check_count = urls.check_count + 1,
+                change_count = urls.change_count + new.changed::int,
+                first_crawled_at = COALESCE(urls.first_crawled_at, NOW()),
+                last_crawled_at = NOW(),
+                last_changed_at = CASE WHEN new.changed THEN NOW() ELSE urls.last_changed_at END,
+                next_crawl_at = NOW() + LEAST(GREATEST(
+                    (NOW() - COALESCE(urls.first_crawled_at, NOW())) / (urls.change_count + new.changed::int + 1),
+                    make_interval(secs => %s)
+                ), make_interval(secs => %s))
+            FROM (VALUES %%s) AS new (url, etag, last_modified, content_hash, changed)
+            WHERE urls.url = new.url;
+            """ % (self.recrawl_min_seconds, self.recrawl_max_seconds),
+            fetch_states,
+            template="(%s, %s, %s, %s, %s::boolean)",
+            page_size=1000,
+        )
+
+    def release_urls(self, worker_id):
+        """Hand back every URL still leased to a worker so others can claim it."""
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("""
+                UPDATE urls SET lease_owner = NULL, lease_expires_at = NULL
+                WHERE lease_owner = %s;
+                """, (worker_id,))
+                self.connection.commit()
+        except Exception as error:
+            print(f"Error releasing URLs: {error}")
+            self.connection.rollback()
+
     def insert_page(self, url, page_data):
         """Insert crawled page data into the database."""
         try:
             with self.connection.cursor() as cursor:
+                if self.codec:
+                    self._merge_pages(cursor, [(url, page_data)])
+                    self.connection.commit()
+                    return
                 cursor.execute("""
-                INSERT INTO pages (url, metadata, content) 
-                VALUES (%s, %s, %s)
-                ON CONFLICT (url) DO NOTHING;
-                """, (url, json.dumps(page_data['page_metadata']), json.dumps(page_data['page_content'])))
+                INSERT INTO pages (url, metadata, content, simhash) 
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (url) DO UPDATE
+                SET metadata = EXCLUDED.metadata, content = EXCLUDED.content, simhash = EXCLUDED.simhash, indexed = FALSE
+                WHERE pages.content IS DISTINCT FROM EXCLUDED.content;
+                """, (url, json.dumps(page_data['page_metadata']), json.dumps(page_data['page_content']), to_bigint(page_data.get('fingerprint'))))
                 self.connection.commit()
         except Exception as error:
             print(f"Error inserting page: {error}")
             self.connection.rollback()
 
+    def get_page_fingerprints(self):
+        """Yield the (url, simhash) of every stored page, streamed through a server-side cursor."""
+        try:
+            with self.connection.cursor(name="page_fingerprints") as cursor:
+                cursor.itersize = 10000
+                cursor.execute("SELECT url, simhash FROM pages WHERE simhash IS NOT NULL;")
+                for url, fingerprint in cursor:
+                    yield url, fingerprint & 0xFFFFFFFFFFFFFFFF
+            self.connection.commit()
+        except Exception as error:
+            print(f"Error loading page fingerprints: {error}")
+            self.connection.rollback()
+
+    def iter_urls(self, batch_size=10000):
+        """Yield every queued URL in lists of batch_size, streamed through a server-side cursor."""
+        try:
+            with self.connection.cursor(name="queued_urls") as cursor:
+                cursor.itersize = batch_size
+                cursor.execute("SELECT url FROM urls;")
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield [url for url, in rows]
+            self.connection.commit()
+        except Exception as error:
+            print(f"Error loading queued URLs: {error}")
+            self.connection.rollback()
+
+    def _copy_rows(self, cursor, table, columns, rows):
+        """Stream rows into a table with COPY instead of one INSERT per row."""
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+    def write_batch(self, pages, links, completed_urls, fetch_states=()):
+        """
+        Write a buffered batch of crawler output in a single transaction.
+
+        Pages and links are copied into session-local staging tables and merged
+        with one INSERT each; completed URLs are only marked crawled in the same
+        commit, so a crash never loses a page whose URL was already retired.
+        A page whose content changed since it was stored is replaced and
+        flagged for re-indexing. Returns False if the batch was rolled back.
+        """
+        try:
+            with self.connection.cursor() as cursor:
+                if pages:
+                    self._merge_pages(cursor, pages)
+
+                if links:
+                    self._merge_links(cursor, links)
+
+                if completed_urls:
+                    self._complete_urls(cursor, completed_urls)
+
+                if fetch_states:
+                    self._update_fetch_states(cursor, fetch_states)
+
+                self.connection.commit()
+                return True
+        except Exception as error:
+            print(f"Error writing batch: {error}")
+            self.connection.rollback()
+            return False
+
+    def _merge_pages(self, cursor, pages):
+        """
+        Store (url, page_data) pages, replacing the stored ones whose text changed.
+
+        A replaced page is flagged for re-indexing. With compressed storage the
+        text goes to page_bodies and pages.content is left NULL; a body is
+        only rewritten when the hash of its text differs, so pages compressed
+        with an older dictionary are not re-indexed for it.
+        """
+        cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS pages_staging (url TEXT, metadata JSONB, content JSONB, simhash BIGINT) ON COMMIT DELETE ROWS;
+        """)
+
+        if not self.codec:
+            self._copy_rows(cursor, "pages_staging", ("url", "metadata", "content", "simhash"), [
+                (url, json.dumps(page_data['page_metadata']), json.dumps(page_data['page_content']), to_bigint(page_data.get('fingerprint')))
+                for url, page_data in pages
+            ])
+            cursor.execute("""
+            INSERT INTO pages (url, metadata, content, simhash)
+            SELECT DISTINCT ON (url) url, metadata, content, simhash FROM pages_staging
+            ORDER BY url
+            ON CONFLICT (url) DO UPDATE
+            SET metadata = EXCLUDED.metadata, content = EXCLUDED.content, simhash = EXCLUDED.simhash, indexed = FALSE
+            WHERE pages.content IS DISTINCT FROM EXCLUDED.content;
+            """)
+            return
+
+        cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS page_bodies_staging (url TEXT, codec TEXT, dictionary_id INTEGER, text_hash BYTEA, body BYTEA) ON COMMIT DELETE ROWS;
+        """)
+        self._copy_rows(cursor, "pages_staging", ("url", "metadata", "simhash"), [
+            (url, json.dumps(page_data['page_metadata']), to_bigint(page_data.get('fingerprint')))
+            for url, page_data in pages
+        ])
+        self._copy_rows(cursor, "page_bodies_staging", ("url", "codec", "dictionary_id", "text_hash", "body"), [
+            (url, *self._compress_row(page_data['page_content']['page_text']))
+            for url, page_data in pages
+        ])
+        cursor.execute("""
+        INSERT INTO pages (url, metadata, simhash)
+        SELECT DISTINCT ON (url) url, metadata, simhash FROM pages_staging
+        ORDER BY url
+        ON CONFLICT (url) DO NOTHING;
+
+        WITH changed AS (
+            INSERT INTO page_bodies (url, codec, dictionary_id, text_hash, body)
+            SELECT DISTINCT ON (url) url, codec, dictionary_id, text_hash, body FROM page_bodies_staging
+            ORDER BY url
+            ON CONFLICT (url) DO UPDATE
+            SET codec = EXCLUDED.codec, dictionary_id = EXCLUDED.dictionary_id, text_hash = EXCLUDED.text_hash, body = EXCLUDED.body
+            WHERE page_bodies.text_hash IS DISTINCT FROM EXCLUDED.text_hash
+            RETURNING url
+        )
+        UPDATE pages SET metadata = staged.metadata, content = NULL, simhash = staged.simhash, indexed = FALSE
+        FROM (SELECT DISTINCT ON (url) url, metadata, simhash FROM pages_staging ORDER BY url) AS staged
+        WHERE pages.url = staged.url AND staged.url IN (SELECT url FROM changed);
+        """)
+
+    def _compress_row(self, text):
+        """The (codec, dictionary_id, text_hash, body) of a page text, with bytes in COPY's hex form."""
+        return (
+            self.codec.name, self.codec.dictionary_id,
+            "\\x" + text_hash(text).hex(), "\\x" + self.codec.compress(text).hex(),
+        )
+
+    def load_codec(self):
+        """A compressor using the most recently trained dictionary, if any."""
+        with self.connection.cursor() as cursor:
+            cursor.execute("""
+            SELECT dictionary_id, dictionary FROM compression_dictionaries
+            WHERE codec = %s
+            ORDER BY dictionary_id DESC
+            LIMIT 1;
+            """, (PageCodec.name,))
+            row = cursor.fetchone()
+        self.connection.commit()
+        if row is None:
+            return PageCodec(self.compression_level)
+        return PageCodec(self.compression_level, bytes(row[1]), row[0])
+
+    def load_dictionary(self, dictionary_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT dictionary FROM compression_dictionaries WHERE dictionary_id = %s;", (dictionary_id,))
+            dictionary, = cursor.fetchone()
+        return bytes(dictionary)
+
+    def train_page_dictionary(self, samples=2000):
+        """
+        Train a shared zstd dictionary on a random sample of stored pages.
+
+        New bodies are compressed with it from then on; bodies compressed
+        with an earlier dictionary keep it and stay readable.
+        """
+        try:
+            reader = BodyReader(self.load_dictionary)
+            with self.connection.cursor() as cursor:
+                cursor.execute("""
+                SELECT p.content->>'page_text', b.codec, b.dictionary_id, b.body
+                FROM pages p LEFT JOIN page_bodies b ON b.url = p.url
+                WHERE p.content IS NOT NULL OR b.body IS NOT NULL
+                ORDER BY random()
+                LIMIT %s;
+                """, (samples,))
+                texts = [reader.page_text(*row) for row in cursor.fetchall()]
+                if not texts:
+                    print("No stored pages to train a dictionary on.")
+                    self.connection.rollback()
+                    return None
+
+                cursor.execute("""
+                INSERT INTO compression_dictionaries (codec, dictionary) VALUES (%s, %s)
+                RETURNING dictionary_id;
+                """, (PageCodec.name, psycopg2.Binary(train_dictionary(texts))))
+                dictionary_id, = cursor.fetchone()
+                self.connection.commit()
+        except Exception as error:
+            print(f"Error training a compression dictionary: {error}")
+            self.connection.rollback()
+            return None
+
+        self.codec = self.load_codec()
+        print(f"Trained compression dictionary {dictionary_id} on {len(texts)} pages.")
+        return dictionary_id
+
+    def compress_stored_pages(self, batch_size=500):
+        """
+        Move the page text still stored as JSONB in pages.content into page_bodies.
+
+        Every batch of batch_size pages is committed on its own, so the
+        migration can be stopped and resumed. The text does not change, so
+        the pages are not re-indexed. The space of the old JSONB values is
+        only returned to the system by a VACUUM FULL of pages.
+        """
+        codec = self.codec or self.load_codec()
+        moved = 0
+        last_url = ""
+        while True:
+            try:
+                with self.connection.cursor() as cursor:
+                    cursor.execute("""
+                    SELECT url, COALESCE(content->>'page_text', '') FROM pages
+                    WHERE content IS NOT NULL AND url > %s
+                    ORDER BY url
+                    LIMIT %s;
+                    """, (last_url, batch_size))
+                    rows = cursor.fetchall()
+                    if not rows:
+                        self.connection.commit()
+                        break
+
+                    psycopg2.extras.execute_values(cursor, """
+                    INSERT INTO page_bodies (url, codec, dictionary_id, text_hash, body) VALUES %s
+                    ON CONFLICT (url) DO UPDATE
+                    SET codec = EXCLUDED.codec, dictionary_id = EXCLUDED.dictionary_id, text_hash = EXCLUDED.text_hash, body = EXCLUDED.body;
+                    """, [
+                        (url, codec.name, codec.dictionary_id, psycopg2.Binary(text_hash(text)), psycopg2.Binary(codec.compress(text)))
+                        for url, text in rows
+                    ])
+                    cursor.execute("UPDATE pages SET content = NULL WHERE url = ANY(%s);", ([url for url, _ in rows],))
+                    self.connection.commit()
+            except Exception as error:
+                print(f"Error compressing stored pages: {error}")
+                self.connection.rollback()
+                return moved
+
+            moved += len(rows)
+            last_url = rows[-1][0]
+            print(f"Compressed {moved} pages...")
+        return moved
+
+    def _merge_links(self, cursor, links):
+        """
+        Queue (url, depth) links found on crawled pages.
+
+        Every link to a queued URL counts as an inlink and keeps the smallest
+        depth it was found at. Its priority is
+        inlink_weight * ln(1 + inlinks) - depth_weight * depth, so pages
+        close to the seeds and pages many others link to are crawled first.
+        """
+        cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS links_staging (url TEXT, depth INTEGER) ON COMMIT DELETE ROWS;
+        """)
+        self._copy_rows(cursor, "links_staging", ("url", "depth"), links)
+        cursor.execute("""
+        INSERT INTO urls (url, depth, inlinks, priority)
+        SELECT url, MIN(depth), COUNT(*), %(inlink_weight)s * LN(1 + COUNT(*)) - %(depth_weight)s * MIN(depth)
+        FROM links_staging
+        WHERE url <> ''
+        GROUP BY url
+        ON CONFLICT (url) DO UPDATE SET
+            depth = LEAST(urls.depth, EXCLUDED.depth),
+            inlinks = urls.inlinks + EXCLUDED.inlinks,
+            priority = %(inlink_weight)s * LN(1 + urls.inlinks + EXCLUDED.inlinks)
+                - %(depth_weight)s * LEAST(urls.depth, EXCLUDED.depth)
+        WHERE urls.crawled = FALSE;
+        """, {"inlink_weight": self.inlink_weight, "depth_weight": self.depth_weight})
+
+    def insert_links(self, links):
+        """Queue (url, depth) links found on crawled pages, see _merge_links."""
+        if not links:
+            return
+        try:
+            with self.connection.cursor() as cursor:
+                self._merge_links(cursor, links)
+                self.connection.commit()
+        except Exception as error:
+            print(f"Error inserting links: {error}")
+            self.connection.rollback()
+
     def insert_outbound_links(self, links):
         """Insert outbound links into the URL queue."""
         self.insert_url(links)
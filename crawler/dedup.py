@@ -0,0 +1,86 @@
+import hashlib
+import numpy as np
+
+
+def simhash(text, shingle_size=3):
+    """
+    64-bit SimHash of the word shingles of a text.
+
+    Every distinct shingle votes on each bit with its own 64-bit hash; a bit
+    is set when most shingles have it set. Texts sharing most of their
+    shingles end up a few bits apart.
+    """
+    words = text.lower().split()
+    shingles = {" ".join(words[i:i + shingle_size]) for i in range(max(len(words) - shingle_size + 1, 1))}
+
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "little") for shingle in shingles),
+        dtype="<u8",
+        count=len(shingles),
+    )
+    votes = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little").sum(axis=0)
+    return int.from_bytes(np.packbits(votes * 2 > len(hashes), bitorder="little").tobytes(), "little")
+
+
+class NearDuplicateIndex:
+    """
+    Banded LSH over SimHash fingerprints.
+
+    Two fingerprints at most max_distance bits apart are near-duplicates.
+    The 64 bits are cut into max_distance + 1 bands, so such a pair agrees
+    exactly on at least one band: a lookup only compares the fingerprints
+    sharing one of its bands, a handful per page instead of the whole index.
+    """
+
+    def __init__(self, max_distance=3):
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        widths = [64 // bands + (1 if band < 64 % bands else 0) for band in range(bands)]
+        self.bands = [(sum(widths[:band]), (1 << width) - 1) for band, width in enumerate(widths)]
+        self.tables = [{} for _ in self.bands]  # band value -> entry ids
+
+        self.urls = []  # entry id -> url, None once the entry was replaced
+        self.fingerprints = []
+        self.entries = {}  # url -> entry id
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _band_keys(self, fingerprint):
+        return [(fingerprint >> shift) & mask for shift, mask in self.bands]
+
+    def find(self, fingerprint, url=None):
+        """The URL of an indexed near-duplicate of fingerprint other than url itself, or None."""
+        for table, key in zip(self.tables, self._band_keys(fingerprint)):
+            for entry in table.get(key, ()):
+                other_url = self.urls[entry]
+                if other_url is None or other_url == url:
+                    continue
+                if bin(self.fingerprints[entry] ^ fingerprint).count("1") <= self.max_distance:
+                    return other_url
+        return None
+
+    def add(self, url, fingerprint):
+        """Index the fingerprint of url, replacing any previous one."""
+        previous = self.entries.get(url)
+        if previous is not None:
+            self.urls[previous] = None
+
+        entry = len(self.urls)
+        self.urls.append(url)
+        self.fingerprints.append(fingerprint)
+        self.entries[url] = entry
+        for table, key in zip(self.tables, self._band_keys(fingerprint)):
+            table.setdefault(key, []).append(entry)
+
+    def check(self, url, fingerprint):
+        """
+        Return the URL url is a near-duplicate of, or index it and return None.
+
+        A page stays indexed under the URL it was first seen at, so the
+        duplicates of a page cluster on that URL.
+        """
+        duplicate_of = self.find(fingerprint, url)
+        if duplicate_of is None:
+            self.add(url, fingerprint)
+        return duplicate_of
@@ -0,0 +1,346 @@
+import re
+import string
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlparse, urlsplit, urlunsplit
+from bs4 import BeautifulSoup
+from bs4.builder import HTMLTreeBuilder
+from bs4.dammit import EntitySubstitution, UnicodeDammit
+from dedup import simhash
+
+# Characters parse_page() turns into spaces in the page text
+TEXT_SEPARATORS = str.maketrans({character: " " for character in "\n\r\t()[]{}"})
+
+# Query parameters that only record where a click came from, see canonicalize_url()
+TRACKING_PARAMETERS = frozenset(["gclid", "dclid", "fbclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid", "_ga", "_gl"])
+TRACKING_PREFIXES = ("utm_",)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+UNRESERVED_CHARACTERS = frozenset(string.ascii_letters + string.digits + "-._~")
+PERCENT_ESCAPE = re.compile(r"%([0-9A-Fa-f]{2})")
+
+
+def normalize_escapes(component):
+    """Decode percent escapes of unreserved characters and uppercase the others."""
+    def replace(match):
+        character = chr(int(match.group(1), 16))
+        return character if character in UNRESERVED_CHARACTERS else match.group(0).upper()
+    return PERCENT_ESCAPE.sub(replace, component)
+
+
+def is_tracking_parameter(name):
+    name = name.lower()
+    return name in TRACKING_PARAMETERS or name.startswith(TRACKING_PREFIXES)
+
+
+def canonicalize_url(url):
+    """
+    Rewrite an absolute URL into the one form it is queued under.
+
+    The scheme and host are lowercased and a default port dropped, percent
+    escapes normalized, the fragment, tracking parameters and a trailing
+    slash removed and the remaining query parameters sorted. The path keeps
+    its case, which is significant (e.g. for Wikipedia titles). Raises
+    ValueError for a malformed URL.
+    """
+    parsed_url = urlsplit(url)
+    scheme = parsed_url.scheme.lower()
+
+    host = parsed_url.hostname or ""
+    if ":" in host:
+        host = f"[{host}]"
+    port = parsed_url.port
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{port}"
+    userinfo, _, _ = parsed_url.netloc.rpartition("@")
+    netloc = f"{userinfo}@{host}" if userinfo else host
+
+    path = normalize_escapes(parsed_url.path) or "/"
+    if len(path) > 1 and path.endswith("/"):
+        path = path.rstrip("/") or "/"
+
+    parameters = sorted(
+        normalize_escapes(parameter) for parameter in parsed_url.query.split("&")
+        if parameter and not is_tracking_parameter(parameter.split("=", 1)[0])
+    )
+    return urlunsplit((scheme, netloc, path, "&".join(parameters), ""))
+
+
+def build_page(canonical_url, page_title, page_description, page_text):
+    """Normalize extracted fields into the page dict stored by the crawler."""
+    page_content = page_text.strip().translate(TEXT_SEPARATORS).replace("  ", " ")
+
+    page_description = page_description["content"] if page_description else page_content[:200]
+
+    return {
+        "page_metadata": {
+            "canonical_url": canonical_url,
+            "page_title": page_title,
+            "page_description": " ".join([word for word in page_description.split(" ") if word.strip()][:200]),
+        },
+        "page_content": {
+            "page_text": page_content,
+        }
+    }
+
+
+def parse_page(soup, canonical_url):
+    """Extract page metadata and content."""
+    page_title = soup.title.string if soup.title else "No title"
+    page_description = soup.find("meta", property="og:description")
+    return build_page(canonical_url, page_title, page_description, soup.get_text())
+
+
+def filter_links(hrefs, base_url, disallowed_extensions):
+    """
+    Normalize raw href values into crawlable, canonical absolute links.
+
+    Returns the list of links and the number of links that were skipped.
+    """
+    links = set()
+    skipped = 0
+    disallowed_extensions = tuple(disallowed_extensions)
+
+    for href in hrefs:
+        if not href or href.startswith('#'):
+            continue
+
+        # Normalize relative URLs
+        full_url = urljoin(base_url, href)
+
+        # Skip URLs with disallowed extensions
+        if full_url.lower().endswith(disallowed_extensions):
+            skipped += 1
+            continue
+
+        # Validate URL structure
+        parsed_url = urlparse(full_url)
+        if parsed_url.scheme not in ('http', 'https'):
+            skipped += 1
+            continue
+
+        try:
+            links.add(canonicalize_url(full_url))
+        except ValueError:
+            skipped += 1
+
+    return list(links), skipped
+
+
+def extract_outbound_links(soup, base_url, disallowed_extensions):
+    """
+    Extract and normalize outbound links from a page.
+
+    Returns the list of links and the number of links that were skipped.
+    """
+    return filter_links((link.get('href') for link in soup.find_all('a', href=True)), base_url, disallowed_extensions)
+
+
+class StreamingExtractor(HTMLParser):
+    """
+    Single-pass extraction of the title, og:description, text and links of a page.
+
+    Sees the same events as BeautifulSoup's html.parser builder and applies
+    the same rules to them (entity decoding, whitespace-only strings, void
+    and unmatched tags, script/style/template text), but keeps only the
+    fields parse_page() and extract_outbound_links() read instead of
+    building a tree, so the results are identical.
+    """
+
+    EMPTY_ELEMENT_TAGS = HTMLTreeBuilder.DEFAULT_EMPTY_ELEMENT_TAGS
+    PRESERVE_WHITESPACE_TAGS = HTMLTreeBuilder.DEFAULT_PRESERVE_WHITESPACE_TAGS
+    STRING_CONTAINER_TAGS = frozenset(HTMLTreeBuilder.DEFAULT_STRING_CONTAINERS)
+    NOT_ASCII_SPACE = re.compile("[^\x20\x0a\x09\x0c\x0d]")
+    DECIMAL_REFERENCE = re.compile("^([0-9]+)(.*)")
+    HEX_REFERENCE = re.compile("^([0-9a-f]+)(.*)")
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.text = []
+        self.hrefs = []
+        self.description = None
+        self.title = None  # [children] of the first <title>, a child is a string or a nested list
+
+        self.current_data = []
+        self.stack = []  # Open tag names
+        self.open_tags = {}
+        self.preserve_whitespace = 0
+        self.string_containers = 0
+        self.already_closed_empty_element = []
+        self.title_nodes = []  # Open elements of the first <title>, while it is open
+
+    def result(self):
+        """Return the page title, og:description attributes, text and raw hrefs."""
+        self.close()
+        self._end_data()
+        return self._title_string(), self.description, "".join(self.text), self.hrefs
+
+    def _title_string(self):
+        if self.title is None:
+            return "No title"
+        children = self.title
+        while len(children) == 1:
+            if isinstance(children[0], str):
+                return children[0]
+            children = children[0]
+        return None
+
+    def _end_data(self, kind=None):
+        if not self.current_data:
+            return
+        data = "".join(self.current_data)
+        self.current_data = []
+
+        # Strings of nothing but ASCII whitespace collapse to one newline or space
+        if not self.preserve_whitespace and not self.NOT_ASCII_SPACE.search(data):
+            data = "\n" if "\n" in data else " "
+
+        if kind == "cdata" or (kind is None and not self.string_containers):
+            self.text.append(data)
+        if self.title_nodes:
+            self.title_nodes[-1].append(data)
+
+    def _push(self, tag):
+        if self.title_nodes:
+            node = []
+            self.title_nodes[-1].append(node)
+            self.title_nodes.append(node)
+        elif tag == "title" and self.title is None:
+            self.title = []
+            self.title_nodes.append(self.title)
+
+        self.stack.append(tag)
+        self.open_tags[tag] = self.open_tags.get(tag, 0) + 1
+        if tag in self.PRESERVE_WHITESPACE_TAGS:
+            self.preserve_whitespace += 1
+        if tag in self.STRING_CONTAINER_TAGS:
+            self.string_containers += 1
+
+    def _pop(self):
+        tag = self.stack.pop()
+        self.open_tags[tag] -= 1
+        if tag in self.PRESERVE_WHITESPACE_TAGS:
+            self.preserve_whitespace -= 1
+        if tag in self.STRING_CONTAINER_TAGS:
+            self.string_containers -= 1
+        if self.title_nodes:
+            self.title_nodes.pop()
+        return tag
+
+    def handle_starttag(self, tag, attrs, handle_empty_element=True):
+        attributes = {}
+        for key, value in attrs:
+            attributes[key] = "" if value is None else value
+
+        self._end_data()
+        if tag == "a" and "href" in attributes:
+            self.hrefs.append(attributes["href"])
+        elif tag == "meta" and self.description is None and attributes.get("property") == "og:description":
+            self.description = attributes
+        self._push(tag)
+
+        if handle_empty_element and tag in self.EMPTY_ELEMENT_TAGS:
+            self.handle_endtag(tag, check_already_closed=False)
+            self.already_closed_empty_element.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, handle_empty_element=False)
+        self.handle_endtag(tag, check_already_closed=False)
+
+    def handle_endtag(self, tag, check_already_closed=True):
+        if check_already_closed and tag in self.already_closed_empty_element:
+            self.already_closed_empty_element.remove(tag)
+            return
+
+        self._end_data()
+        # An end tag without a matching open tag is ignored
+        if self.open_tags.get(tag):
+            while self._pop() != tag:
+                pass
+
+    def handle_data(self, data):
+        self.current_data.append(data)
+
+    def handle_charref(self, name):
+        reference = self.DECIMAL_REFERENCE
+        base = 10
+        if name.startswith(("x", "X")):
+            name = name[1:]
+            reference = self.HEX_REFERENCE
+            base = 16
+
+        # Digits followed by other data are a reference missing its semicolon
+        number, extra_data = None, ""
+        try:
+            number = int(name, base)
+        except ValueError:
+            match = reference.search(name)
+            if match is not None:
+                number, extra_data = int(match.group(1), base), match.group(2)
+            else:
+                extra_data = name
+
+        self.handle_data(UnicodeDammit.numeric_character_reference(number)[0] if number is not None else "")
+        self.handle_data(extra_data)
+
+    def handle_entityref(self, name):
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self.handle_data(character if character is not None else "&%s" % name)
+
+    def _handle_string(self, data, kind):
+        self._end_data()
+        self.handle_data(data)
+        self._end_data(kind)
+
+    def handle_comment(self, data):
+        self._handle_string(data, "comment")
+
+    def handle_decl(self, decl):
+        self._handle_string(decl[len("DOCTYPE "):], "doctype")
+
+    def unknown_decl(self, data):
+        if data.upper().startswith("CDATA["):
+            self._handle_string(data[len("CDATA["):], "cdata")
+        else:
+            self._handle_string(data, "declaration")
+
+    def handle_pi(self, data):
+        self._handle_string(data, "pi")
+
+
+def parse_document_streaming(content, canonical_url, base_url, disallowed_extensions):
+    """Streaming counterpart of parse_document_bs4(), with the same output."""
+    if isinstance(content, bytes):
+        content = UnicodeDammit(content, known_definite_encodings=[], user_encodings=[], is_html=True).unicode_markup
+
+    extractor = StreamingExtractor()
+    extractor.feed(content)
+    page_title, page_description, page_text, hrefs = extractor.result()
+
+    links, skipped = filter_links(hrefs, base_url, disallowed_extensions)
+    return build_page(canonical_url, page_title, page_description, page_text), links, skipped
+
+
+def parse_document_bs4(content, canonical_url, base_url, disallowed_extensions):
+    """Parse a document through a full BeautifulSoup tree."""
+    soup = BeautifulSoup(content, 'html.parser')
+    links, skipped = extract_outbound_links(soup, base_url, disallowed_extensions)
+    return parse_page(soup, canonical_url), links, skipped
+
+
+EXTRACTORS = {
+    "bs4": parse_document_bs4,
+    "streaming": parse_document_streaming,
+}
+
+
+def parse_document(content, canonical_url, base_url, disallowed_extensions, extractor="streaming"):
+    """
+    Parse a raw HTML document into the page dict, with its SimHash
+    fingerprint, and its outbound links.
+
+    Kept at module level so it can be shipped to a process pool.
+    """
+    parsed_page, links, skipped = EXTRACTORS[extractor](content, canonical_url, base_url, disallowed_extensions)
+    # Fingerprinted here so the hashing also runs in the worker process
+    parsed_page["fingerprint"] = simhash(parsed_page["page_content"]["page_text"])
+    return parsed_page, links, skipped
@@ -0,0 +1,210 @@
+import heapq
+import itertools
+import time
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+
+def host_of(url):
+    """The politeness key of a URL: its lowercased network location."""
+    return urlparse(url).netloc.lower()
+
+
+class HostQueue:
+    """The URLs of one host waiting to be crawled, best first, and its politeness state."""
+
+    __slots__ = ("urls", "active", "next_allowed", "state", "token")
+
+    def __init__(self):
+        self.urls = []  # (-priority, sequence, url) heap
+        self.active = 0
+        self.next_allowed = 0.0
+        self.state = None  # "ready", "sleeping" or None when the host is on neither heap
+        self.token = None  # renewed on every reschedule, heap entries with another token are stale
+
+
+class Frontier:
+    """
+    In-process scheduler over the URLs a crawler leased from the shared queue.
+
+    URLs are kept in one priority queue per host. A host is handed out at
+    most host_concurrency URLs at a time and at most one every host_delay
+    seconds (or its robots.txt Crawl-delay, see set_delay). Among the hosts
+    allowed to go, the one with the best waiting URL goes first, so a single
+    busy host never holds up the others.
+    """
+
+    def __init__(self, host_concurrency=2, host_delay=1.0, clock=time.monotonic):
+        self.host_concurrency = host_concurrency
+        self.host_delay = host_delay
+        self.clock = clock
+
+        self.hosts = {}
+        self.delays = {}  # host -> delay overriding host_delay
+        self.ready = []  # (-priority, sequence, host, token) of hosts that may go now
+        self.sleeping = []  # (next_allowed, sequence, host, token) of hosts waiting out their delay
+        self.cooling = []  # (next_allowed, sequence, host, token) of idle hosts, forgotten once their delay ends
+        self.sequence = itertools.count()
+        self.size = 0
+        self.in_flight = 0  # URLs handed out and not done yet
+
+    def __len__(self):
+        return self.size
+
+    def set_delay(self, host, delay):
+        """Space the requests to a host delay seconds apart, e.g. as its robots.txt asks."""
+        self.delays[host] = delay
+
+    def add(self, url, priority=0.0):
+        """Queue a URL; higher priorities are crawled first, equal ones in the order they were added."""
+        host = host_of(url)
+        queue = self.hosts.get(host)
+        if queue is None:
+            queue = self.hosts[host] = HostQueue()
+
+        entry = (-priority, next(self.sequence), url)
+        heapq.heappush(queue.urls, entry)
+        self.size += 1
+
+        if queue.state is None or (queue.state == "ready" and queue.urls[0] is entry):
+            self._schedule(host, queue, self.clock())
+
+    def _schedule(self, host, queue, now):
+        """Put a host on the heap matching its state, or on none if it has nothing to hand out."""
+        queue.token = next(self.sequence)
+        if not queue.urls and not queue.active:
+            queue.state = None
+            if queue.next_allowed > now:
+                # Forgetting the host now would let its next URL skip the delay
+                heapq.heappush(self.cooling, (queue.next_allowed, next(self.sequence), host, queue.token))
+            else:
+                del self.hosts[host]
+        elif not queue.urls or queue.active >= self.host_concurrency:
+            queue.state = None
+        elif queue.next_allowed > now:
+            queue.state = "sleeping"
+            heapq.heappush(self.sleeping, (queue.next_allowed, next(self.sequence), host, queue.token))
+        else:
+            queue.state = "ready"
+            priority, sequence, _ = queue.urls[0]
+            heapq.heappush(self.ready, (priority, sequence, host, queue.token))
+
+    def next_url(self):
+        """The best URL that may be crawled right now, or None; report it back with done()."""
+        now = self.clock()
+        while self.cooling and self.cooling[0][0] <= now:
+            _, _, host, token = heapq.heappop(self.cooling)
+            queue = self.hosts.get(host)
+            if queue is not None and token == queue.token:
+                del self.hosts[host]
+
+        while self.sleeping and self.sleeping[0][0] <= now:
+            _, _, host, token = heapq.heappop(self.sleeping)
+            queue = self.hosts.get(host)
+            if queue is not None and token == queue.token:
+                self._schedule(host, queue, now)
+
+        while self.ready:
+            _, _, host, token = heapq.heappop(self.ready)
+            queue = self.hosts.get(host)
+            if queue is None or token != queue.token:
+                continue
+
+            _, _, url = heapq.heappop(queue.urls)
+            self.size -= 1
+            self.in_flight += 1
+            queue.active += 1
+            queue.next_allowed = now + self.delays.get(host, self.host_delay)
+            self._schedule(host, queue, now)
+            return url
+        return None
+
+    def wait_time(self):
+        """Seconds until a waiting host may go again, None if every queued host is busy or nothing is queued."""
+        while self.sleeping:
+            next_allowed, _, host, token = self.sleeping[0]
+            queue = self.hosts.get(host)
+            if queue is not None and token == queue.token:
+                return max(next_allowed - self.clock(), 0.0)
+            heapq.heappop(self.sleeping)
+        return None
+
+    def done(self, url):
+        """Free the slot a URL handed out by next_url() held on its host."""
+        host = host_of(url)
+        queue = self.hosts.get(host)
+        if queue is None:
+            return
+        queue.active -= 1
+        self.in_flight -= 1
+        if queue.state is None:
+            self._schedule(host, queue, self.clock())
+
+    def saturated_hosts(self, limit):
+        """Hosts with at least limit URLs queued, which need no more URLs for now."""
+        return [host for host, queue in self.hosts.items() if len(queue.urls) >= limit]
+
+    def clear(self):
+        self.hosts.clear()
+        self.ready.clear()
+        self.sleeping.clear()
+        self.cooling.clear()
+        self.size = 0
+        self.in_flight = 0
+
+
+class RobotsCache:
+    """
+    Parsed robots.txt rules per origin, kept for ttl seconds.
+
+    Following RFC 9309, a missing robots.txt (any 4xx) allows everything and
+    an unreachable one (5xx or a network error) disallows everything; the
+    latter is only trusted for error_ttl seconds before it is fetched again.
+    """
+
+    def __init__(self, user_agent, ttl=24 * 60 * 60, error_ttl=10 * 60, clock=time.monotonic):
+        self.user_agent = user_agent
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.clock = clock
+        self.entries = {}  # origin -> (expires_at, rules)
+
+    @staticmethod
+    def origin(url):
+        parsed_url = urlparse(url)
+        return f"{parsed_url.scheme}://{parsed_url.netloc}".lower()
+
+    def robots_url(self, url):
+        return self.origin(url) + "/robots.txt"
+
+    def get(self, url):
+        """The cached rules for the origin of url, or None when they must be fetched."""
+        entry = self.entries.get(self.origin(url))
+        if entry is None or entry[0] <= self.clock():
+            return None
+        return entry[1]
+
+    def store(self, url, status, text):
+        """Cache the robots.txt fetched for the origin of url; status is None when the fetch failed."""
+        rules = RobotFileParser(self.robots_url(url))
+        ttl = self.ttl
+        if status is None or status >= 500:
+            rules.disallow_all = True
+            ttl = min(ttl, self.error_ttl)
+        elif status >= 400:
+            rules.allow_all = True
+        else:
+            rules.parse(text.splitlines())
+
+        self.entries[self.origin(url)] = (self.clock() + ttl, rules)
+        return rules
+
+    def allowed(self, rules, url):
+        return rules.can_fetch(self.user_agent, url)
+
+    def crawl_delay(self, rules):
+        """The Crawl-delay rules ask of this crawler, or None."""
+        if rules.allow_all or rules.disallow_all:
+            return None
+        delay = rules.crawl_delay(self.user_agent)
+        return float(delay) if delay is not None else None
@@ -1,17 +1,61 @@
+import os
+import sys
 import uuid
+import hashlib
+import time
+import asyncio
+import argparse
 import requests
-from urllib.parse import urljoin, urlparse
-from bs4 import BeautifulSoup
+import aiohttp
+from urllib.parse import urlparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# The crawler runs as a script; make the shared packages at the repository root importable
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.metrics import REGISTRY, Throttle, start_exporters
 from database import Database
+from page_writer import PageWriter
+from extraction import EXTRACTORS, canonicalize_url, parse_document
+from dedup import NearDuplicateIndex
+from frontier import Frontier, RobotsCache, host_of
+from seen import ScalableBloomFilter
+
+try:
+    import brotli  # noqa: F401 - aiohttp only decodes br when this is installed
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+USER_AGENT = "GibbleCrawler v0.3"
+
+STAGE_SECONDS = REGISTRY.histogram("gibble_crawler_stage_seconds", "Seconds spent in each crawl stage", ["stage"])
+URLS_PROCESSED = REGISTRY.counter("gibble_crawler_urls_processed_total", "URLs taken from the queue")
+URL_OUTCOMES = REGISTRY.counter("gibble_crawler_urls_total", "URLs by what became of them", ["outcome"])
+PENDING_URLS = REGISTRY.gauge("gibble_crawler_pending_urls", "URLs leased by this crawler and not crawled yet")
+LINKS_FILTERED = REGISTRY.counter("gibble_crawler_links_filtered_total", "Links dropped by the seen-URL filter before reaching the database")
+FRONTIER_HOSTS = REGISTRY.gauge("gibble_crawler_frontier_hosts", "Hosts with URLs queued or in flight in the frontier")
 
 class GibbleCrawler:
-    def __init__(self):
+    def __init__(self, batch_size=50, lease_seconds=600, flush_pages=200, flush_interval=5.0, recrawl=False, dedup_distance=3, extractor="streaming", seed_urls=None, stats_interval=2.0,
+                 host_concurrency=2, host_delay=1.0, robots_ttl=24 * 60 * 60, respect_robots=True, follow_links=False, max_depth=None,
+                 seen_filter=True, seen_path=None):
         self.db = Database()
         self.db.ensure_connection()
 
-        self.base_crawl_url = ["https://en.wikipedia.org/wiki/Main_Page"]
+        # Pages are written behind the crawl loop on a separate connection
+        self.writer = PageWriter(Database(), max_pages=flush_pages, flush_interval=flush_interval)
+
+        self.base_crawl_url = [canonicalize_url(url) for url in seed_urls or ["https://en.wikipedia.org/wiki/Main_Page"]]
         self.db.insert_url(self.base_crawl_url)
 
+        # Reuse pooled keep-alive connections instead of a new handshake per page
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': USER_AGENT})
+
+        # See extraction.EXTRACTORS, every backend produces the same page dicts
+        self.extractor = extractor
+
         self.disallowed_extensions = [
             ".jpg", ".png", ".gif", ".svg", ".pdf", ".doc", ".zip", ".exe", ".tar.gz"
         ]
@@ -22,9 +66,62 @@ class GibbleCrawler:
             "total_urls_failed": 0,
             "total_urls_skipped": 0,
             "total_urls_queued": 0,
-            "total_urls": 0
+            "total_urls_unchanged": 0,
+            "total_urls_duplicate": 0,
+            "total_urls_disallowed": 0,
+            "total_urls": 0,
+            "total_links_filtered": 0
         }
 
+        # The stats stay plain counters on the hot path and are read when metrics are scraped
+        URLS_PROCESSED.set_function(lambda: self.stats["total_urls"])
+        LINKS_FILTERED.set_function(lambda: self.stats["total_links_filtered"])
+        for outcome in ("crawled", "failed", "skipped", "queued", "unchanged", "duplicate", "disallowed"):
+            URL_OUTCOMES.set_function(lambda key=f"total_urls_{outcome}": self.stats[key], outcome=outcome)
+
+        # The console view is redrawn at most every stats_interval seconds, 0 turns it off
+        self.display_throttle = Throttle(stats_interval)
+
+        # URLs are leased from the shared queue in batches, see Database.claim_urls
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+
+        # Leased URLs wait in per-host queues, so no host gets more than host_concurrency
+        # requests at a time or more than one every host_delay seconds
+        self.frontier = Frontier(host_concurrency, host_delay)
+        self.max_pending = batch_size * 4
+        self.depths = {}  # url -> links followed from a seed to find it
+        self.refill_after = 0.0
+        PENDING_URLS.set_function(lambda: len(self.frontier))
+        FRONTIER_HOSTS.set_function(lambda: len(self.frontier.hosts))
+
+        # robots.txt rules per origin, refetched after robots_ttl seconds
+        self.robots = RobotsCache(USER_AGENT, robots_ttl) if respect_robots else None
+
+        # Links on stored pages are queued when following links, up to max_depth links from a seed
+        self.follow_links = follow_links
+        self.max_depth = max_depth
+
+        # Links queued before are dropped in memory instead of conflicting in the database.
+        # The set is saved to seen_path at shutdown and reloaded from it, or rebuilt from the queue.
+        self.seen = None
+        self.seen_path = seen_path
+        if seen_filter and follow_links:
+            self.seen = self._load_seen_urls()
+            self.seen.add_new(self.base_crawl_url)
+
+        # In recrawl mode already crawled URLs are revisited once due, with conditional
+        # requests built from the validators stored at their last crawl
+        self.recrawl = recrawl
+        self.validators = {}  # url -> (etag, last_modified, content_hash)
+
+        # Pages within dedup_distance bits of a stored page's SimHash are dropped, None disables it
+        self.duplicates = None
+        if dedup_distance is not None:
+            self.duplicates = NearDuplicateIndex(dedup_distance)
+            for url, fingerprint in self.db.get_page_fingerprints():
+                self.duplicates.add(url, fingerprint)
+
     def filter_outbound_links(self, links):
         """
         Filters outbound links to:
@@ -49,41 +146,153 @@ class GibbleCrawler:
         self.stats["total_urls"] += 1
 
         try:
-            response = self._fetch_url(url)
-            if not response:
+            if not self._is_allowed(url):
                 return
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-            canonical_url = response.url
+            validators = self.validators.pop(url, None)
+            with STAGE_SECONDS.time(stage="fetch"):
+                response = self._fetch_url(url, validators)
+            if not response:
+                return
 
-            # Extract metadata and content
-            parsed_page = self._parse_page(soup, canonical_url)
-            outbound_links = self.filter_outbound_links(self._extract_outbound_links(soup, url))
+            etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+            content = response.content if response.status_code != 304 else None
+            if self._is_unchanged(url, validators, content, etag, last_modified):
+                return
 
-            # Insert into the database
-            if len(parsed_page["page_content"]["page_text"]) > 500:
-                self.db.insert_page(canonical_url, parsed_page)
-                self.stats["total_urls_crawled"] += 1
-            else:
-                self.stats["total_urls_skipped"] += 1
-            # self.db.insert_outbound_links(outbound_links)
-            # self.stats["total_urls_queued"] += len(outbound_links)
+            canonical_url = response.url
 
+            # Extract metadata, content and links
+            with STAGE_SECONDS.time(stage="parse"):
+                parsed_page, outbound_links = self._parse_document(content, canonical_url, url)
 
+            self._store_page(canonical_url, parsed_page, outbound_links, self.depths.get(url, 0))
+            self._record_fetch(url, validators, content, etag, last_modified)
 
         except Exception as error:
             self.stats["total_urls_failed"] += 1
 
-    def _fetch_url(self, url):
-        """Fetch the content of a URL."""
+    def _store_page(self, canonical_url, parsed_page, outbound_links, depth=0):
+        """Persist a parsed page and queue its links, skipping pages without meaningful content and near-duplicates."""
+        if len(parsed_page["page_content"]["page_text"]) <= 500:
+            self.stats["total_urls_skipped"] += 1
+        elif self._is_duplicate(canonical_url, parsed_page):
+            self.stats["total_urls_duplicate"] += 1
+        else:
+            self.writer.add_page(canonical_url, parsed_page)
+            self.stats["total_urls_crawled"] += 1
+            self._queue_links(outbound_links, depth + 1)
+
+    def _queue_links(self, links, depth):
+        """Queue the links of a stored page, found depth links away from a seed."""
+        if not self.follow_links or (self.max_depth is not None and depth > self.max_depth):
+            return
+        if self.seen is not None:
+            new_links = self.seen.add_new(links)
+            self.stats["total_links_filtered"] += len(links) - len(new_links)
+            links = new_links
+        if not links:
+            return
+        self.writer.add_links([(link, depth) for link in links])
+        self.stats["total_urls_queued"] += len(links)
+
+    def _load_seen_urls(self):
+        """Reload the seen-URL set saved by a previous run, or build it from the URL queue."""
+        if self.seen_path and os.path.exists(self.seen_path):
+            try:
+                return ScalableBloomFilter.load(self.seen_path)
+            except (OSError, ValueError, KeyError) as error:
+                print(f"Error loading the seen-URL set, rebuilding it: {error}")
+
+        seen = ScalableBloomFilter()
+        for urls in self.db.iter_urls():
+            seen.add_new(urls)
+        return seen
+
+    def _is_allowed(self, url):
+        """Check a URL against the robots.txt of its site, fetching the rules if they are not cached."""
+        if self.robots is None:
+            return True
+
+        rules = self.robots.get(url)
+        if rules is None:
+            try:
+                with STAGE_SECONDS.time(stage="robots"):
+                    response = self.session.get(self.robots.robots_url(url), timeout=5)
+                rules = self._store_robots(url, response.status_code, response.text)
+            except requests.exceptions.RequestException:
+                rules = self._store_robots(url, None, "")
+        return self._check_robots(rules, url)
+
+    def _store_robots(self, url, status, text):
+        """Cache fetched robots.txt rules and slow the host down to the Crawl-delay they ask for."""
+        rules = self.robots.store(url, status, text)
+        delay = self.robots.crawl_delay(rules)
+        if delay is not None:
+            self.frontier.set_delay(host_of(url), max(delay, self.frontier.host_delay))
+        return rules
+
+    def _check_robots(self, rules, url):
+        if self.robots.allowed(rules, url):
+            return True
+        self.stats["total_urls_disallowed"] += 1
+        return False
+
+    def _conditional_headers(self, validators):
+        """Request headers that let the server answer 304 if the page did not change."""
+        headers = {}
+        if validators:
+            etag, last_modified, _ = validators
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def _is_unchanged(self, url, validators, content, etag, last_modified):
+        """
+        Record the fetch of a page that did not change and return True.
+
+        content is None for a 304 response; otherwise the body is compared
+        with the hash stored at the previous crawl, so an unchanged page is
+        neither parsed nor re-indexed.
+        """
+        previous_hash = validators[2] if validators else None
+        if content is None:
+            etag = etag or validators[0]
+            last_modified = last_modified or validators[1]
+        elif previous_hash is None or hashlib.sha256(content).hexdigest() != previous_hash:
+            return False
+
+        self.writer.record_fetch(url, etag, last_modified, previous_hash, False)
+        self.stats["total_urls_unchanged"] += 1
+        return True
+
+    def _record_fetch(self, url, validators, content, etag, last_modified):
+        """Record the fetch of a new or changed page."""
+        previous_hash = validators[2] if validators else None
+        self.writer.record_fetch(url, etag, last_modified, hashlib.sha256(content).hexdigest(), previous_hash is not None)
+
+    def _is_duplicate(self, canonical_url, parsed_page):
+        """Check the fingerprint of a parsed page against the pages stored so far."""
+        if self.duplicates is None:
+            return False
+        with STAGE_SECONDS.time(stage="dedup"):
+            return self.duplicates.check(canonical_url, parsed_page["fingerprint"]) is not None
+
+    def _fetch_url(self, url, validators=None):
+        """Fetch the content of a URL, conditionally if validators from a previous crawl are given."""
         try:
-            response = requests.get(
+            response = self.session.get(
                 url,
+                headers=self._conditional_headers(validators),
                 timeout=5,
-                allow_redirects=True,
-                headers={'User-Agent': 'GibbleCrawler v0.3'}
+                allow_redirects=True
             )
 
+            if response.status_code == 304 and validators:
+                return response
+
             if response.status_code != 200:
                 self.stats["total_urls_failed"] += 1
                 return None
@@ -93,54 +302,19 @@ class GibbleCrawler:
             self.stats["total_urls_failed"] += 1
             return None
 
-    def _parse_page(self, soup, canonical_url):
-        """Extract page metadata and content."""
-        page_title = soup.title.string if soup.title else "No title"
-        page_description = soup.find("meta", property="og:description")
-        page_content = soup.get_text().strip().replace("\n", " ").replace("\r", " ").replace("\t", " ").replace("(", " ").replace(")", " ").replace("[", " ").replace("]", " ").replace("{", " ").replace("}", " ").replace("  ", " ")
-
-        page_description = page_description["content"] if page_description else page_content[:200]
-
-        return {
-            "page_metadata": {
-                "canonical_url": canonical_url,
-                "page_title": page_title,
-                "page_description": " ".join([word for word in page_description.split(" ") if word.strip()][:200]),
-            },
-            "page_content": {
-                "page_text": page_content,
-            }
-        }
-
-    def _extract_outbound_links(self, soup, base_url):
-        """Extract and normalize outbound links from a page."""
-        links = set()
-
-        for link in soup.find_all('a', href=True):
-            href = link.get('href')
-            if not href or href.startswith('#'):
-                continue
-
-            # Normalize relative URLs
-            full_url = urljoin(base_url, href)
-
-            # Skip URLs with disallowed extensions
-            if any(full_url.lower().endswith(ext) for ext in self.disallowed_extensions):
-                self.stats["total_urls_skipped"] += 1
-                continue
-
-            # Validate URL structure
-            parsed_url = urlparse(full_url)
-            if parsed_url.scheme not in ('http', 'https'):
-                self.stats["total_urls_skipped"] += 1
-                continue
-
-            links.add(full_url)
-
-        return list(links)
+    def _parse_document(self, content, canonical_url, base_url):
+        """Extract page metadata, content and filtered outbound links."""
+        parsed_page, links, skipped = parse_document(
+            content, canonical_url, base_url, self.disallowed_extensions, self.extractor
+        )
+        self.stats["total_urls_skipped"] += skipped
+        return parsed_page, self.filter_outbound_links(links)
 
     def _display_stats(self):
-        """Continuously display crawler statistics."""
+        """Redraw the crawler statistics, at most once per stats interval."""
+        if not self.display_throttle.ready():
+            return
+
         # Clear the screen
         print("\033[H\033[J")
         print("\nCrawler Statistics:")
@@ -149,22 +323,330 @@ class GibbleCrawler:
         print(f"Total URLs Failed: {self.stats['total_urls_failed']}")
         print(f"Total URLs Skipped: {self.stats['total_urls_skipped']}")
         print(f"Total URLs Queued: {self.stats['total_urls_queued']}")
+        print(f"Total URLs Unchanged: {self.stats['total_urls_unchanged']}")
+        print(f"Total URLs Duplicate: {self.stats['total_urls_duplicate']}")
+        print(f"Total URLs Disallowed: {self.stats['total_urls_disallowed']}")
         print(f"Total URLs Processed: {self.stats['total_urls']}")
-        
+        print(f"Total Links Already Seen: {self.stats['total_links_filtered']}")
+        print(f"Frontier: {len(self.frontier)} URLs queued over {len(self.frontier.hosts)} hosts")
+        for stage in ("claim", "robots", "fetch", "parse", "dedup", "db_write"):
+            count, seconds = STAGE_SECONDS.summary(stage=stage)
+            if count:
+                print(f"Mean {stage} time: {seconds / count * 1000:.1f} ms over {count} calls")
+
+    def _refill_due(self, force):
+        # Once the queue came up empty it is polled at most once a second
+        return force or time.monotonic() >= self.refill_after
+
+    def _refill_queue(self, force=False):
+        """Lease the next batch of URLs into the frontier, returning how many were leased."""
+        if not self._refill_due(force):
+            return 0
+        return self._queue_batch(self._claim_batch(self.frontier.saturated_hosts(self.batch_size)))
+
+    def _claim_batch(self, saturated_hosts):
+        """Lease the next batch of URLs from the shared queue; only touches the database, never the frontier."""
+        with STAGE_SECONDS.time(stage="claim"):
+            if self.recrawl:
+                return self.db.claim_recrawl_urls(self.batch_size, self.stats["crawl_session_id"], self.lease_seconds)
+            # Hosts with a batch worth of URLs queued already leave room for other hosts
+            return self.db.claim_urls(
+                self.batch_size, self.stats["crawl_session_id"], self.lease_seconds, saturated_hosts
+            )
+
+    def _queue_batch(self, rows):
+        """Queue the URLs of a claimed batch in the frontier, returning how many there were."""
+        for row in rows:
+            if self.recrawl:
+                url, depth, etag, last_modified, content_hash = row
+                self.validators[url] = (etag, last_modified, content_hash)
+                priority = 0.0
+            else:
+                url, depth, priority = row
+            self.depths[url] = depth
+            self.frontier.add(url, priority)
+        if not rows:
+            self.refill_after = time.monotonic() + 1.0
+        return len(rows)
+
+    def _next_url(self):
+        """The next URL the frontier lets through, waiting out host delays; None once the queue is exhausted."""
+        while True:
+            url = self.frontier.next_url()
+            if url:
+                return url
+
+            if not len(self.frontier):
+                # Links found so far must be written before the queue can be called exhausted
+                if self.follow_links:
+                    self.writer.flush()
+                if self._refill_queue(force=True):
+                    continue
+                return None
+
+            if len(self.frontier) < self.max_pending and self._refill_queue():
+                continue
+            time.sleep(self.frontier.wait_time() or 0.05)
+
+    def _finish_url(self, url):
+        """Free the URL's host slot and mark it crawled once everything before it is written."""
+        self.frontier.done(url)
+        self.depths.pop(url, None)
+        self.writer.complete_url(url)
+
+    def _shutdown(self):
+        """Flush buffered output and give unfinished leases back to the queue."""
+        self.writer.close()
+        self.frontier.clear()
+        self.depths.clear()
+        self.db.release_urls(self.stats["crawl_session_id"])
+        if self.seen is not None and self.seen_path:
+            self.seen.save(self.seen_path)
 
     def run(self):
         """Start the crawling process."""
+        try:
+            while True:
+                url_to_crawl = self._next_url()
+                if not url_to_crawl:
+                    print("URL queue exhausted, crawler shutting down.")
+                    break
+
+                self.crawl(url_to_crawl)
+                self._finish_url(url_to_crawl)
+                self._display_stats()
+        finally:
+            self._shutdown()
+
+
+class AsyncGibbleCrawler(GibbleCrawler):
+    """
+    Crawls many URLs concurrently on an asyncio event loop.
+
+    Fetches share one pooled aiohttp session, HTML parsing runs on a bounded
+    process pool and database calls are serialized on a single thread, since
+    a psycopg2 connection must not be used from two threads at once.
+    """
+
+    def __init__(self, concurrency=32, parse_workers=None, **kwargs):
+        super().__init__(**kwargs)
+        self.concurrency = concurrency
+        self.parse_pool = ProcessPoolExecutor(max_workers=parse_workers or os.cpu_count())
+        self.db_executor = ThreadPoolExecutor(max_workers=1)
+
+    async def _run_db(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.db_executor, function, *args)
+
+    async def _refill_queue_async(self, force=False):
+        """
+        _refill_queue for the event loop.
+
+        Frontier is not thread-safe and workers update it from the loop, so
+        only the claim itself runs on the database thread.
+        """
+        if not self._refill_due(force):
+            return 0
+        rows = await self._run_db(self._claim_batch, self.frontier.saturated_hosts(self.batch_size))
+        return self._queue_batch(rows)
+
+    async def crawl_async(self, session, url):
+        """Crawl a single URL and extract information, without blocking the event loop."""
+        self.stats["total_urls"] += 1
+
+        try:
+            if not await self._is_allowed_async(session, url):
+                return
+
+            validators = self.validators.pop(url, None)
+            with STAGE_SECONDS.time(stage="fetch"):
+                response = await self._fetch_url_async(session, url, validators)
+            if not response:
+                return
+
+            canonical_url, content, etag, last_modified = response
+            if self._is_unchanged(url, validators, content, etag, last_modified):
+                return
+
+            loop = asyncio.get_running_loop()
+            with STAGE_SECONDS.time(stage="parse"):
+                parsed_page, outbound_links, skipped = await loop.run_in_executor(
+                    self.parse_pool, parse_document, content, canonical_url, url, self.disallowed_extensions, self.extractor
+                )
+            self.stats["total_urls_skipped"] += skipped
+            outbound_links = self.filter_outbound_links(outbound_links)
+
+            self._store_page(canonical_url, parsed_page, outbound_links, self.depths.get(url, 0))
+            self._record_fetch(url, validators, content, etag, last_modified)
+
+        except Exception:
+            self.stats["total_urls_failed"] += 1
+
+    async def _is_allowed_async(self, session, url):
+        """Check a URL against the robots.txt of its site, see _is_allowed."""
+        if self.robots is None:
+            return True
+
+        rules = self.robots.get(url)
+        if rules is None:
+            try:
+                with STAGE_SECONDS.time(stage="robots"):
+                    async with session.get(self.robots.robots_url(url)) as response:
+                        rules = self._store_robots(url, response.status, await response.text(errors="replace"))
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                rules = self._store_robots(url, None, "")
+        return self._check_robots(rules, url)
+
+    async def _fetch_url_async(self, session, url, validators=None):
+        """
+        Fetch the content of a URL, returning the final URL, the body and its validators.
+
+        The body is None when the server answered a conditional request with 304.
+        """
+        try:
+            async with session.get(url, headers=self._conditional_headers(validators), allow_redirects=True) as response:
+                etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+                if response.status == 304 and validators:
+                    return str(response.url), None, etag, last_modified
+
+                if response.status != 200:
+                    self.stats["total_urls_failed"] += 1
+                    return None
+
+                return str(response.url), await response.read(), etag, last_modified
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.stats["total_urls_failed"] += 1
+            return None
+
+    async def _next_url_async(self):
+        """The next URL the frontier lets through, see _next_url; one worker refills it while the others wait."""
+        while True:
+            async with self.claim_lock:
+                url = self.frontier.next_url()
+                if url:
+                    return url
+
+                if not len(self.frontier):
+                    if self.follow_links:
+                        await asyncio.get_running_loop().run_in_executor(None, self.writer.flush)
+                    # Pages still in flight may queue more links, so keep polling until they are done
+                    exhausted = not (self.follow_links and self.frontier.in_flight)
+                    if await self._refill_queue_async(exhausted):
+                        continue
+                    if exhausted:
+                        return None
+                elif len(self.frontier) < self.max_pending and await self._refill_queue_async():
+                    continue
+                wait = self.frontier.wait_time()
+
+            await asyncio.sleep(wait if wait is not None else 0.05)
+
+    async def _worker(self, session):
         while True:
-            url_to_crawl = self.db.get_next_url()
+            url_to_crawl = await self._next_url_async()
             if not url_to_crawl:
-                print("URL queue exhausted, crawler shutting down.")
-                break
+                return
 
-            self.crawl(url_to_crawl)
+            await self.crawl_async(session, url_to_crawl)
+            self._finish_url(url_to_crawl)
             self._display_stats()
 
-# Ensure you have the Database class code present above for this to integrate correctly.
+    async def _run(self):
+        self.claim_lock = asyncio.Lock()
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            ttl_dns_cache=300,
+            keepalive_timeout=30
+        )
+        async with aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=5),
+            headers={'User-Agent': USER_AGENT, 'Accept-Encoding': ACCEPT_ENCODING}
+        ) as session:
+            await asyncio.gather(*(self._worker(session) for _ in range(self.concurrency)))
+
+    def run(self):
+        """Start the crawling process."""
+        try:
+            asyncio.run(self._run())
+            print("URL queue exhausted, crawler shutting down.")
+        finally:
+            self._shutdown()
+            self.parse_pool.shutdown()
+            self.db_executor.shutdown()
+
 
 if __name__ == "__main__":
-    crawler = GibbleCrawler()
-    crawler.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Gibble web crawler")
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync", help="Crawl one URL at a time or many concurrently")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent fetches in async mode")
+    parser.add_argument("--parse-workers", type=int, default=None, help="Parser processes in async mode (defaults to the CPU count)")
+    parser.add_argument("--batch-size", type=int, default=50, help="URLs leased from the queue per round-trip")
+    parser.add_argument("--lease-seconds", type=int, default=600, help="Seconds before a leased URL is handed to another worker")
+    parser.add_argument("--flush-pages", type=int, default=200, help="Buffered pages that trigger a database flush")
+    parser.add_argument("--flush-interval", type=float, default=5.0, help="Seconds between database flushes")
+    parser.add_argument("--recrawl", action="store_true", help="Revisit crawled URLs that are due instead of crawling new ones")
+    parser.add_argument("--dedup-distance", type=int, default=3, help="Largest SimHash distance, in bits, of a near-duplicate page")
+    parser.add_argument("--no-dedup", action="store_true", help="Store near-duplicate pages too")
+    parser.add_argument("--extractor", choices=sorted(EXTRACTORS), default="streaming", help="HTML extraction backend")
+    parser.add_argument("--seed-url", action="append", default=[], help="URL to queue before crawling (repeatable, defaults to the Wikipedia main page)")
+    parser.add_argument("--seed-file", default=None, help="File of URLs to queue before crawling, one per line")
+    parser.add_argument("--host-concurrency", type=int, default=2, help="Requests in flight to one host at most")
+    parser.add_argument("--host-delay", type=float, default=1.0, help="Seconds between two requests to one host, unless its robots.txt asks for more")
+    parser.add_argument("--robots-ttl", type=int, default=24 * 60 * 60, help="Seconds robots.txt rules are cached")
+    parser.add_argument("--ignore-robots", action="store_true", help="Do not fetch or obey robots.txt")
+    parser.add_argument("--follow-links", action="store_true", help="Queue the links of crawled pages")
+    parser.add_argument("--seen-file", default=None, help="Save the seen-URL filter here at shutdown and reload it at start-up")
+    parser.add_argument("--no-seen-filter", action="store_true", help="Send every followed link to the database, counting all inlinks")
+    parser.add_argument("--max-depth", type=int, default=None, help="Only queue links this many links away from a seed at most")
+    parser.add_argument("--stats-interval", type=float, default=2.0, help="Seconds between console statistics redraws (0 disables them)")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on this local port")
+    parser.add_argument("--metrics-file", default=None, help="Periodically write Prometheus metrics to this file")
+    parser.add_argument("--train-dictionary", action="store_true", help="Train a zstd dictionary on a sample of stored pages and exit")
+    parser.add_argument("--compress-pages", action="store_true", help="Move page text stored as JSONB into compressed page bodies and exit")
+    args = parser.parse_args()
+
+    if args.train_dictionary or args.compress_pages:
+        db = Database()
+        if args.train_dictionary:
+            db.train_page_dictionary()
+        if args.compress_pages:
+            db.compress_stored_pages()
+        sys.exit(0)
+
+    seed_urls = list(args.seed_url)
+    if args.seed_file:
+        with open(args.seed_file) as seed_file:
+            seed_urls.extend(line.strip() for line in seed_file if line.strip())
+
+    options = {
+        "batch_size": args.batch_size,
+        "lease_seconds": args.lease_seconds,
+        "flush_pages": args.flush_pages,
+        "flush_interval": args.flush_interval,
+        "recrawl": args.recrawl,
+        "dedup_distance": None if args.no_dedup else args.dedup_distance,
+        "extractor": args.extractor,
+        "seed_urls": seed_urls,
+        "stats_interval": args.stats_interval,
+        "host_concurrency": args.host_concurrency,
+        "host_delay": args.host_delay,
+        "robots_ttl": args.robots_ttl,
+        "respect_robots": not args.ignore_robots,
+        "follow_links": args.follow_links,
+        "max_depth": args.max_depth,
+        "seen_filter": not args.no_seen_filter,
+        "seen_path": args.seen_file
+    }
+
+    metrics_file = start_exporters(args.metrics_port, args.metrics_file)
+
+    if args.mode == "async":
+        crawler = AsyncGibbleCrawler(concurrency=args.concurrency, parse_workers=args.parse_workers, **options)
+    else:
+        crawler = GibbleCrawler(**options)
+    try:
+        crawler.run()
+    finally:
+        if metrics_file:
+            metrics_file.close()
@@ -0,0 +1,124 @@
+import atexit
+import threading
+from common.metrics import REGISTRY
+
+STAGE_SECONDS = REGISTRY.histogram("gibble_crawler_stage_seconds", "Seconds spent in each crawl stage", ["stage"])
+BATCHES = REGISTRY.counter("gibble_crawler_write_batches_total", "Write-behind batches by result", ["result"])
+PAGES_FLUSHED = REGISTRY.counter("gibble_crawler_pages_flushed_total", "Pages written in a batch")
+BUFFERED = REGISTRY.gauge("gibble_crawler_buffered", "Rows waiting in the write-behind buffers", ["buffer"])
+
+
+class PageWriter:
+    """
+    Write-behind sink for crawler output.
+
+    Crawl threads only append to in-memory buffers; a background thread
+    serializes and flushes them with Database.write_batch() whenever a buffer
+    fills up or flush_interval seconds pass. The writer should be given its
+    own Database so flushes never share a connection with the crawl loop.
+    """
+
+    def __init__(self, db, max_pages=200, max_links=10000, flush_interval=5.0):
+        self.db = db
+        self.max_pages = max_pages
+        self.max_links = max_links
+        self.flush_interval = flush_interval
+
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.flush_requested = threading.Event()
+        self.closed = False
+
+        self.pages = []
+        self.links = []
+        self.completed_urls = []
+        self.fetch_states = []
+
+        self.stats = {
+            "batches_flushed": 0,
+            "batches_failed": 0,
+            "pages_flushed": 0
+        }
+        BATCHES.set_function(lambda: self.stats["batches_flushed"], result="flushed")
+        BATCHES.set_function(lambda: self.stats["batches_failed"], result="failed")
+        PAGES_FLUSHED.set_function(lambda: self.stats["pages_flushed"])
+        BUFFERED.set_function(lambda: len(self.pages), buffer="pages")
+        BUFFERED.set_function(lambda: len(self.links), buffer="links")
+
+        self.thread = threading.Thread(target=self._flush_loop, name="page-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def add_page(self, url, page_data):
+        with self.lock:
+            self.pages.append((url, page_data))
+            buffered = len(self.pages)
+        self._maybe_flush(buffered, self.max_pages)
+
+    def add_links(self, links):
+        """Buffer (url, depth) links to queue."""
+        with self.lock:
+            self.links.extend(links)
+            buffered = len(self.links)
+        self._maybe_flush(buffered, self.max_links)
+
+    def record_fetch(self, url, etag, last_modified, content_hash, changed):
+        """Buffer the validators and content hash seen when fetching a URL."""
+        with self.lock:
+            self.fetch_states.append((url, etag, last_modified, content_hash, changed))
+
+    def complete_url(self, url):
+        """Mark a URL crawled once everything buffered before it is written."""
+        with self.lock:
+            self.completed_urls.append(url)
+
+    def _maybe_flush(self, buffered, limit):
+        if buffered >= limit * 4:
+            # The database has fallen far behind, apply backpressure to the caller
+            self.flush()
+        elif buffered >= limit:
+            self.flush_requested.set()
+
+    def _flush_loop(self):
+        while not self.closed:
+            self.flush_requested.wait(self.flush_interval)
+            self.flush_requested.clear()
+            self.flush()
+
+    def flush(self):
+        """Write everything buffered so far."""
+        with self.flush_lock:
+            with self.lock:
+                pages, self.pages = self.pages, []
+                links, self.links = self.links, []
+                completed_urls, self.completed_urls = self.completed_urls, []
+                fetch_states, self.fetch_states = self.fetch_states, []
+
+            if not (pages or links or completed_urls or fetch_states):
+                return
+
+            with STAGE_SECONDS.time(stage="db_write"):
+                self._write(pages, links, completed_urls, fetch_states)
+
+    def _write(self, pages, links, completed_urls, fetch_states):
+        if self.db.write_batch(pages, links, completed_urls, fetch_states):
+            self.stats["batches_flushed"] += 1
+            self.stats["pages_flushed"] += len(pages)
+            return
+
+        # Fall back to row-by-row writes so one bad page cannot drop the whole batch
+        self.stats["batches_failed"] += 1
+        for url, page_data in pages:
+            self.db.insert_page(url, page_data)
+        self.db.insert_links(links)
+        self.db.complete_urls(completed_urls)
+        self.db.update_fetch_states(fetch_states)
+
+    def close(self):
+        """Stop the background thread and flush whatever is left."""
+        if self.closed:
+            return
+        self.closed = True
+        self.flush_requested.set()
+        self.thread.join()
+        self.flush()
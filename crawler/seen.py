@@ -0,0 +1,123 @@
+import hashlib
+import json
+import math
+import os
+import numpy as np
+
+
+def url_hashes(urls):
+    """Two independent 64-bit hashes per URL, as an (n, 2) uint64 array."""
+    digests = b"".join(hashlib.blake2b(url.encode(), digest_size=16).digest() for url in urls)
+    return np.frombuffer(digests, dtype="<u8").reshape(-1, 2)
+
+
+class BloomFilter:
+    """A fixed-size Bloom filter over precomputed hash pairs, probed k times by double hashing."""
+
+    def __init__(self, capacity, error_rate, bits=None, count=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)), 8)
+        self.probes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bits if bits is not None else np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        self.count = count
+
+    def _positions(self, hashes):
+        steps = np.arange(self.probes, dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            return (hashes[:, :1] + steps * (hashes[:, 1:] | np.uint64(1))) % np.uint64(self.size)
+
+    def contains(self, hashes):
+        """A boolean array, True where a hash pair was probably added before."""
+        positions = self._positions(hashes)
+        bits = self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)
+        return (bits & 1).all(axis=1)
+
+    def add(self, hashes):
+        positions = self._positions(hashes).ravel()
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3), np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+        self.count += len(hashes)
+
+
+class ScalableBloomFilter:
+    """
+    A probabilistic set of URLs that grows with what it holds.
+
+    When the current Bloom filter reaches its capacity a new one, growth
+    times larger and with an error rate tightened by tightening, is added
+    (Almeida et al., "Scalable Bloom Filters"), so the false positive rate
+    stays below error_rate / (1 - tightening) however many URLs are added.
+    A false positive drops a new URL; there are no false negatives.
+    """
+
+    def __init__(self, initial_capacity=1000000, error_rate=0.001, growth=2, tightening=0.5):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.filters = []
+
+    def __len__(self):
+        return sum(bloom.count for bloom in self.filters)
+
+    def __contains__(self, url):
+        return bool(self._contains(url_hashes([url]))[0])
+
+    def _contains(self, hashes):
+        seen = np.zeros(len(hashes), dtype=bool)
+        for bloom in self.filters:
+            seen |= bloom.contains(hashes)
+        return seen
+
+    def _add(self, hashes):
+        while len(hashes):
+            bloom = self.filters[-1] if self.filters else None
+            if bloom is None or bloom.count >= bloom.capacity:
+                level = len(self.filters)
+                bloom = BloomFilter(
+                    self.initial_capacity * self.growth ** level,
+                    self.error_rate * (1 - self.tightening) * self.tightening ** level,
+                )
+                self.filters.append(bloom)
+            room = bloom.capacity - bloom.count
+            bloom.add(hashes[:room])
+            hashes = hashes[room:]
+
+    def add_new(self, urls):
+        """Add urls and return the ones that were probably not in the set, in order and without repeats."""
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return []
+        hashes = url_hashes(urls)
+        new = ~self._contains(hashes)
+        self._add(hashes[new])
+        return [url for url, is_new in zip(urls, new) if is_new]
+
+    def save(self, path):
+        """Write the set to path, atomically replacing any previous file."""
+        header = {
+            "initial_capacity": self.initial_capacity,
+            "error_rate": self.error_rate,
+            "growth": self.growth,
+            "tightening": self.tightening,
+            "counts": [bloom.count for bloom in self.filters],
+        }
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as handle:
+            np.savez(handle, header=np.frombuffer(json.dumps(header).encode(), dtype=np.uint8),
+                     **{f"filter_{level}": bloom.bits for level, bloom in enumerate(self.filters)})
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            header = json.loads(data["header"].tobytes())
+            seen = cls(header["initial_capacity"], header["error_rate"], header["growth"], header["tightening"])
+            for level, count in enumerate(header["counts"]):
+                seen.filters.append(BloomFilter(
+                    seen.initial_capacity * seen.growth ** level,
+                    seen.error_rate * (1 - seen.tightening) * seen.tightening ** level,
+                    bits=data[f"filter_{level}"].copy(),
+                    count=count,
+                ))
+        return seen
@@ -0,0 +1,180 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_query(query):
+    """Cache key of a query: case and spacing do not change the results."""
+    return " ".join(query.lower().split())
+
+
+class QueryCache:
+    """
+    In-process LRU cache of search results.
+
+    Entries expire after ttl seconds, belong to the index generation they
+    were computed for and are evicted least recently used first once their
+    estimated size passes max_bytes.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=300, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()  # key -> (expires_at, generation, size, value)
+        self.size = 0
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, key, generation):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+
+            expires_at, entry_generation, size, value = entry
+            if expires_at < self.clock() or entry_generation != generation:
+                self._remove(key)
+                self.stats["misses"] += 1
+                self.stats["invalidations"] += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def set(self, key, generation, value):
+        size = len(key) + len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (self.clock() + self.ttl, generation, size, value)
+            self.size += size
+
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        self.size -= self.entries.pop(key)[2]
+
+    def describe(self):
+        with self.lock:
+            return {"backend": "memory", "entries": len(self.entries), "bytes": self.size, "max_bytes": self.max_bytes, **self.stats}
+
+
+class SqliteQueryCache:
+    """
+    Query cache kept in a local SQLite file, shared by every worker process on a host.
+
+    Same contract as QueryCache; hit and miss counters are per process.
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, ttl=300, clock=time.time):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock  # Wall clock time, shared by the processes using the file
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+        self.connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode = WAL;")
+        self.connection.execute("PRAGMA synchronous = NORMAL;")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS query_cache (
+                key TEXT PRIMARY KEY,
+                generation INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                size INTEGER NOT NULL,
+                value TEXT NOT NULL
+            );
+            """
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_query_cache_last_used ON query_cache (last_used);")
+
+    def get(self, key, generation):
+        now = self.clock()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT generation, expires_at, value FROM query_cache WHERE key = ?;", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+
+            entry_generation, expires_at, value = row
+            if expires_at < now or entry_generation != generation:
+                self.connection.execute("DELETE FROM query_cache WHERE key = ?;", (key,))
+                self.stats["misses"] += 1
+                self.stats["invalidations"] += 1
+                return None
+
+            self.connection.execute("UPDATE query_cache SET last_used = ? WHERE key = ?;", (now, key))
+            self.stats["hits"] += 1
+            return json.loads(value)
+
+    def set(self, key, generation, value):
+        value = json.dumps(value, default=str)
+        size = len(key) + len(value)
+        if size > self.max_bytes:
+            return
+
+        now = self.clock()
+        with self.lock:
+            self.connection.execute(
+                """
+                INSERT OR REPLACE INTO query_cache (key, generation, expires_at, last_used, size, value)
+                VALUES (?, ?, ?, ?, ?, ?);
+                """,
+                (key, generation, now + self.ttl, now, size, value),
+            )
+
+            total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM query_cache;").fetchone()[0]
+            if total > self.max_bytes:
+                # Drop expired and stale entries first, then the least recently used ones
+                removed = self.connection.execute(
+                    "DELETE FROM query_cache WHERE expires_at < ? OR generation <> ?;", (now, generation)
+                ).rowcount
+                total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM query_cache;").fetchone()[0]
+                for old_key, old_size in self.connection.execute(
+                    "SELECT key, size FROM query_cache ORDER BY last_used;"
+                ).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    self.connection.execute("DELETE FROM query_cache WHERE key = ?;", (old_key,))
+                    total -= old_size
+                    removed += 1
+                self.stats["evictions"] += removed
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute("DELETE FROM query_cache;")
+
+    def describe(self):
+        with self.lock:
+            entries, size = self.connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM query_cache;"
+            ).fetchone()
+            return {"backend": "sqlite", "entries": entries, "bytes": size, "max_bytes": self.max_bytes, **self.stats}
+
+
+def create_cache(backend, path=None, max_bytes=None, ttl=300):
+    """Build the query cache selected by configuration, or None when disabled."""
+    if backend == "memory":
+        return QueryCache(max_bytes=max_bytes or 64 * 1024 * 1024, ttl=ttl)
+    if backend == "sqlite":
+        return SqliteQueryCache(path or "gibble_query_cache.sqlite3", max_bytes=max_bytes or 256 * 1024 * 1024, ttl=ttl)
+    return None
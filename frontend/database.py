@@ -1,111 +1,838 @@
 import os
+import atexit
+import heapq
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dotenv import load_dotenv
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
-import heapq
-import datetime
+import psycopg2.pool
+import time
+import numpy as np
+from frontend.ranking import BM25
+from frontend.cache import create_cache, normalize_query
+from frontend.query import parse_query
+from frontend.snippets import make_snippet
+from frontend.suggest import PrefixIndex
+from common.positions import decode_positions, match_phrase
+from common.segments import SegmentIndex
+from common.shards import Shard, load_shards
+from common.metrics import REGISTRY
+
+SEARCH_STAGE_SECONDS = REGISTRY.histogram("gibble_search_stage_seconds", "Seconds spent in each search step", ["backend", "stage"])
+SEARCHES = REGISTRY.counter("gibble_searches_total", "Searches by how they were answered", ["backend", "outcome"])
+
+
+def group_postings(rows, keys):
+    """Split (key, doc_id, tf, length) rows into per-key arrays sorted by doc_id."""
+    rows = np.asarray(rows, dtype=np.int64).reshape(-1, 4)
+    rows = rows[np.lexsort((rows[:, 1], rows[:, 0]))]
+    grouped = {}
+    for key in keys:
+        start = np.searchsorted(rows[:, 0], key, side="left")
+        end = np.searchsorted(rows[:, 0], key, side="right")
+        grouped[key] = (rows[start:end, 1], rows[start:end, 2], rows[start:end, 3])
+    return grouped
+
+
+def restrict(doc_ids, allowed):
+    """The sorted doc_ids also in allowed, or all of them when allowed is None."""
+    return doc_ids if allowed is None else np.intersect1d(doc_ids, allowed)
+
+
+def merge_vocabularies(vocabularies):
+    """Merge (term, df) lists sorted by UTF-8 bytes into one, adding up the dfs of a term."""
+    merged = []
+    for term, df in heapq.merge(*vocabularies, key=lambda row: row[0].encode("utf-8")):
+        if merged and merged[-1][0] == term:
+            merged[-1] = (term, merged[-1][1] + df)
+        else:
+            merged.append((term, df))
+    return merged
+
+
+def merge_top_documents(rankings, depth):
+    """The depth best (shard, doc_id, score) of the (doc_id, score) rankings of every shard, best first."""
+    return sorted(
+        ((shard, doc_id, score) for shard, ranking in enumerate(rankings) for doc_id, score in ranking),
+        key=lambda item: (-item[2], item[0], item[1]),
+    )[:depth]
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """A connection that remembers when it was last returned to the pool."""
+
+    last_used = 0.0
 
 
 class Database:
+    """
+    Search access to the index through a process-wide connection pool.
+
+    Use Database.shared() instead of constructing one per request: the
+    instance and its pool live for the whole process and are safe to use
+    from several threads. A forked worker (e.g. gunicorn without preload
+    isolation) gets its own instance the first time it asks for one.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls):
+        with cls._instance_lock:
+            if cls._instance is None or cls._instance.pid != os.getpid():
+                cls._instance = cls()
+            return cls._instance
+
     def __init__(self):
         load_dotenv()
+        self.pid = os.getpid()
+        self.ranker = BM25()
+        # Skip documents that cannot reach the top results instead of scoring every posting
+        self.pruning = os.getenv("SEARCH_TOP_K_PRUNING", "true").lower() in ("1", "true", "yes")
+
+        # Partial matches resolve to at most this many terms per query word, best first
+        self.similarity_threshold = float(os.getenv("SEARCH_SIMILARITY_THRESHOLD", "0.3"))
+        self.partial_term_limit = int(os.getenv("SEARCH_PARTIAL_TERM_LIMIT", "100"))
+        self.has_trigram_index = None
+
+        # Queries are ranked at least rank_depth documents deep, deeper as later pages are asked for, up to max_results
+        self.max_results = int(os.getenv("SEARCH_MAX_RESULTS", "100"))
+        self.rank_depth = int(os.getenv("SEARCH_RANK_DEPTH", "20"))
+
         self.logger = logging.getLogger(__name__)
         logging.basicConfig(level=logging.INFO)
 
+        # Results of popular queries are served from a cache until the indexer publishes a new generation
+        self.cache = create_cache(
+            os.getenv("SEARCH_CACHE_BACKEND", "memory"),
+            path=os.getenv("SEARCH_CACHE_PATH"),
+            max_bytes=int(os.getenv("SEARCH_CACHE_MAX_BYTES", "0")) or None,
+            ttl=float(os.getenv("SEARCH_CACHE_TTL", "300")),
+        )
+        self.generation_check_interval = float(os.getenv("SEARCH_CACHE_GENERATION_CHECK_SECONDS", "5"))
+        self.generation = None
+        self.generation_checked_at = 0.0
+
+        # Autocomplete dictionary, rebuilt in the background when a new generation is published
+        self.suggestions = None
+        self.suggestions_generation = None
+        self.suggestions_lock = threading.Lock()
+        self.suggestions_loading = False
+
+        # Connections idle for longer than this are pinged before being handed out
+        self.health_check_after = float(os.getenv("DB_POOL_HEALTH_CHECK_SECONDS", "30"))
+
+        # Searches run against Postgres, or against on-disk segments exported by the indexer.
+        # Segments match partial words by prefix only, where Postgres also finds them inside terms.
+        self.backend = os.getenv("SEARCH_BACKEND", "postgres")
+        self.segments = None
+        self.pools = []  # (pool, semaphore) of every index shard, or of the main database alone
+        self.shard_executor = None
+
+        if self.backend == "segments":
+            try:
+                self.segments = SegmentIndex(os.getenv("SEARCH_SEGMENT_DIR", "segments"))
+            except Exception as e:
+                self.logger.error(f"Failed to open the index segments: {e}")
+            return
+
+        # A sharded index (INDEX_SHARDS) is searched on every shard at once, see execute_sharded_search()
         try:
-            self.connection = self.get_connection(
-                os.getenv("DB_NAME"),
-                os.getenv("DB_HOST"),
-                os.getenv("DB_PASSWORD"),
-                os.getenv("DB_PORT"),
-                os.getenv("DB_USER"),
-            )
+            max_connections = int(os.getenv("DB_POOL_MAX", "10"))
+            shards = load_shards() or [Shard("main")]
+            self.pools = [
+                self.get_pool(shard, int(os.getenv("DB_POOL_MIN", "1")), max_connections) for shard in shards
+            ]
+            if len(shards) > 1:
+                self.shard_executor = ThreadPoolExecutor(len(shards) * max_connections, thread_name_prefix="shard-search")
         except Exception as e:
             self.logger.error(f"Failed to initialize the database: {e}")
-            self.connection = None
+            self.pools = []
 
-    def get_connection(self, db_name, db_host, db_password, db_port, db_user):
-        if not all([db_name, db_host, db_password, db_port, db_user]):
-            raise ValueError("One or more required environment variables are missing.")
+        atexit.register(self.close)
+
+    def get_pool(self, shard, min_connections, max_connections):
+        """A connection pool to a shard and the semaphore bounding its checkouts."""
         try:
-            connection = psycopg2.connect(
-                dbname=db_name,
-                user=db_user,
-                password=db_password,
-                host=db_host,
-                port=db_port,
+            # Up to min_connections stay open between requests, the rest are closed when returned
+            pool = psycopg2.pool.ThreadedConnectionPool(
+                min_connections,
+                max_connections,
+                connection_factory=PooledConnection,
+                **shard.connection_parameters(),
             )
-            self.logger.info("Database connection successful.")
-            return connection
+            # ThreadedConnectionPool raises when exhausted, make callers wait instead
+            available = threading.BoundedSemaphore(max_connections)
+            self.logger.info(f"Database connection pool created for {shard.name}.")
+            return pool, available
         except Exception as error:
             self.logger.error(f"Error connecting to the database: {error}")
             raise error
 
-    def ensure_connection(self):
+    def is_healthy(self, connection):
+        if connection.closed:
+            return False
+        if time.monotonic() - connection.last_used < self.health_check_after:
+            return True
         try:
-            self.connection.cursor().execute("SELECT 1")
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
         except (Exception, psycopg2.OperationalError):
-            self.logger.warning("Reconnecting to the database...")
-            self.connection = self.get_connection(
-                os.getenv("DB_NAME"),
-                os.getenv("DB_HOST"),
-                os.getenv("DB_PASSWORD"),
-                os.getenv("DB_PORT"),
-                os.getenv("DB_USER"),
-            )
+            return False
+
+    @contextmanager
+    def connection(self, shard=0):
+        """Check a healthy connection to a shard out of its pool for the duration of the block."""
+        if not self.pools:
+            raise psycopg2.OperationalError("The database connection pool is unavailable.")
+        pool, available = self.pools[shard]
+
+        available.acquire()
+        try:
+            connection = pool.getconn()
+            while not self.is_healthy(connection):
+                self.logger.warning("Discarding a broken pooled connection...")
+                pool.putconn(connection, close=True)
+                connection = pool.getconn()
+
+            try:
+                yield connection
+            finally:
+                if not connection.closed:
+                    # Never hand out a connection still inside a transaction
+                    connection.rollback()
+                connection.last_used = time.monotonic()
+                pool.putconn(connection, close=bool(connection.closed))
+        finally:
+            available.release()
+
+    def fan_out(self, task):
+        """Run task(shard) on every shard concurrently, returning the results in shard order."""
+        if self.shard_executor is None:
+            return [task(shard) for shard in range(len(self.pools))]
+        return list(self.shard_executor.map(task, range(len(self.pools))))
+
+    def close(self):
+        if self.pid != os.getpid():
+            return
+        for pool, _ in self.pools:
+            if not pool.closed:
+                pool.closeall()
+                self.logger.info("Database connection pool closed.")
+        if self.shard_executor is not None:
+            self.shard_executor.shutdown(wait=False)
+
+    def match_partial_terms(self, cursor, query_words):
+        """
+        Find the dictionary terms that contain, or are spelled like, each query word.
+
+        With pg_trgm both kinds of match are answered from the trigram GIN
+        index and ranked by trigram similarity, so only the best terms above
+        the similarity threshold are returned. Without it the dictionary is
+        scanned with LIKE.
+        """
+        if self.has_trigram_index is None:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm';")
+            self.has_trigram_index = cursor.fetchone() is not None
+
+        patterns = [
+            "%" + word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            for word in query_words
+        ]
+
+        if self.has_trigram_index:
+            cursor.execute("SET LOCAL pg_trgm.similarity_threshold = %s;", (self.similarity_threshold,))
+            cursor.execute("""
+                SELECT q.word, t.term_id, t.term, t.df, t.max_tf, t.min_length, t.similarity
+                FROM unnest(%s::text[], %s::text[]) AS q (word, pattern)
+                CROSS JOIN LATERAL (
+                    SELECT term_id, term, df, max_tf, min_length, similarity(term, q.word) AS similarity
+                    FROM terms
+                    WHERE term %% q.word OR term LIKE q.pattern
+                    ORDER BY similarity DESC, term
+                    LIMIT %s
+                ) t;
+            """, (query_words, patterns, self.partial_term_limit))
+        else:
+            cursor.execute("""
+                SELECT q.word, t.term_id, t.term, t.df, t.max_tf, t.min_length, 1.0::real AS similarity
+                FROM unnest(%s::text[], %s::text[]) AS q (word, pattern)
+                CROSS JOIN LATERAL (
+                    SELECT term_id, term, df, max_tf, min_length FROM terms WHERE term LIKE q.pattern LIMIT %s
+                ) t;
+            """, (query_words, patterns, self.partial_term_limit))
+        return cursor.fetchall()
+
+    def fetch_positions(self, cursor, term_ids, doc_ids=None):
+        """{term_id: (doc_ids, counts, positions)} of the given terms, see match_phrase()."""
+        if doc_ids is None:
+            cursor.execute("""
+                SELECT term_id, doc_id, tf, position_deltas FROM postings
+                WHERE term_id = ANY(%s);
+            """, (list(term_ids),))
+        else:
+            cursor.execute("""
+                SELECT term_id, doc_id, tf, position_deltas FROM postings
+                WHERE term_id = ANY(%s) AND doc_id = ANY(%s);
+            """, (list(term_ids), [int(doc_id) for doc_id in doc_ids]))
+
+        rows = {term_id: ([], [], []) for term_id in term_ids}
+        for term_id, doc_id, tf, position_deltas in cursor.fetchall():
+            term_doc_ids, counts, blobs = rows[term_id]
+            if position_deltas is None:
+                # Migrated from reverse_index without positions, the phrase cannot match there
+                position_deltas, tf = b"", 0
+            term_doc_ids.append(doc_id)
+            counts.append(tf)
+            blobs.append(bytes(position_deltas))
+        return {
+            term_id: (np.asarray(term_doc_ids, dtype=np.int64), np.asarray(counts, dtype=np.int64), decode_positions(blobs, counts))
+            for term_id, (term_doc_ids, counts, blobs) in rows.items()
+        }
+
+    def phrase_documents(self, cursor, terms, slop, allowed=None):
+        """
+        Sorted doc_ids of the documents, among allowed, holding a phrase of (offset, term_id, df) terms.
+
+        The positions of the rarest term are read first and the others only
+        for the documents it occurs in, so a phrase costs about what
+        intersecting its terms' posting lists does.
+        """
+        rarest = min(terms, key=lambda term: term[2])[1]
+        positions = self.fetch_positions(cursor, [rarest], allowed)
+        candidates = np.unique(positions[rarest][0])
+        others = {term_id for _, term_id, _ in terms if term_id != rarest}
+        if others and len(candidates):
+            positions.update(self.fetch_positions(cursor, others, candidates))
+        return restrict(match_phrase([(offset, *positions[term_id]) for offset, term_id, _ in terms], slop), allowed)
+
+    def current_generation(self):
+        """The index generation last published by the indexer, re-read every few seconds."""
+        if self.backend == "segments":
+            if self.segments is None:
+                raise RuntimeError("The index segments are unavailable.")
+            self.segments.refresh()
+            return self.segments.generation
+
+        def read_generation(shard):
+            with self.connection(shard) as connection, connection.cursor() as cursor:
+                cursor.execute("SELECT generation FROM index_stats;")
+                row = cursor.fetchone()
+            return row[0] if row else 0
+
+        now = time.monotonic()
+        if self.generation is None or now - self.generation_checked_at >= self.generation_check_interval:
+            # Every shard counts its own generations, publishing on any of them changes the sum
+            generation = sum(self.fan_out(read_generation))
+
+            if self.generation is not None and generation != self.generation and self.cache is not None:
+                self.logger.info(f"Index generation {generation} published, clearing the query cache.")
+                self.cache.clear()
+            self.generation = generation
+            self.generation_checked_at = now
+        return self.generation
+
+    def load_suggestions(self):
+        """Build the autocomplete index from the term dictionary of the current backend."""
+        if self.backend == "segments":
+            if self.segments is None:
+                raise RuntimeError("The index segments are unavailable.")
+            vocabulary = self.segments.vocabulary(self.segments.snapshot())
+        else:
+            def read_vocabulary(shard):
+                with self.connection(shard) as connection, connection.cursor() as cursor:
+                    cursor.execute("""SELECT term, df FROM terms WHERE df > 0 ORDER BY term COLLATE "C";""")
+                    return cursor.fetchall()
+
+            vocabularies = self.fan_out(read_vocabulary)
+            vocabulary = vocabularies[0] if len(vocabularies) == 1 else merge_vocabularies(vocabularies)
+        return PrefixIndex([term for term, _ in vocabulary], [df for _, df in vocabulary])
+
+    def _reload_suggestions(self, generation):
+        try:
+            suggestions = self.load_suggestions()
+            self.suggestions, self.suggestions_generation = suggestions, generation
+            self.logger.info(f"Autocomplete reloaded with {len(suggestions)} terms for generation {generation}.")
+        except Exception as error:
+            self.logger.error(f"Error reloading autocomplete: {error}")
+        finally:
+            self.suggestions_loading = False
+
+    def suggestion_index(self):
+        """
+        The autocomplete index, loaded on first use.
+
+        When the indexer publishes a new generation the index is rebuilt on
+        a background thread and lookups keep using the previous one meanwhile.
+        """
+        generation = self.current_generation()
+        if self.suggestions is None:
+            with self.suggestions_lock:
+                if self.suggestions is None:
+                    self.suggestions, self.suggestions_generation = self.load_suggestions(), generation
+        elif generation != self.suggestions_generation:
+            with self.suggestions_lock:
+                if self.suggestions_loading:
+                    return self.suggestions
+                self.suggestions_loading = True
+            threading.Thread(target=self._reload_suggestions, args=(generation,), name="suggestions-reload", daemon=True).start()
+        return self.suggestions
+
+    def suggest(self, query, limit=10):
+        """Completions of the last word of a query, most frequent first, as whole queries."""
+        started = time.perf_counter()
+        words = query.split()
+        if not words or query[-1:].isspace():
+            return []
+        # A word opening a quoted phrase is completed inside the quote
+        quote = '"' if words[-1].startswith('"') else ""
+        prefix = words[-1][len(quote):].lower()
+        if not prefix:
+            return []
+        try:
+            completions = self.suggestion_index().complete(prefix, limit)
+        except Exception as error:
+            self.logger.error(f"Error during autocomplete: {error}")
+            return []
+        head = " ".join(words[:-1])
+        SEARCH_STAGE_SECONDS.observe(time.perf_counter() - started, backend=self.backend, stage="suggest")
+        return [f"{head} {quote}{term}".lstrip() for term, _ in completions]
 
     def search(self, query):
-        self.ensure_connection()
-        query_words = [word.lower().strip() for word in query.split()]  # Normalize query words
-        url_scores = {}
+        return self.search_with_timings(query)[0]
+
+    def search_with_timings(self, query):
+        """Search the index, returning up to max_results results and the milliseconds spent per step."""
+        page, timings = self.search_page(query, limit=self.max_results)
+        return page["results"], timings
+
+    def search_page(self, query, limit=10, offset=0):
+        """
+        Search the index for one page of results, returning it and the milliseconds spent per step.
+
+        The page is {"results": [...], "offset": offset, "has_more": bool}.
+        A query is ranked only as deep as its pages need and the ranked
+        documents are cached until the next index generation, so a following
+        page only fetches its own result cards and snippets, unless it lies
+        deeper than the query was ranked. Whole pages are cached as well.
+        """
+        timings = {}
+        search_started = time.perf_counter()
 
         try:
-            with self.connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+            use_cache = self.cache is not None
+            if use_cache:
+                try:
+                    generation = self.current_generation()
+                except Exception as error:
+                    self.logger.warning(f"Index generation unavailable, bypassing the query cache: {error}")
+                    use_cache = False
+
+            ranked = None
+            if use_cache:
+                key = normalize_query(query)
+                page_key = f"{key}\n{offset}:{limit}"
+                page = self.cache.get(page_key, generation)
+                if page is None:
+                    ranked = self.cache.get(key, generation)
+                timings["cache"] = (time.perf_counter() - search_started) * 1000
+                if page is not None:
+                    timings["total"] = timings["cache"]
+                    self.record_metrics("cache_hit", timings)
+                    return page, timings
+
+            outcome = "ranking_cache_hit"
+            if ranked is None or (len(ranked["docs"]) < offset + limit and not ranked["complete"]):
+                outcome = "cache_miss" if use_cache else "uncached"
+                # Rank deep enough for this page, and at least twice as deep as last time
+                depth = max(self.rank_depth, offset + limit, 2 * len(ranked["docs"]) if ranked else 0)
+                ranked = self.execute_search(query, timings, min(depth, self.max_results))
+                if use_cache:
+                    self.cache.set(key, generation, ranked)
+
+            page = {
+                "results": self.fetch_results(ranked["docs"][offset:offset + limit], ranked["terms"], timings),
+                "offset": offset,
+                "has_more": len(ranked["docs"]) > offset + limit or not ranked["complete"],
+            }
+            if use_cache:
+                self.cache.set(page_key, generation, page)
+
+            timings["total"] = (time.perf_counter() - search_started) * 1000
+            self.record_metrics(outcome, timings)
+            steps = ", ".join(f"{name}={elapsed:.1f}" for name, elapsed in timings.items() if name != "total")
+            self.logger.info(f"Search for {query!r} took {timings['total']:.1f} ms ({steps})")
+            return page, timings
+        except Exception as error:
+            self.logger.error(f"Error during search: {error}")
+            SEARCHES.inc(backend=self.backend, outcome="error")
+            timings["total"] = (time.perf_counter() - search_started) * 1000
+            return {"results": [], "offset": offset, "has_more": False}, timings
+
+    def ranked_documents(self, sorted_docs, terms, depth):
+        """
+        What ranking a query leaves for its pages: the top [shard, doc_id, score]
+        documents, the terms their snippets highlight, and whether there are
+        no more documents to rank.
+        """
+        return {
+            "docs": [[shard, int(doc_id), float(score)] for shard, doc_id, score in sorted_docs],
+            "terms": sorted(terms),
+            "complete": len(sorted_docs) < depth or depth >= self.max_results,
+        }
+
+    def fetch_results(self, docs, terms, timings):
+        """The results of ranked [shard, doc_id, score] documents, with snippets highlighting the terms."""
+        step_started = time.perf_counter()
+
+        if self.backend == "segments":
+            if self.segments is None:
+                raise RuntimeError("The index segments are unavailable.")
+            # Read the result cards of the documents from the segments
+            cards = [self.segments.cards([doc_id for _, doc_id, _ in docs], self.segments.snapshot())]
+        else:
+            # Fetch the result cards of the documents from their shards, one round-trip each
+            def fetch_cards(shard):
+                doc_ids = [doc_id for doc_shard, doc_id, _ in docs if doc_shard == shard]
+                if not doc_ids:
+                    return {}
+                with self.connection(shard) as connection:
+                    with connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+                        cursor.execute("""
+                            SELECT doc_id, url, title, description, added_at, excerpt
+                            FROM result_cards WHERE doc_id = ANY(%s);
+                        """, (doc_ids,))
+                        return {card['doc_id']: card for card in cursor.fetchall()}
+
+            cards = self.fan_out(fetch_cards)
+
+        results = []
+        for shard, doc_id, score in docs:
+            page = cards[shard].get(doc_id)
+            if page:
+                results.append({
+                    "url": page['url'],
+                    "title": page['title'] if page['title'] else "No Title",
+                    "description": page['description'] if page['description'] else "No Description",
+                    # Segments store the day already formatted
+                    "added_at": page['added_at'].strftime("%Y-%m-%d") if hasattr(page['added_at'], "strftime") else page['added_at'],
+                    "score": score,
+                    "excerpt": page.get('excerpt'),
+                })
+        now = time.perf_counter()
+        timings["hydration"] = (now - step_started) * 1000
+
+        # Cut a snippet around the query terms out of every excerpt
+        self.add_snippets(results, set(terms))
+        timings["snippets"] = (time.perf_counter() - now) * 1000
+        return results
+
+    def record_metrics(self, outcome, timings):
+        SEARCHES.inc(backend=self.backend, outcome=outcome)
+        for name, elapsed in timings.items():
+            SEARCH_STAGE_SECONDS.observe(elapsed / 1000, backend=self.backend, stage=name)
+
+    def execute_search(self, query, timings, depth=100):
+        """
+        Rank the depth best documents of a query, recording the milliseconds spent per step in timings.
+
+        Returns ranked_documents(); the results themselves are read by fetch_results().
+        """
+        if self.backend == "segments":
+            return self.execute_segment_search(query, timings, depth)
+        if len(self.pools) > 1:
+            return self.execute_sharded_search(query, timings, depth)
+
+        query_words, phrases = parse_query(query)
+        term_weights = {}  # term_id -> how strongly the query asks for the term
+        term_statistics = {}  # term_id -> (df, max_tf, min_length)
+        exact_terms = {}  # term -> (term_id, df) of the query words found in the dictionary
+        matched_terms = set()  # terms highlighted in snippets
+
+        step_started = time.perf_counter()
+
+        def end_step(name):
+            nonlocal step_started
+            now = time.perf_counter()
+            timings[name] = (now - step_started) * 1000
+            step_started = now
+
+        with self.connection() as connection:
+            with connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+                cursor.execute("SELECT doc_count, total_length FROM index_stats;")
+                stats = cursor.fetchone()
+                doc_count = stats['doc_count'] if stats else 0
+                avg_length = stats['total_length'] / doc_count if doc_count else 1.0
+
                 # Step 1: Exact match search
-                for word in query_words:
-                    cursor.execute("""
-                        SELECT urls FROM reverse_index WHERE word = %s;
-                    """, (word,))
-                    result = cursor.fetchone()
-                    if result and result['urls']:
-                        urls = result['urls']
-                        for url in urls:
-                            url_scores[url] = url_scores.get(url, 0) + 1
+                cursor.execute("""
+                    SELECT term_id, term, df, max_tf, min_length FROM terms WHERE term = ANY(%s);
+                """, (query_words,))
+                for row in cursor.fetchall():
+                    term_weights[row['term_id']] = term_weights.get(row['term_id'], 0) + query_words.count(row['term'])
+                    term_statistics[row['term_id']] = (row['df'], row['max_tf'], row['min_length'])
+                    exact_terms[row['term']] = (row['term_id'], row['df'])
+                end_step("exact_match")
 
                 # Step 2: Partial match search
-                for word in query_words:
-                    cursor.execute("""
-                        SELECT word, urls FROM reverse_index WHERE word LIKE %s LIMIT 100;
-                    """, (f"%{word}%",))  # Limit the results for partial match
-                    results = cursor.fetchall()
-                    for row in results:
-                        urls = row['urls']
-                        for url in urls:
-                            url_scores[url] = url_scores.get(url, 0) + 0.5  # Partial matches get lower weight
+                for row in self.match_partial_terms(cursor, query_words):
+                    # Partial matches get lower weight, scaled by how close the term is
+                    term_weights[row['term_id']] = term_weights.get(row['term_id'], 0) + 0.5 * row['similarity']
+                    term_statistics[row['term_id']] = (row['df'], row['max_tf'], row['min_length'])
+                    matched_terms.add(row['term'])
+                end_step("partial_match")
+            matched_terms.update(exact_terms)
+
+            with connection.cursor() as cursor:
+                # Step 3: Keep only the documents holding every quoted phrase
+                allowed = self.phrase_filter(cursor, phrases, exact_terms)
+                if phrases:
+                    end_step("phrases")
+
+            # Step 4: Rank documents with BM25 (only take the top depth)
+            with connection.cursor() as cursor:
+                sorted_docs = self.rank_documents(cursor, {
+                    term_id: (weight * self.ranker.idf(term_statistics[term_id][0], doc_count), *term_statistics[term_id])
+                    for term_id, weight in term_weights.items()
+                }, avg_length, allowed, depth)
+                end_step("ranking")
+
+        return self.ranked_documents([(0, doc_id, score) for doc_id, score in sorted_docs], matched_terms, depth)
+
+    def execute_sharded_search(self, query, timings, depth=100):
+        """
+        Rank a query on every index shard concurrently and merge their top documents.
+
+        Each round asks all the shards at once: for their corpus statistics
+        and partial matches, for the document frequencies of the chosen
+        terms, and for their top depth documents. The shards score with the
+        statistics of the whole index, so the best documents of the union
+        are among the top documents of their shards, and the merged ranking
+        is the one a single index would make. Phrases are matched within
+        each shard during the ranking round.
+        """
+        query_words, phrases = parse_query(query)
+
+        step_started = time.perf_counter()
+
+        def end_step(name):
+            nonlocal step_started
+            now = time.perf_counter()
+            timings[name] = (now - step_started) * 1000
+            step_started = now
 
-                # Step 3: Sort URLs by score in descending order (only take top 100)
-                sorted_urls = heapq.nlargest(100, url_scores.items(), key=lambda x: x[1])
+        # Step 1: Corpus statistics and partial matches of every shard
+        def match(shard):
+            with self.connection(shard) as connection:
+                with connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+                    cursor.execute("SELECT doc_count, total_length FROM index_stats;")
+                    return cursor.fetchone(), self.match_partial_terms(cursor, query_words)
 
-                # Step 4: Fetch titles and descriptions for top URLs
-                result_array = []
+        matches = self.fan_out(match)
+        doc_count = sum(stats['doc_count'] for stats, _ in matches if stats)
+        total_length = sum(stats['total_length'] for stats, _ in matches if stats)
+        avg_length = total_length / doc_count if doc_count else 1.0
 
-                for url, score in sorted_urls:
+        # Every word keeps its best partial matches over all the shards, as with a single dictionary
+        similarities = {}  # word -> {term: similarity}
+        for _, rows in matches:
+            for row in rows:
+                similarities.setdefault(row['word'], {})[row['term']] = row['similarity']
+        partial_matches = [
+            (term, similarity)
+            for word in query_words
+            for term, similarity in sorted(
+                similarities.get(word, {}).items(), key=lambda item: (-item[1], item[0])
+            )[:self.partial_term_limit]
+        ]
+        end_step("partial_match")
+
+        # Step 2: Exact match search, and the document frequencies of every term over all the shards
+        lookup_terms = sorted(set(query_words) | {term for term, _ in partial_matches})
+
+        def lookup(shard):
+            with self.connection(shard) as connection:
+                with connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
                     cursor.execute("""
-                        SELECT metadata->>'page_title' as title, metadata->>'page_description' as description, added_at
-                        FROM pages WHERE url = %s;
-                    """, (url,))
-                    page = cursor.fetchone()
-                    if page:
-                        result_array.append({
-                            "url": url.strip().split("?")[0].split("#")[0],
-                            "title": page['title'] if page['title'] else "No Title",
-                            "description": page['description'] if page['description'] else "No Description",
-                            "added_at": page['added_at'].strftime("%Y-%m-%d"),
-                            "score": score
-                        })
-
-                return result_array
-        except Exception as error:
-            self.logger.error(f"Error during search: {error}")
-            return []
\ No newline at end of file
+                        SELECT term_id, term, df, max_tf, min_length FROM terms WHERE term = ANY(%s);
+                    """, (lookup_terms,))
+                    return {row['term']: row for row in cursor.fetchall()}
+
+        dictionaries = self.fan_out(lookup)
+        dfs = {}  # term -> document frequency in the whole index
+        for dictionary in dictionaries:
+            for term, row in dictionary.items():
+                dfs[term] = dfs.get(term, 0) + row['df']
+
+        term_weights = {}  # term -> how strongly the query asks for the term
+        for word in query_words:
+            if word in dfs:
+                term_weights[word] = term_weights.get(word, 0) + 1
+        for term, similarity in partial_matches:
+            # Partial matches get lower weight, scaled by how close the term is
+            term_weights[term] = term_weights.get(term, 0) + 0.5 * similarity
+        weights = {term: weight * self.ranker.idf(dfs[term], doc_count) for term, weight in term_weights.items()}
+        end_step("exact_match")
+
+        # Step 3: Every shard keeps the documents holding every quoted phrase and ranks them (only take the top depth)
+        def rank(shard):
+            dictionary = dictionaries[shard]
+            with self.connection(shard) as connection, connection.cursor() as cursor:
+                allowed = self.phrase_filter(cursor, phrases, {
+                    term: (row['term_id'], row['df']) for term, row in dictionary.items()
+                })
+                return self.rank_documents(cursor, {
+                    dictionary[term]['term_id']: (
+                        weight, dictionary[term]['df'], dictionary[term]['max_tf'], dictionary[term]['min_length']
+                    )
+                    for term, weight in weights.items() if term in dictionary
+                }, avg_length, allowed, depth)
+
+        top = merge_top_documents(self.fan_out(rank), depth)
+        end_step("ranking")
+
+        return self.ranked_documents(top, term_weights, depth)
+
+    def phrase_filter(self, cursor, phrases, exact_terms):
+        """
+        Sorted doc_ids of the documents holding every phrase, None without phrases.
+
+        exact_terms maps the query words found in the dictionary to their (term_id, df).
+        """
+        allowed = None
+        for phrase_terms, slop in phrases:
+            if any(term not in exact_terms for _, term in phrase_terms):
+                return np.zeros(0, dtype=np.int64)
+            allowed = self.phrase_documents(cursor, [
+                (offset, *exact_terms[term]) for offset, term in phrase_terms
+            ], slop, allowed)
+        return allowed
+
+    def rank_documents(self, cursor, terms, avg_length, allowed=None, k=100):
+        """
+        The top k (doc_id, score) documents by BM25.
+
+        terms maps a term_id to (weight, df, max_tf, min_length), and allowed
+        restricts the ranking to the given documents, see phrase_filter().
+        """
+        def fetch_postings(term_ids, doc_ids=None):
+            if not term_ids:
+                return {}
+            if doc_ids is None:
+                cursor.execute("""
+                    SELECT p.term_id, p.doc_id, p.tf, COALESCE(d.length, 0)
+                    FROM postings p JOIN documents d ON d.doc_id = p.doc_id
+                    WHERE p.term_id = ANY(%s);
+                """, (list(term_ids),))
+            else:
+                cursor.execute("""
+                    SELECT p.term_id, p.doc_id, p.tf, COALESCE(d.length, 0)
+                    FROM postings p JOIN documents d ON d.doc_id = p.doc_id
+                    WHERE p.term_id = ANY(%s) AND p.doc_id = ANY(%s);
+                """, (list(term_ids), [int(doc_id) for doc_id in doc_ids]))
+            return group_postings(cursor.fetchall(), term_ids)
+
+        if self.pruning and allowed is None:
+            return self.ranker.top_k_pruned(k, terms, avg_length, fetch_postings, fetch_postings)
+
+        # Phrase matches are few, their postings are read for those documents only
+        postings = fetch_postings(list(terms), allowed)
+        return self.ranker.top_k(
+            k,
+            np.concatenate([postings[term_id][0] for term_id in terms]) if postings else [],
+            np.concatenate([np.full(len(postings[term_id][0]), terms[term_id][0]) for term_id in terms]) if postings else [],
+            np.concatenate([postings[term_id][1] for term_id in terms]) if postings else [],
+            np.concatenate([postings[term_id][2] for term_id in terms]) if postings else [],
+            avg_length,
+        )
+
+    def add_snippets(self, results, terms):
+        """Replace the excerpt of every result by a snippet highlighting the terms, None when none of them occur in it."""
+        for result in results:
+            result["snippet"] = make_snippet(result.pop("excerpt", None), terms)
+
+    def execute_segment_search(self, query, timings, depth=100):
+        """Rank a query against the memory-mapped segments, without any database call."""
+        if self.segments is None:
+            raise RuntimeError("The index segments are unavailable.")
+
+        query_words, phrases = parse_query(query)
+        term_weights = {}  # term -> how strongly the query asks for the term
+
+        step_started = time.perf_counter()
+
+        def end_step(name):
+            nonlocal step_started
+            now = time.perf_counter()
+            timings[name] = (now - step_started) * 1000
+            step_started = now
+
+        snapshot = self.segments.snapshot()
+        doc_count = self.segments.doc_count
+        avg_length = self.segments.total_length / doc_count if doc_count else 1.0
+
+        # Step 1: Exact match search
+        for word in query_words:
+            if self.segments.contains(word, snapshot):
+                term_weights[word] = term_weights.get(word, 0) + 1
+        end_step("exact_match")
+
+        # Step 2: Partial match search, by prefix only over the sorted term dictionary (see prefix_terms())
+        for word in query_words:
+            for term, _ in self.segments.prefix_terms(word, self.partial_term_limit, snapshot):
+                term_weights[term] = term_weights.get(term, 0) + 0.5  # Partial matches get lower weight
+        end_step("partial_match")
+
+        # Step 3: Keep only the documents holding every quoted phrase
+        allowed = None  # doc_ids matching the phrases, None without phrases
+        for phrase_terms, slop in phrases:
+            if not all(self.segments.contains(term, snapshot) for _, term in phrase_terms):
+                allowed = np.zeros(0, dtype=np.int64)
+                break
+            allowed = restrict(match_phrase([
+                (offset, *self.segments.positions(term, snapshot)) for offset, term in phrase_terms
+            ], slop), allowed)
+        if phrases:
+            end_step("phrases")
+
+        # Step 4: Rank documents with BM25 (only take the top depth)
+        postings = {}
+        terms = {}
+        for term, weight in term_weights.items():
+            term_doc_ids, term_tfs, term_lengths = self.segments.postings(term, snapshot)
+            # The live postings of a term give its exact document frequency
+            df = len(term_doc_ids)
+            if allowed is not None:
+                keep = np.isin(term_doc_ids, allowed)
+                term_doc_ids, term_tfs, term_lengths = term_doc_ids[keep], term_tfs[keep], term_lengths[keep]
+            order = np.argsort(term_doc_ids, kind="stable")
+            postings[term] = (term_doc_ids[order], term_tfs[order].astype(np.int64), term_lengths[order])
+            terms[term] = (weight * self.ranker.idf(df, doc_count), df, *self.segments.term_bounds(term, snapshot))
+
+        if self.pruning and allowed is None:
+            sorted_docs = self.ranker.top_k_pruned(
+                depth,
+                terms,
+                avg_length,
+                lambda keys: {key: postings[key] for key in keys},
+                lambda keys, doc_ids: {key: postings[key] for key in keys},
+            )
+        else:
+            sorted_docs = self.ranker.top_k(
+                depth,
+                np.concatenate([postings[term][0] for term in terms]) if terms else [],
+                np.concatenate([np.full(len(postings[term][0]), terms[term][0]) for term in terms]) if terms else [],
+                np.concatenate([postings[term][1] for term in terms]) if terms else [],
+                np.concatenate([postings[term][2] for term in terms]) if terms else [],
+                avg_length,
+            )
+        end_step("ranking")
+
+        return self.ranked_documents([(0, doc_id, score) for doc_id, score in sorted_docs], term_weights, depth)
@@ -1,9 +1,14 @@
 # Make a simple Flask app that serves the frontend
 
-import datetime
-from flask import Flask, render_template, redirect, request
+import os
+import hmac
+from flask import Flask, render_template, redirect, request, make_response, jsonify
 from frontend.database import Database
+from frontend.pagination import decode_cursor, encode_cursor
+from common.metrics import CONTENT_TYPE, REGISTRY
 
+PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
 
 app = Flask(__name__)
 
@@ -17,17 +22,98 @@ def index():
     return render_template("index.html")
 
 
+def search_page(args):
+    """
+    Run the search a request asks for: ?query= (and ?limit=) for a first page, ?cursor= for the following ones.
+
+    Returns the query, the page (see Database.search_page()), the cursor of
+    the next page or None, and the milliseconds spent per step. Raises
+    ValueError for a cursor that is malformed or made for another query.
+    """
+    query = args.get("query", "")
+    limit = max(1, min(args.get("limit", PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    offset = 0
+    if args.get("cursor"):
+        cursor_query, offset = decode_cursor(args["cursor"])
+        if query and query != cursor_query:
+            raise ValueError("The cursor belongs to another query")
+        query = cursor_query
+
+    page, timings = Database.shared().search_page(query, limit, offset)
+    next_cursor = encode_cursor(query, offset + limit) if page["has_more"] else None
+    return query, page, next_cursor, timings
+
+def with_server_timing(response, timings):
+    # Per-step search latency, visible in the browser's network panel
+    response.headers["Server-Timing"] = ", ".join(
+        f"{name};dur={elapsed:.1f}" for name, elapsed in timings.items()
+    )
+    return response
+
 @app.route("/search", methods=["GET"])
 def search():
-    query = request.args.get("query")
+    if not request.args.get("query") and not request.args.get("cursor"):
+        return redirect("/")
 
-    if not query:
+    try:
+        query, page, next_cursor, timings = search_page(request.args)
+    except ValueError:
         return redirect("/")
-    
 
-    start_time = datetime.datetime.now()
-    results = Database().search(query)
-    return render_template("search.html", query=query, results=results, human_readable_time_interval_seconds=(datetime.datetime.now() - start_time).total_seconds())
+    response = make_response(render_template(
+        "search.html", query=query, results=page["results"], offset=page["offset"], next_cursor=next_cursor, timings=timings
+    ))
+    return with_server_timing(response, timings)
+
+@app.route("/api/search", methods=["GET"])
+def api_search():
+    if not request.args.get("query") and not request.args.get("cursor"):
+        return jsonify({"error": "A query or a cursor is required"}), 400
+
+    try:
+        query, page, next_cursor, timings = search_page(request.args)
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+
+    response = jsonify({
+        "query": query,
+        "offset": page["offset"],
+        "results": page["results"],
+        "next_cursor": next_cursor,
+        "timings": {name: round(elapsed, 3) for name, elapsed in timings.items()},
+    })
+    return with_server_timing(response, timings)
+
+@app.route("/suggest", methods=["GET"])
+def suggest():
+    query = request.args.get("query", "")
+    limit = max(1, min(request.args.get("limit", 10, type=int), 20))
+    return jsonify({"query": query, "suggestions": Database.shared().suggest(query, limit)})
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    if not internal_access_allowed():
+        return "Not Found", 404
+    cache = Database.shared().cache
+    return jsonify(cache.describe() if cache else {"backend": "none"})
+
+def internal_access_allowed():
+    """
+    Whether the request may read the internal /metrics and /cache/stats endpoints.
+
+    They are off unless METRICS_TOKEN is set, and then answer only requests
+    bearing it (Authorization: Bearer <token>), as Prometheus sends it.
+    """
+    token = os.getenv("METRICS_TOKEN")
+    if not token:
+        return False
+    return hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode())
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    if not internal_access_allowed():
+        return "Not Found", 404
+    return REGISTRY.render(), 200, {"Content-Type": CONTENT_TYPE}
 
 @app.route("/feeling-lucky", methods=["GET"])
 def feeling_lucky():
@@ -0,0 +1,47 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+
+SIGNATURE_BYTES = 8
+
+# Signs cursors when SEARCH_CURSOR_SECRET is unset, so they are only valid in this process
+_PROCESS_KEY = os.urandom(32)
+_warned = False
+
+
+def _signature(payload):
+    global _warned
+    key = os.getenv("SEARCH_CURSOR_SECRET", "").encode("utf-8")[:64]
+    if not key:
+        if not _warned:
+            _warned = True
+            logging.getLogger(__name__).warning(
+                "SEARCH_CURSOR_SECRET is not set: cursors are signed with a random key and only valid in this process."
+            )
+        key = _PROCESS_KEY
+    return hashlib.blake2b(payload, digest_size=SIGNATURE_BYTES, key=key).digest()
+
+
+def encode_cursor(query, offset):
+    """An opaque token for the page of a query's results starting at offset."""
+    payload = json.dumps({"q": query, "o": offset}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload + _signature(payload)).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """The (query, offset) of a token made by encode_cursor(); raises ValueError when it is not one."""
+    try:
+        token = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload, signature = token[:-SIGNATURE_BYTES], token[-SIGNATURE_BYTES:]
+        if len(token) <= SIGNATURE_BYTES or not hmac.compare_digest(signature, _signature(payload)):
+            raise ValueError("Bad cursor signature")
+        fields = json.loads(payload)
+        query, offset = fields["q"], fields["o"]
+    except (ValueError, TypeError, KeyError) as error:
+        raise ValueError("Invalid cursor") from error
+    if not isinstance(query, str) or type(offset) is not int or offset < 0:
+        raise ValueError("Invalid cursor")
+    return query, offset
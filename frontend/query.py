@@ -0,0 +1,27 @@
+import re
+from common.tokenizer import index_term
+
+PHRASE = re.compile(r'"([^"]*)"(?:~(\d+))?')
+
+
+def parse_query(query):
+    """
+    Split a query into its words and its quoted phrases.
+
+    "new york" asks for the words next to each other and in that order,
+    "new york"~3 for each of them within 3 words of its place in the phrase.
+    The words of a phrase are ranked like every other word. Returns (words,
+    phrases), a phrase being (terms, slop) where terms holds the
+    (offset, term) of its indexed words; the others only keep their place.
+    """
+    phrases = []
+    for match in PHRASE.finditer(query):
+        terms = [
+            (offset, term) for offset, term in enumerate(index_term(word) for word in match.group(1).split())
+            if term is not None
+        ]
+        if terms:
+            phrases.append((terms, int(match.group(2) or 0)))
+
+    words = PHRASE.sub(lambda match: f" {match.group(1)} ", query).replace('"', " ").split()
+    return [word.lower().strip() for word in words], phrases
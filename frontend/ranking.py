@@ -0,0 +1,184 @@
+import numpy as np
+
+
+class BM25:
+    """
+    Okapi BM25 scoring over flat arrays of postings.
+
+    All postings of a query are scored at once with numpy, so ranking a
+    few hundred thousand candidate documents is a handful of array passes.
+    """
+
+    def __init__(self, k1=1.2, b=0.75, probe_ratio=8):
+        self.k1 = k1
+        self.b = b
+        # top_k_pruned() reads a whole posting list rather than probe it for
+        # more than 1 / probe_ratio of its length in candidates
+        self.probe_ratio = probe_ratio
+
+    def idf(self, df, doc_count):
+        """Inverse document frequency of a term found in df of doc_count documents."""
+        return float(np.log(1 + (doc_count - df + 0.5) / (df + 0.5)))
+
+    def score(self, weights, tfs, lengths, avg_length):
+        """BM25 contribution of every posting, given the weight (idf) of its term."""
+        tfs = np.asarray(tfs, dtype=np.float64)
+        lengths = np.asarray(lengths, dtype=np.float64)
+        norm = self.k1 * (1 - self.b + self.b * lengths / max(avg_length, 1.0))
+        return np.asarray(weights, dtype=np.float64) * tfs * (self.k1 + 1) / (tfs + norm)
+
+    def top_k(self, k, doc_ids, weights, tfs, lengths, avg_length):
+        """
+        Sum the contributions per document and return the k best (doc_id, score) pairs.
+
+        Ties are broken by the smaller doc_id so results are deterministic.
+        """
+        if len(doc_ids) == 0:
+            return []
+
+        contributions = self.score(weights, tfs, lengths, avg_length)
+        unique_doc_ids, inverse = np.unique(np.asarray(doc_ids, dtype=np.int64), return_inverse=True)
+        scores = np.bincount(inverse, weights=contributions)
+
+        if len(scores) > k:
+            threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+            candidates = np.nonzero(scores >= threshold)[0]
+        else:
+            candidates = np.arange(len(scores))
+
+        order = np.lexsort((unique_doc_ids[candidates], -scores[candidates]))[:k]
+        return [(int(unique_doc_ids[i]), float(scores[i])) for i in candidates[order]]
+
+    def term_upper_bound(self, weight, max_tf, min_length, avg_length):
+        """
+        Highest score a term can add to any document.
+
+        The BM25 term score grows with tf and shrinks with document length,
+        so the score at the term's largest tf and shortest document bounds it.
+        Unknown statistics give an infinite bound, which disables pruning.
+        """
+        if weight <= 0:
+            return 0.0
+        if max_tf is None or min_length is None:
+            return float("inf")
+        return float(self.score(weight, max_tf, min_length, avg_length))
+
+    def top_k_pruned(self, k, terms, avg_length, fetch, lookup):
+        """
+        Top k documents by MaxScore dynamic pruning, without scoring every posting.
+
+        terms maps a term key to (weight, df, max_tf, min_length). fetch(keys)
+        returns the complete postings {key: (doc_ids, tfs, lengths)} of those
+        terms sorted by doc_id, and lookup(keys, doc_ids) the same restricted
+        to the given documents.
+
+        The rarest terms are scored first to find a threshold, the k-th best
+        score so far. The terms whose upper bounds together stay below it are
+        non-essential: a document found only in their lists cannot enter the
+        top k, so their posting lists are never read in full, only probed for
+        the candidates whose bound still reaches the threshold. Returns the
+        same (doc_id, score) list as top_k(), ties broken by the smaller doc_id.
+        """
+        if not terms:
+            return []
+
+        keys = list(terms)  # Canonical order, scores are summed in it like in top_k()
+        bounds = {
+            key: self.term_upper_bound(weight, max_tf, min_length, avg_length)
+            for key, (weight, _, max_tf, min_length) in terms.items()
+        }
+
+        # Seed the threshold with the shortest lists, until they hold k documents
+        seed_keys = []
+        seen = 0
+        for key in sorted(keys, key=lambda key: terms[key][1] or 0):
+            seed_keys.append(key)
+            seen += terms[key][1] or 0
+            if seen >= k:
+                break
+        if seen * 4 >= sum(terms[key][1] or 0 for key in keys):
+            # Pruning could skip too few postings to pay for more round-trips, read them all at once
+            seed_keys = keys
+        postings = fetch(seed_keys)
+
+        seed_docs = self._union([postings[key][0] for key in seed_keys])
+        seed_scores = self._score_candidates(seed_docs, keys, terms, avg_length, postings, fetch, lookup)
+        threshold = np.partition(seed_scores, len(seed_scores) - k)[len(seed_scores) - k] if len(seed_scores) >= k else -np.inf
+
+        # Terms, cheapest bound first, whose bounds add up to less than the threshold
+        non_essential = []
+        total_bound = 0.0
+        for key in sorted(keys, key=lambda key: bounds[key]):
+            if total_bound + bounds[key] >= threshold:
+                break
+            non_essential.append(key)
+            total_bound += bounds[key]
+        essential = [key for key in keys if key not in non_essential]
+
+        postings.update(fetch([key for key in essential if key not in postings]))
+        candidates = self._difference(self._union([postings[key][0] for key in essential]), seed_docs)
+
+        if len(candidates) and non_essential:
+            # Drop the candidates that cannot reach the threshold even with every non-essential term
+            essential_scores = np.zeros(len(candidates))
+            for key in essential:
+                essential_scores += self._contributions(candidates, terms[key][0], postings[key], avg_length)
+            candidates = candidates[essential_scores + total_bound >= threshold - abs(threshold) * 1e-9]
+
+        scores = self._score_candidates(candidates, keys, terms, avg_length, postings, fetch, lookup)
+
+        doc_ids = np.concatenate([seed_docs, candidates])
+        scores = np.concatenate([seed_scores, scores])
+        if len(scores) > k:
+            cutoff = np.partition(scores, len(scores) - k)[len(scores) - k]
+            keep = np.nonzero(scores >= cutoff)[0]
+        else:
+            keep = np.arange(len(scores))
+        order = np.lexsort((doc_ids[keep], -scores[keep]))[:k]
+        return [(int(doc_ids[i]), float(scores[i])) for i in keep[order]]
+
+    def _union(self, arrays):
+        """Sorted distinct doc_ids of several sorted posting lists."""
+        arrays = [np.asarray(array, dtype=np.int64) for array in arrays]
+        if not arrays:
+            return np.zeros(0, dtype=np.int64)
+        if len(arrays) == 1:
+            return arrays[0]
+        doc_ids = np.sort(np.concatenate(arrays), kind="stable")
+        return doc_ids[np.concatenate(([True], doc_ids[1:] != doc_ids[:-1]))]
+
+    def _difference(self, doc_ids, excluded):
+        """The sorted doc_ids that are not in the sorted excluded array."""
+        if len(doc_ids) == 0 or len(excluded) == 0:
+            return doc_ids
+        positions = np.minimum(np.searchsorted(excluded, doc_ids), len(excluded) - 1)
+        return doc_ids[excluded[positions] != doc_ids]
+
+    def _contributions(self, doc_ids, weight, term_postings, avg_length):
+        """Score of one term for each of doc_ids (sorted), zero where the term is absent."""
+        term_doc_ids, tfs, lengths = term_postings
+        contributions = np.zeros(len(doc_ids))
+        if len(term_doc_ids) == 0 or len(doc_ids) == 0:
+            return contributions
+
+        positions = np.minimum(np.searchsorted(term_doc_ids, doc_ids), len(term_doc_ids) - 1)
+        found = term_doc_ids[positions] == doc_ids
+        contributions[found] = self.score(weight, tfs[positions[found]], lengths[positions[found]], avg_length)
+        return contributions
+
+    def _score_candidates(self, doc_ids, keys, terms, avg_length, postings, fetch, lookup):
+        """Exact scores of doc_ids, reading only the candidates' postings of unfetched terms."""
+        if len(doc_ids) == 0:
+            return np.zeros(0)
+
+        # Probing a list costs about one lookup per candidate, reading it one row per posting
+        missing = [key for key in keys if key not in postings]
+        read = [key for key in missing if (terms[key][1] or 0) <= self.probe_ratio * len(doc_ids)]
+        probe = [key for key in missing if key not in read]
+        postings.update(fetch(read) if read else {})
+        probed = lookup(probe, doc_ids) if probe else {}
+
+        scores = np.zeros(len(doc_ids))
+        for key in keys:
+            scores += self._contributions(doc_ids, terms[key][0], postings.get(key) or probed[key], avg_length)
+        return scores
@@ -0,0 +1,58 @@
+from common.tokenizer import STRIP_CHARACTERS
+
+
+def make_snippet(excerpt, terms, width=30, context=5):
+    """
+    The width words of an excerpt holding the most query terms, as [text, highlighted] fragments.
+
+    The window starts up to context words before its first term. Returns
+    None when no term occurs in the excerpt, so the caller can fall back on
+    the page description. Fragments stay plain data, the template decides
+    how to mark them up.
+    """
+    if not excerpt or not terms:
+        return None
+    words = excerpt.split()
+    hits = []  # (position, term) of every query term in the excerpt
+    for position, word in enumerate(words):
+        # terms only holds indexed words, so normalizing like the tokenizer is enough
+        term = word.lower().strip(STRIP_CHARACTERS)
+        if term in terms:
+            hits.append((position, term))
+    if not hits:
+        return None
+
+    # Slide a window starting at every hit: most distinct terms first, then most occurrences
+    best_start, best_score = hits[0][0], None
+    window_terms = {}  # term -> occurrences in the window
+    end = 0
+    for index, (start, term) in enumerate(hits):
+        while end < len(hits) and hits[end][0] < start + width:
+            window_terms[hits[end][1]] = window_terms.get(hits[end][1], 0) + 1
+            end += 1
+        score = (len(window_terms), end - index)
+        if best_score is None or score > best_score:
+            best_start, best_score = start, score
+        window_terms[term] -= 1
+        if not window_terms[term]:
+            del window_terms[term]
+
+    begin = max(0, min(best_start - context, len(words) - width))
+    end = min(begin + width, len(words))
+    highlighted = {position for position, _ in hits}
+
+    pieces = [("… ", False)] if begin > 0 else []
+    for position in range(begin, end):
+        if position > begin:
+            pieces.append((" ", False))
+        pieces.append((words[position], position in highlighted))
+    if end < len(words):
+        pieces.append((" …", False))
+
+    fragments = []
+    for text, is_highlighted in pieces:
+        if fragments and fragments[-1][1] == is_highlighted:
+            fragments[-1][0] += text
+        else:
+            fragments.append([text, is_highlighted])
+    return fragments
@@ -0,0 +1,90 @@
+import numpy as np
+
+
+class PrefixIndex:
+    """
+    Completions of a prefix from the term dictionary, most frequent first.
+
+    The terms are kept sorted in a single UTF-8 blob with an array of
+    offsets, so the index costs little more than the text of the terms, and
+    a prefix is resolved with two binary searches. Ranking a range of terms
+    takes one pass over their document frequencies; prefixes matching more
+    than rank_threshold terms (the first letters of a word) have their best
+    max_limit completions ranked once, when the index is built.
+    """
+
+    def __init__(self, terms, dfs, max_limit=20, rank_threshold=4096):
+        """terms must be sorted by their UTF-8 bytes, e.g. ORDER BY term COLLATE "C"."""
+        encoded = [term.encode("utf-8") for term in terms]
+        self.blob = b"".join(encoded)
+        self.offsets = np.cumsum([0] + [len(term) for term in encoded], dtype=np.int64).tolist()
+        self.dfs = np.asarray(dfs, dtype=np.int64)
+        self.count = len(encoded)
+        self.max_limit = max_limit
+        self.rank_threshold = rank_threshold
+        self.ranked = {}  # prefix bytes -> best max_limit (term, df) completions
+        self._rank_long_prefixes()
+
+    def __len__(self):
+        return self.count
+
+    def _term(self, index):
+        return self.blob[self.offsets[index]:self.offsets[index + 1]]
+
+    def _lower_bound(self, key, low=0, high=None):
+        high = self.count if high is None else high
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _range(self, prefix, low=0, high=None):
+        """The [start, end) indexes of the terms starting with prefix (bytes)."""
+        start = self._lower_bound(prefix, low, high)
+        # No UTF-8 byte is 0xff, so it sorts after every continuation of the prefix
+        return start, self._lower_bound(prefix + b"\xff", start, high)
+
+    def _rank(self, start, end, limit):
+        """The limit most frequent terms of a range; ties keep dictionary order."""
+        dfs = self.dfs[start:end]
+        if len(dfs) > limit:
+            # Terms as frequent as the last one kept are cut in dictionary order, not argpartition's
+            cutoff = -np.partition(-dfs, limit - 1)[limit - 1] if limit else np.iinfo(np.int64).max
+            above = np.flatnonzero(dfs > cutoff)
+            best = np.concatenate([above, np.flatnonzero(dfs == cutoff)[:limit - len(above)]])
+            best = best[np.lexsort((best, -dfs[best]))]
+        else:
+            best = np.argsort(-dfs, kind="stable")
+        return [(self._term(start + index).decode("utf-8"), int(dfs[index])) for index in best.tolist()]
+
+    def _rank_long_prefixes(self):
+        pending = [(b"", 0, self.count)]
+        while pending:
+            prefix, start, end = pending.pop()
+            self.ranked[prefix] = self._rank(start, end, self.max_limit)
+
+            # Split the range by the next byte, one binary search per distinct byte
+            length = len(prefix) + 1
+            position = start
+            while position < end:
+                term = self._term(position)
+                if len(term) < length:
+                    position += 1
+                    continue
+                child_start, child_end = self._range(term[:length], position, end)
+                if child_end - child_start > self.rank_threshold:
+                    pending.append((term[:length], child_start, child_end))
+                position = child_end
+
+    def complete(self, prefix, limit=10):
+        """Up to limit (term, df) completions of prefix, most frequent first."""
+        limit = min(limit, self.max_limit)
+        key = prefix.encode("utf-8")
+        ranked = self.ranked.get(key)
+        if ranked is not None:
+            return ranked[:limit]
+        start, end = self._range(key)
+        return self._rank(start, end, limit) if end > start else []
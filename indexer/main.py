@@ -1,27 +1,45 @@
 import os
+import sys
+import time
+import argparse
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
 from dotenv import load_dotenv
 import psycopg2
 import psycopg2.extras
-import re
-import json
-import string
+from psycopg2 import sql
+
+# The indexer runs as a script; make the shared packages at the repository root importable
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.compression import BodyReader
+from common.metrics import REGISTRY, Throttle, start_exporters
+from common.positions import decode_positions, encode_positions
+from common.segments import SegmentMerger, add_segment
+from common.shards import load_shards, parse_shards, shard_of
+from common.tokenizer import excerpt, tokenize, tokenize_page
+
+STAGE_SECONDS = REGISTRY.histogram("gibble_indexer_stage_seconds", "Seconds spent in each indexing stage", ["stage"])
+PAGES_INDEXED = REGISTRY.counter("gibble_indexer_pages_indexed_total", "Pages tokenized and written to the index")
+WORDS_INDEXED = REGISTRY.counter("gibble_indexer_words_indexed_total", "Term occurrences written to the index")
+PAGES_TO_INDEX = REGISTRY.gauge("gibble_indexer_pages_to_index", "Pages waiting to be indexed when the run started")
 
 
 class Database:
-    def __init__(self):
+    def __init__(self, shard=None, holds_index=True):
         load_dotenv()
         self.logger = logging.getLogger(__name__)
         logging.basicConfig(level=logging.INFO)
+        self.bodies = BodyReader(self.load_dictionary)
+
+        # An index shard (common/shards.py) only holds index tables. Without one this is the main
+        # database with the pages, which holds the index too unless the index is sharded.
+        self.shard = shard
+        self.holds_index = shard is not None or holds_index
 
         try:
-            self.connection = self.get_connection(
-                os.getenv("DB_NAME"),
-                os.getenv("DB_HOST"),
-                os.getenv("DB_PASSWORD"),
-                os.getenv("DB_PORT"),
-                os.getenv("DB_USER"),
-            )
+            self.connection = self.connect()
             self.construct_schema()
         except Exception as e:
             self.logger.error(f"Failed to initialize the database: {e}")
@@ -44,18 +62,29 @@ class Database:
             self.logger.error(f"Error connecting to the database: {error}")
             raise error
 
-    def ensure_connection(self):
-        try:
-            self.connection.cursor().execute("SELECT 1")
-        except (Exception, psycopg2.OperationalError):
-            self.logger.warning("Reconnecting to the database...")
-            self.connection = self.get_connection(
+    def connect(self):
+        if self.shard is None:
+            return self.get_connection(
                 os.getenv("DB_NAME"),
                 os.getenv("DB_HOST"),
                 os.getenv("DB_PASSWORD"),
                 os.getenv("DB_PORT"),
                 os.getenv("DB_USER"),
             )
+        try:
+            connection = psycopg2.connect(**self.shard.connection_parameters())
+            self.logger.info(f"Connected to index shard {self.shard.name}.")
+            return connection
+        except Exception as error:
+            self.logger.error(f"Error connecting to index shard {self.shard.name}: {error}")
+            raise error
+
+    def ensure_connection(self):
+        try:
+            self.connection.cursor().execute("SELECT 1")
+        except (Exception, psycopg2.OperationalError):
+            self.logger.warning("Reconnecting to the database...")
+            self.connection = self.connect()
 
     def construct_schema(self):
         """Create the database schema if it doesn't already exist."""
@@ -68,23 +97,130 @@ class Database:
 
                 # self.connection.commit()
 
+                if self.shard is not None and self.shard.schema:
+                    cursor.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {};").format(sql.Identifier(self.shard.schema)))
+
+                if self.holds_index:
+                    # Postings are stored one row per (term, document) so indexing a
+                    # page only appends rows instead of rewriting a JSONB array per word
+                    cursor.execute(
+                        """
+                        CREATE TABLE IF NOT EXISTS documents (
+                            doc_id BIGSERIAL PRIMARY KEY,
+                            url TEXT UNIQUE NOT NULL
+                        );
+
+                        CREATE TABLE IF NOT EXISTS terms (
+                            term_id SERIAL PRIMARY KEY,
+                            term TEXT UNIQUE NOT NULL
+                        );
+
+                        CREATE TABLE IF NOT EXISTS postings (
+                            term_id INTEGER NOT NULL REFERENCES terms (term_id),
+                            doc_id BIGINT NOT NULL REFERENCES documents (doc_id),
+                            tf INTEGER NOT NULL,
+                            -- Positions as varint gaps (common/positions.py)
+                            position_deltas BYTEA,
+                            PRIMARY KEY (term_id, doc_id)
+                        );
+
+                        CREATE INDEX IF NOT EXISTS idx_postings_doc_id ON postings (doc_id);
+
+                        -- Statistics for BM25 ranking, kept up to date as pages are indexed
+                        ALTER TABLE documents ADD COLUMN IF NOT EXISTS length INTEGER;
+                        ALTER TABLE terms ADD COLUMN IF NOT EXISTS df INTEGER NOT NULL DEFAULT 0;
+
+                        -- Upper bounds of a term's BM25 score, used to prune documents at query time.
+                        -- NULL until known, and only ever loosened by incremental indexing.
+                        ALTER TABLE terms ADD COLUMN IF NOT EXISTS max_tf INTEGER;
+                        ALTER TABLE terms ADD COLUMN IF NOT EXISTS min_length INTEGER;
+
+                        CREATE TABLE IF NOT EXISTS index_stats (
+                            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                            doc_count BIGINT NOT NULL DEFAULT 0,
+                            total_length BIGINT NOT NULL DEFAULT 0
+                        );
+
+                        INSERT INTO index_stats (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING;
+
+                        -- Bumped whenever new index data is published, invalidates frontend caches
+                        ALTER TABLE index_stats ADD COLUMN IF NOT EXISTS generation BIGINT NOT NULL DEFAULT 0;
+
+                        -- Every indexing batch gets a new version; segment exports remember the version they wrote
+                        CREATE SEQUENCE IF NOT EXISTS index_version_seq;
+                        ALTER TABLE documents ADD COLUMN IF NOT EXISTS index_version BIGINT NOT NULL DEFAULT 0;
+                        ALTER TABLE documents ADD COLUMN IF NOT EXISTS exported_version BIGINT;
+                        CREATE INDEX IF NOT EXISTS idx_documents_unexported ON documents (doc_id)
+                            WHERE exported_version IS DISTINCT FROM index_version;
+
+                        -- Everything a search result needs, so the frontend never reads pages
+                        CREATE TABLE IF NOT EXISTS result_cards (
+                            doc_id BIGINT PRIMARY KEY REFERENCES documents (doc_id),
+                            url TEXT NOT NULL,
+                            title TEXT,
+                            description TEXT,
+                            added_at TIMESTAMP
+                        );
+
+                        -- Postings tables created with INTEGER[] positions, which --migrate
+                        -- converts to position_deltas before dropping the column
+                        ALTER TABLE postings ADD COLUMN IF NOT EXISTS position_deltas BYTEA;
+
+                        -- The first words of the page, which query-time snippets are cut from
+                        ALTER TABLE result_cards ADD COLUMN IF NOT EXISTS excerpt TEXT;
+                        """
+                    )
+                if self.shard is None:
+                    cursor.execute(
+                        """
+                        ALTER TABLE pages ADD COLUMN IF NOT EXISTS indexed BOOLEAN DEFAULT FALSE;
+
+                        CREATE INDEX IF NOT EXISTS idx_pages_unindexed ON pages (url) WHERE indexed = FALSE;
+
+                        -- Compressed page text, written by a crawler running with PAGE_STORAGE=zstd
+                        CREATE TABLE IF NOT EXISTS compression_dictionaries (
+                            dictionary_id SERIAL PRIMARY KEY,
+                            codec TEXT NOT NULL,
+                            dictionary BYTEA NOT NULL,
+                            created_at TIMESTAMP DEFAULT NOW()
+                        );
+
+                        CREATE TABLE IF NOT EXISTS page_bodies (
+                            url TEXT PRIMARY KEY REFERENCES pages (url) ON DELETE CASCADE,
+                            codec TEXT NOT NULL,
+                            dictionary_id INTEGER REFERENCES compression_dictionaries (dictionary_id),
+                            text_hash BYTEA NOT NULL,
+                            body BYTEA NOT NULL
+                        );
+                        """
+                    )
+                self.connection.commit()
+                self.logger.info("Schema construction completed.")
+        except Exception as error:
+            self.logger.error(f"Error creating schema: {error}")
+            self.connection.rollback()
+
+        if self.holds_index:
+            self.construct_trigram_index()
+
+    def construct_trigram_index(self):
+        """
+        Index the term dictionary by trigrams for substring and fuzzy matching.
+
+        Needs the pg_trgm extension; without it the frontend falls back to
+        scanning the dictionary with LIKE.
+        """
+        try:
+            with self.connection.cursor() as cursor:
                 cursor.execute(
                     """
-                    CREATE TABLE IF NOT EXISTS reverse_index (
-                        word TEXT PRIMARY KEY,
-                        urls JSONB
-                    );
-                    """
-                )
-                cursor.execute(
-                    """
-                    ALTER TABLE pages ADD COLUMN IF NOT EXISTS indexed BOOLEAN DEFAULT FALSE;
+                    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+                    CREATE INDEX IF NOT EXISTS idx_terms_trgm ON terms USING gin (term gin_trgm_ops);
                     """
                 )
                 self.connection.commit()
-                self.logger.info("Schema construction completed.")
         except Exception as error:
-            self.logger.error(f"Error creating schema: {error}")
+            self.logger.warning(f"Trigram index unavailable, partial matches will scan the term dictionary: {error}")
             self.connection.rollback()
 
     def get_number_of_pages(self):
@@ -98,54 +234,673 @@ class Database:
             self.connection.rollback()
             return 0
 
-    def get_page_to_index(self):
-        """Fetch the next uncrawled URL."""
+    def iter_pages_to_index(self, batch_size):
+        """
+        Stream the pages that have not been indexed yet, batch by batch.
+
+        Uses keyset pagination over the partial idx_pages_unindexed index, so
+        every batch starts where the previous one ended instead of rescanning
+        from the beginning, and the whole table is read in one linear pass.
+        Pages stored compressed are decompressed here; a page with JSONB
+        content is read from it even if an older compressed body exists.
+        """
+        last_url = ""
+        while True:
+            try:
+                with self.connection.cursor() as cursor:
+                    cursor.execute(
+                        """
+                        SELECT p.url, p.content, b.codec, b.dictionary_id, b.body
+                        FROM pages p LEFT JOIN page_bodies b ON b.url = p.url
+                        WHERE p.indexed = FALSE AND p.url > %s
+                        ORDER BY p.url
+                        LIMIT %s;
+                        """,
+                        (last_url, batch_size),
+                    )
+                    pages = [
+                        (url, content if content is not None or body is None
+                         else {"page_text": self.bodies.decompress(codec, dictionary_id, body)})
+                        for url, content, codec, dictionary_id, body in cursor.fetchall()
+                    ]
+            except Exception as error:
+                self.logger.error(f"Error fetching pages: {error}")
+                self.connection.rollback()
+                return
+
+            if not pages:
+                return
+
+            last_url = pages[-1][0]
+            yield pages
+
+    def load_dictionary(self, dictionary_id):
+        """The bytes of a compression dictionary, see common/compression.py."""
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT dictionary FROM compression_dictionaries WHERE dictionary_id = %s;", (dictionary_id,))
+            dictionary, = cursor.fetchone()
+        return bytes(dictionary)
+
+    def insert_index(self, url, term_positions, page_excerpt=None):
+        """
+        Insert the postings of a page into the database.
+
+        term_positions maps each term to the word positions it occurs at.
+        """
+        self.insert_index_batch([(url, term_positions, page_excerpt)])
+
+    def insert_index_batch(self, pages, cards=None):
+        """
+        Insert the postings of several (url, term_positions, excerpt) pages in one transaction.
+
+        Postings left over from a previous indexing of the same page are
+        replaced, so re-indexing never duplicates a document. Document
+        lengths, term document frequencies, term score bounds and the corpus
+        totals used for BM25 are adjusted in the same transaction.
+
+        Result cards are built from the pages table, or from cards (see
+        page_cards()) in an index shard that cannot read it. Returns whether
+        the batch was written.
+        """
+        if not pages:
+            return True
+        excerpts = {url: page_excerpt for url, _, page_excerpt in pages}
+        pages = {url: term_positions for url, term_positions, _ in pages}
+        try:
+            with self.connection.cursor() as cursor:
+                doc_ids = dict(psycopg2.extras.execute_values(
+                    cursor,
+                    """
+                    INSERT INTO documents (url) VALUES %s
+                    ON CONFLICT (url) DO UPDATE SET url = EXCLUDED.url
+                    RETURNING url, doc_id;
+                    """,
+                    [(url,) for url in pages],
+                    fetch=True,
+                ))
+
+                term_ids = self.get_term_ids(
+                    cursor, {term for term_positions in pages.values() for term in term_positions}
+                )
+
+                # Take back the statistics of any previous indexing of these pages
+                cursor.execute(
+                    """
+                    SELECT COUNT(length), COALESCE(SUM(length), 0) FROM documents
+                    WHERE doc_id = ANY(%s);
+                    """,
+                    (list(doc_ids.values()),),
+                )
+                old_doc_count, old_total_length = cursor.fetchone()
+                cursor.execute(
+                    """
+                    UPDATE terms SET df = terms.df - old.count
+                    FROM (
+                        SELECT term_id, COUNT(*) AS count FROM postings
+                        WHERE doc_id = ANY(%s) GROUP BY term_id
+                    ) old
+                    WHERE terms.term_id = old.term_id;
+                    """,
+                    (list(doc_ids.values()),),
+                )
+
+                cursor.execute("DELETE FROM postings WHERE doc_id = ANY(%s);", (list(doc_ids.values()),))
+                psycopg2.extras.execute_values(
+                    cursor,
+                    "INSERT INTO postings (term_id, doc_id, tf, position_deltas) VALUES %s;",
+                    [
+                        (term_ids[term], doc_ids[url], len(positions), psycopg2.Binary(encode_positions(positions)))
+                        for url, term_positions in pages.items()
+                        for term, positions in term_positions.items()
+                    ],
+                    page_size=1000,
+                )
+
+                lengths = {
+                    doc_ids[url]: sum(len(positions) for positions in term_positions.values())
+                    for url, term_positions in pages.items()
+                }
+                cursor.execute("SELECT nextval('index_version_seq');")
+                index_version = cursor.fetchone()[0]
+                psycopg2.extras.execute_values(
+                    cursor,
+                    """
+                    UPDATE documents SET length = new.length, index_version = new.index_version
+                    FROM (VALUES %s) AS new (doc_id, length, index_version)
+                    WHERE documents.doc_id = new.doc_id;
+                    """,
+                    [(doc_id, length, index_version) for doc_id, length in lengths.items()],
+                    page_size=1000,
+                )
+
+                term_statistics = {}  # term_id -> [df, max_tf, min_length] of this batch
+                for url, term_positions in pages.items():
+                    for term, positions in term_positions.items():
+                        statistics = term_statistics.setdefault(term_ids[term], [0, 0, lengths[doc_ids[url]]])
+                        statistics[0] += 1
+                        statistics[1] = max(statistics[1], len(positions))
+                        statistics[2] = min(statistics[2], lengths[doc_ids[url]])
+                # Bounds stay NULL for terms indexed before they were tracked, until recompute_statistics
+                psycopg2.extras.execute_values(
+                    cursor,
+                    """
+                    UPDATE terms SET
+                        df = terms.df + new.count,
+                        max_tf = CASE WHEN terms.df = 0 OR terms.max_tf IS NOT NULL
+                            THEN GREATEST(terms.max_tf, new.max_tf) END,
+                        min_length = CASE WHEN terms.df = 0 OR terms.min_length IS NOT NULL
+                            THEN LEAST(terms.min_length, new.min_length) END
+                    FROM (VALUES %s) AS new (term_id, count, max_tf, min_length)
+                    WHERE terms.term_id = new.term_id;
+                    """,
+                    [(term_id, *statistics) for term_id, statistics in sorted(term_statistics.items())],
+                    page_size=1000,
+                )
+
+                cursor.execute(
+                    """
+                    UPDATE index_stats
+                    SET doc_count = doc_count + %s, total_length = total_length + %s;
+                    """,
+                    (len(lengths) - old_doc_count, sum(lengths.values()) - old_total_length),
+                )
+
+                if cards is None:
+                    self.upsert_result_cards(cursor, list(doc_ids.values()))
+                else:
+                    self.write_result_cards(cursor, [(doc_ids[url], *cards[url]) for url in pages if url in cards])
+                psycopg2.extras.execute_values(
+                    cursor,
+                    """
+                    UPDATE result_cards SET excerpt = new.excerpt
+                    FROM (VALUES %s) AS new (doc_id, excerpt)
+                    WHERE result_cards.doc_id = new.doc_id;
+                    """,
+                    [(doc_ids[url], page_excerpt) for url, page_excerpt in excerpts.items() if page_excerpt is not None],
+                    page_size=1000,
+                )
+
+                self.connection.commit()
+                self.logger.info(f"Index for {len(pages)} pages inserted successfully.")
+                return True
+        except Exception as error:
+            self.logger.error(f"Error inserting index: {error}")
+            self.connection.rollback()
+            return False
+
+    def upsert_result_cards(self, cursor, doc_ids=None):
+        """Build the result cards of the given documents (all when None) from their pages."""
+        cursor.execute(
+            """
+            INSERT INTO result_cards (doc_id, url, title, description, added_at)
+            SELECT
+                d.doc_id,
+                split_part(split_part(btrim(p.url, E' \\t\\n\\r'), '?', 1), '#', 1),
+                p.metadata->>'page_title',
+                p.metadata->>'page_description',
+                p.added_at
+            FROM documents d JOIN pages p ON p.url = d.url
+            WHERE %(doc_ids)s IS NULL OR d.doc_id = ANY(%(doc_ids)s)
+            ON CONFLICT (doc_id) DO UPDATE SET
+                url = EXCLUDED.url,
+                title = EXCLUDED.title,
+                description = EXCLUDED.description,
+                added_at = EXCLUDED.added_at;
+            """,
+            {"doc_ids": doc_ids},
+        )
+
+    def write_result_cards(self, cursor, cards):
+        """Upsert (doc_id, url, title, description, added_at) result cards."""
+        psycopg2.extras.execute_values(
+            cursor,
+            """
+            INSERT INTO result_cards (doc_id, url, title, description, added_at) VALUES %s
+            ON CONFLICT (doc_id) DO UPDATE SET
+                url = EXCLUDED.url,
+                title = EXCLUDED.title,
+                description = EXCLUDED.description,
+                added_at = EXCLUDED.added_at;
+            """,
+            cards,
+            page_size=1000,
+        )
+
+    def page_cards(self, urls):
+        """{url: (url, title, description, added_at)} result cards of pages, for index shards without the pages table."""
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT
+                        url,
+                        split_part(split_part(btrim(url, E' \\t\\n\\r'), '?', 1), '#', 1),
+                        metadata->>'page_title',
+                        metadata->>'page_description',
+                        added_at
+                    FROM pages WHERE url = ANY(%s);
+                    """,
+                    (list(urls),),
+                )
+                return {url: card for url, *card in cursor.fetchall()}
+        except Exception as error:
+            self.logger.error(f"Error fetching result cards: {error}")
+            self.connection.rollback()
+            return {}
+
+    def store_result_cards(self, documents, cards):
+        """Write the result cards of (doc_id, url) documents from page_cards()."""
+        try:
+            with self.connection.cursor() as cursor:
+                self.write_result_cards(cursor, [(doc_id, *cards[url]) for doc_id, url in documents if url in cards])
+                self.connection.commit()
+        except Exception as error:
+            self.logger.error(f"Error storing result cards: {error}")
+            self.connection.rollback()
+
+    def build_result_cards(self):
+        """Backfill the result cards of every indexed document."""
         try:
-            with self.connection.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+            with self.connection.cursor() as cursor:
+                self.upsert_result_cards(cursor)
+                self.connection.commit()
+                self.logger.info("Result cards built.")
+        except Exception as error:
+            self.logger.error(f"Error building result cards: {error}")
+            self.connection.rollback()
+
+    def publish_generation(self):
+        """Announce a new index generation so search caches drop their results."""
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("UPDATE index_stats SET generation = generation + 1 RETURNING generation;")
+                generation = cursor.fetchone()[0]
+                self.connection.commit()
+                self.logger.info(f"Published index generation {generation}.")
+        except Exception as error:
+            self.logger.error(f"Error publishing index generation: {error}")
+            self.connection.rollback()
+
+    def export_segments(self, directory, docs_per_segment=20000):
+        """
+        Write every document indexed since the last export into new segments.
+
+        Each segment holds up to docs_per_segment documents with their
+        postings, positions and result cards; a document is marked exported
+        with the version it was written at, so re-indexing it later exports
+        it again into a newer segment that supersedes the old copy.
+        """
+        exported = 0
+        while True:
+            try:
+                with self.connection.cursor() as cursor:
+                    cursor.execute(
+                        """
+                        SELECT d.doc_id, COALESCE(d.length, 0), d.index_version, c.url, c.title, c.description, c.added_at, c.excerpt
+                        FROM documents d JOIN result_cards c ON c.doc_id = d.doc_id
+                        WHERE d.exported_version IS DISTINCT FROM d.index_version
+                        ORDER BY d.doc_id
+                        LIMIT %s;
+                        """,
+                        (docs_per_segment,),
+                    )
+                    rows = cursor.fetchall()
+                if not rows:
+                    break
+
+                documents = [
+                    (doc_id, length, {
+                        "url": url,
+                        "title": title,
+                        "description": description,
+                        "added_at": added_at.strftime("%Y-%m-%d") if added_at else None,
+                        "excerpt": page_excerpt,
+                    })
+                    for doc_id, length, _, url, title, description, added_at, page_excerpt in rows
+                ]
+                ordinals = {doc_id: ordinal for ordinal, (doc_id, _, _) in enumerate(documents)}
+
+                def postings():
+                    # Stream the postings in term order through a server-side cursor
+                    with self.connection.cursor(name="segment_export") as stream:
+                        stream.itersize = 10000
+                        stream.execute(
+                            """
+                            SELECT t.term, p.doc_id, p.tf, p.position_deltas
+                            FROM postings p JOIN terms t ON t.term_id = p.term_id
+                            WHERE p.doc_id = ANY(%s)
+                            ORDER BY t.term COLLATE "C", p.doc_id;
+                            """,
+                            (list(ordinals),),
+                        )
+                        term, term_postings = None, []
+                        for row_term, doc_id, tf, position_deltas in stream:
+                            if row_term != term and term_postings:
+                                yield term, term_postings
+                                term_postings = []
+                            term = row_term
+                            positions = decode_positions([position_deltas], [tf]).tolist() if position_deltas is not None else []
+                            term_postings.append((ordinals[doc_id], tf, positions))
+                        if term_postings:
+                            yield term, term_postings
+
+                name = add_segment(directory, documents, postings())
+
+                with self.connection.cursor() as cursor:
+                    psycopg2.extras.execute_values(
+                        cursor,
+                        """
+                        UPDATE documents SET exported_version = exported.index_version
+                        FROM (VALUES %s) AS exported (doc_id, index_version)
+                        WHERE documents.doc_id = exported.doc_id;
+                        """,
+                        [(doc_id, index_version) for doc_id, _, index_version, *_ in rows],
+                        page_size=1000,
+                    )
+                self.connection.commit()
+                exported += len(rows)
+                self.logger.info(f"Exported {len(rows)} documents to segment {name}.")
+            except Exception as error:
+                self.logger.error(f"Error exporting segments: {error}")
+                self.connection.rollback()
+                break
+        return exported
+
+    def get_term_ids(self, cursor, terms):
+        """Return a term -> term_id mapping, registering unseen terms."""
+        # Sorted so concurrent indexers lock new terms in the same order
+        terms = sorted(terms)
+        cursor.execute(
+            """
+            INSERT INTO terms (term) SELECT unnest(%s::text[])
+            ON CONFLICT (term) DO NOTHING;
+            """,
+            (terms,),
+        )
+        cursor.execute("SELECT term, term_id FROM terms WHERE term = ANY(%s);", (terms,))
+        return dict(cursor.fetchall())
+
+    def migrate_reverse_index(self):
+        """
+        Copy the legacy reverse_index JSONB arrays into documents/terms/postings.
+
+        The old layout kept neither term frequencies nor positions, so migrated
+        postings get tf = 1; re-index the pages to fill those in. Safe to re-run.
+        """
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("SELECT to_regclass('reverse_index');")
+                if cursor.fetchone()[0] is None:
+                    self.logger.info("No reverse_index table to migrate.")
+                    return
+
                 cursor.execute(
                     """
-                    SELECT url, content FROM pages
-                    WHERE indexed = FALSE
-                    LIMIT 1;
+                    INSERT INTO documents (url)
+                    SELECT DISTINCT jsonb_array_elements_text(urls) FROM reverse_index
+                    ON CONFLICT (url) DO NOTHING;
+
+                    INSERT INTO terms (term)
+                    SELECT word FROM reverse_index
+                    ON CONFLICT (term) DO NOTHING;
+
+                    INSERT INTO postings (term_id, doc_id, tf)
+                    SELECT DISTINCT t.term_id, d.doc_id, 1
+                    FROM reverse_index r
+                    CROSS JOIN LATERAL jsonb_array_elements_text(r.urls) AS u(url)
+                    JOIN terms t ON t.term = r.word
+                    JOIN documents d ON d.url = u.url
+                    ON CONFLICT (term_id, doc_id) DO NOTHING;
                     """
                 )
-                page = cursor.fetchone()
-                return page["url"], page["content"] if page else (None, None)
+                self.connection.commit()
+                self.logger.info("Migrated reverse_index into postings.")
         except Exception as error:
-            self.logger.error(f"Error fetching page: {error}")
+            self.logger.error(f"Error migrating reverse_index: {error}")
             self.connection.rollback()
-            return None, None
+            return
+
+        self.recompute_statistics()
+        self.build_result_cards()
 
-    def insert_index(self, url, words):
-        """Insert the index into the database."""
+    def compress_positions(self, batch_size=10000):
+        """
+        Re-encode the INTEGER[] positions of postings written before position_deltas existed.
+
+        Every batch is committed on its own, so the migration can be stopped
+        and resumed; the postings themselves do not change. The legacy
+        positions column is dropped once every posting is converted.
+        """
         try:
             with self.connection.cursor() as cursor:
-                for word in words:
+                cursor.execute(
+                    """
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_schema = current_schema() AND table_name = 'postings' AND column_name = 'positions';
+                    """
+                )
+                legacy = cursor.fetchone() is not None
+            self.connection.commit()
+        except Exception as error:
+            self.logger.error(f"Error compressing positions: {error}")
+            self.connection.rollback()
+            return 0
+        if not legacy:
+            return 0
+
+        converted = 0
+        last_key = (0, 0)
+        while True:
+            try:
+                with self.connection.cursor() as cursor:
                     cursor.execute(
                         """
-                        INSERT INTO reverse_index (word, urls)
-                        VALUES (%s, %s)
-                        ON CONFLICT (word) DO UPDATE
-                        SET urls = reverse_index.urls || %s;
+                        SELECT term_id, doc_id, positions FROM postings
+                        WHERE positions IS NOT NULL AND (term_id, doc_id) > (%s, %s)
+                        ORDER BY term_id, doc_id
+                        LIMIT %s;
+                        """,
+                        (*last_key, batch_size),
+                    )
+                    rows = cursor.fetchall()
+                    if not rows:
+                        cursor.execute("ALTER TABLE postings DROP COLUMN positions;")
+                        self.connection.commit()
+                        break
+
+                    psycopg2.extras.execute_values(
+                        cursor,
+                        """
+                        UPDATE postings SET position_deltas = new.position_deltas, positions = NULL
+                        FROM (VALUES %s) AS new (term_id, doc_id, position_deltas)
+                        WHERE postings.term_id = new.term_id AND postings.doc_id = new.doc_id;
                         """,
-                        (word, json.dumps([url]), json.dumps([url])),
+                        [(term_id, doc_id, psycopg2.Binary(encode_positions(positions))) for term_id, doc_id, positions in rows],
+                        template="(%s, %s, %s::bytea)",
+                        page_size=1000,
                     )
+                    self.connection.commit()
+            except Exception as error:
+                self.logger.error(f"Error compressing positions: {error}")
+                self.connection.rollback()
+                break
+
+            converted += len(rows)
+            last_key = rows[-1][:2]
+            self.logger.info(f"Compressed the positions of {converted} postings.")
+        return converted
+
+    def recompute_statistics(self):
+        """Rebuild the BM25 statistics from the postings table from scratch."""
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    UPDATE documents SET length = totals.length
+                    FROM (SELECT doc_id, SUM(tf) AS length FROM postings GROUP BY doc_id) totals
+                    WHERE documents.doc_id = totals.doc_id;
+
+                    UPDATE terms SET
+                        df = COALESCE(counts.df, 0),
+                        max_tf = counts.max_tf,
+                        min_length = counts.min_length
+                    FROM terms t
+                    LEFT JOIN (
+                        SELECT p.term_id, COUNT(*) AS df, MAX(p.tf) AS max_tf, MIN(d.length) AS min_length
+                        FROM postings p JOIN documents d ON d.doc_id = p.doc_id
+                        GROUP BY p.term_id
+                    ) counts
+                    ON counts.term_id = t.term_id
+                    WHERE terms.term_id = t.term_id;
+
+                    UPDATE index_stats SET
+                        doc_count = (SELECT COUNT(length) FROM documents),
+                        total_length = (SELECT COALESCE(SUM(length), 0) FROM documents);
+                    """
+                )
                 self.connection.commit()
-                self.logger.info(f"Index for {url} inserted successfully.")
+                self.logger.info("Index statistics recomputed.")
         except Exception as error:
-            self.logger.error(f"Error inserting index: {error}")
+            self.logger.error(f"Error recomputing index statistics: {error}")
+            self.connection.rollback()
+
+    def mark_pages_indexed(self, urls):
+        """Mark a batch of pages as indexed."""
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("UPDATE pages SET indexed = TRUE WHERE url = ANY(%s);", (list(urls),))
+                self.connection.commit()
+        except Exception as error:
+            self.logger.error(f"Error marking pages as indexed: {error}")
+            self.connection.rollback()
+
+    def mark_pages_unindexed(self, urls):
+        """Queue pages to be indexed again."""
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("UPDATE pages SET indexed = FALSE WHERE url = ANY(%s);", (list(urls),))
+                self.connection.commit()
+        except Exception as error:
+            self.logger.error(f"Error marking pages as unindexed: {error}")
             self.connection.rollback()
 
-    def mark_page_indexed(self, url):
-        """Mark the page as indexed."""
+    def iter_documents(self, batch_size):
+        """Stream the (doc_id, url) of every indexed document, batch by batch in doc_id order."""
+        last_doc_id = 0
+        while True:
+            try:
+                with self.connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT doc_id, url FROM documents WHERE doc_id > %s ORDER BY doc_id LIMIT %s;",
+                        (last_doc_id, batch_size),
+                    )
+                    documents = cursor.fetchall()
+                self.connection.commit()
+            except Exception as error:
+                self.logger.error(f"Error fetching documents: {error}")
+                self.connection.rollback()
+                return
+
+            if not documents:
+                return
+
+            last_doc_id = documents[-1][0]
+            yield documents
+
+    def read_documents(self, doc_ids):
+        """
+        Read documents back the way the indexer writes them, to copy them into another shard.
+
+        Returns their (url, term_positions, excerpt) pages, their result
+        cards by url, and the urls of the documents holding postings migrated
+        without positions, which cannot be copied and must be re-indexed.
+        """
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT d.url, c.url, c.title, c.description, c.added_at, c.excerpt
+                FROM documents d LEFT JOIN result_cards c ON c.doc_id = d.doc_id
+                WHERE d.doc_id = ANY(%s);
+                """,
+                (list(doc_ids),),
+            )
+            pages, cards, excerpts = {}, {}, {}
+            for url, card_url, title, description, added_at, page_excerpt in cursor.fetchall():
+                pages[url] = {}
+                excerpts[url] = page_excerpt
+                if card_url is not None:
+                    cards[url] = (card_url, title, description, added_at)
+
+            cursor.execute(
+                """
+                SELECT d.url, t.term, p.tf, p.position_deltas
+                FROM postings p
+                JOIN documents d ON d.doc_id = p.doc_id
+                JOIN terms t ON t.term_id = p.term_id
+                WHERE p.doc_id = ANY(%s);
+                """,
+                (list(doc_ids),),
+            )
+            unpositioned = set()
+            compressed = []  # (url, term, tf) of the postings whose positions are decoded below
+            blobs = []
+            for url, term, tf, position_deltas in cursor.fetchall():
+                if position_deltas is not None:
+                    compressed.append((url, term, tf))
+                    blobs.append(position_deltas)
+                else:
+                    unpositioned.add(url)
+        self.connection.commit()
+
+        # Decoded all at once, one posting at a time would cost more than the copy itself
+        counts = [tf for _, _, tf in compressed]
+        flat = decode_positions(blobs, counts).tolist()
+        start = 0
+        for url, term, tf in compressed:
+            pages[url][term] = flat[start:start + tf]
+            start += tf
+
+        return [(url, term_positions, excerpts[url]) for url, term_positions in pages.items()], cards, unpositioned
+
+    def remove_documents(self, doc_ids):
+        """Delete documents with their postings and result cards, taking back their statistics. Returns whether they were."""
+        doc_ids = list(doc_ids)
         try:
             with self.connection.cursor() as cursor:
-                cursor.execute("UPDATE pages SET indexed = TRUE WHERE url = %s;", (url,))
+                cursor.execute(
+                    "SELECT COUNT(length), COALESCE(SUM(length), 0) FROM documents WHERE doc_id = ANY(%s);",
+                    (doc_ids,),
+                )
+                doc_count, total_length = cursor.fetchone()
+                # Score bounds are left as they are, they only need to stay upper bounds
+                cursor.execute(
+                    """
+                    UPDATE terms SET df = terms.df - old.count
+                    FROM (
+                        SELECT term_id, COUNT(*) AS count FROM postings
+                        WHERE doc_id = ANY(%(doc_ids)s) GROUP BY term_id
+                    ) old
+                    WHERE terms.term_id = old.term_id;
+
+                    DELETE FROM postings WHERE doc_id = ANY(%(doc_ids)s);
+                    DELETE FROM result_cards WHERE doc_id = ANY(%(doc_ids)s);
+                    DELETE FROM documents WHERE doc_id = ANY(%(doc_ids)s);
+                    """,
+                    {"doc_ids": doc_ids},
+                )
+                cursor.execute(
+                    """
+                    UPDATE index_stats
+                    SET doc_count = doc_count - %s, total_length = total_length - %s;
+                    """,
+                    (doc_count, total_length),
+                )
                 self.connection.commit()
-                self.logger.info(f"Page {url} marked as indexed.")
+                return True
         except Exception as error:
-            self.logger.error(f"Error marking page as indexed: {error}")
+            self.logger.error(f"Error removing documents: {error}")
             self.connection.rollback()
+            return False
 
     def __del__(self):
         if self.connection:
@@ -154,67 +909,275 @@ class Database:
 
 
 class Indexer:
-    def __init__(self):
-        self.db = Database()
+    def __init__(self, workers=1, batch_size=100, publish_interval=60, segment_dir=None, stats_interval=2.0, shards=()):
+        self.db = Database(holds_index=not shards)
         self.db.ensure_connection()
 
+        # Documents are split across the index shards by URL (INDEX_SHARDS), or all indexed in the main database
+        self.shards = [Database(shard) for shard in shards] or [self.db]
+        self.shard_writers = ThreadPoolExecutor(len(shards), thread_name_prefix="shard-writer") if shards else None
+
+        self.workers = workers
+        self.batch_size = batch_size
+        self.publish_interval = publish_interval
+
+        # When set, every published generation is also exported as on-disk segments
+        self.segment_dir = segment_dir
+
         self.analytics = {
             "number_of_pages": self.db.get_number_of_pages(),
             "pages_indexed": 0,
             "words_indexed": 0
         }
+        PAGES_INDEXED.set_function(lambda: self.analytics["pages_indexed"])
+        WORDS_INDEXED.set_function(lambda: self.analytics["words_indexed"])
+        PAGES_TO_INDEX.set_function(lambda: self.analytics["number_of_pages"])
+
+        # The console view is redrawn at most every stats_interval seconds, 0 turns it off
+        self.display_throttle = Throttle(stats_interval)
 
     def index_page(self, url, content):
         """Index words longer than 3 characters from the page content."""
-        content = content["page_text"]
-
-        words = content.split()
-        words = [word.lower().strip(string.punctuation + string.whitespace) for word in words]
-
-        # Remove common words using a set for faster lookups
-        common_words = {
-            'a', 'an', 'the', 'and', 'or', 'but', 'about', 'above', 'after', 'along',
-            'amid', 'among', 'as', 'at', 'by', 'for', 'from', 'in', 'into', 'like',
-            'minus', 'near', 'of', 'off', 'on', 'onto', 'out', 'over', 'past', 'per',
-            'plus', 'since', 'till', 'to', 'under', 'until', 'up', 'via', 'vs', 'with',
-            'that', 'can', 'cannot', 'could', 'may', 'might', 'must', 'need', 'ought',
-            'shall', 'should', 'will', 'would', 'have', 'had', 'has', 'having', 'be',
-            'is', 'am', 'are', 'was', 'were', 'being', 'been', 'get', 'gets', 'got',
-            'gotten', 'getting', 'use', 'uses', 'used', 'using', 'one', 'two', 'three',
-            'four', 'five', 'six', 'seven', 'eight', 'nine', 'ten', 'first', 'second',
-            'third', 'many', 'much', 'more', 'most', 'other', 'another'
-        }
+        term_positions = tokenize(content["page_text"])
 
-        # Remove all non-english words
+        self.analytics['words_indexed'] += sum(len(positions) for positions in term_positions.values())
 
-        words = [word for word in words if re.fullmatch(r'[a-zA-Z]+', word)]
+        self.write_index([(url, term_positions, excerpt(content["page_text"]))])
 
-        words = [word for word in words if word not in common_words and len(word) > 3]
+    def write_index(self, pages):
+        """
+        Write tokenized (url, term_positions, excerpt) pages to the index, each to its shard in parallel.
 
-        self.analytics['words_indexed'] += len(words)
+        Returns the URLs of the pages written; the others failed and are left
+        to be indexed again.
+        """
+        if self.shard_writers is None:
+            return [url for url, _, _ in pages] if self.db.insert_index_batch(pages) else []
 
-        self.db.insert_index(url, list(set(words)))
+        cards = self.db.page_cards([url for url, _, _ in pages])
+        batches = {}
+        for page in pages:
+            batches.setdefault(shard_of(page[0], len(self.shards)), []).append(page)
+        written = self.shard_writers.map(
+            lambda item: self.shards[item[0]].insert_index_batch(item[1], cards), batches.items()
+        )
+        # A shard whose transaction failed keeps its pages unindexed, the others' are done
+        return [url for batch, ok in zip(batches.values(), written) if ok for url, _, _ in batch]
 
     def run(self):
-        while True:
-            url, content = self.db.get_page_to_index()
-            if url is None:
-                print("No more pages to index.")
-                break
+        """
+        Index pages batch by batch.
+
+        With more than one worker, pages are tokenized on a process pool and
+        this process only merges the results and writes them to the database.
+        """
+        pool = Pool(self.workers) if self.workers > 1 else None
+        merger = SegmentMerger(self.segment_dir, logger=self.db.logger).start() if self.segment_dir else None
+        last_published = time.monotonic()
+        unpublished = False
+
+        try:
+            for pages in self.db.iter_pages_to_index(self.batch_size):
+                with STAGE_SECONDS.time(stage="tokenize"):
+                    if pool:
+                        tokenized = pool.map(tokenize_page, pages, chunksize=max(1, len(pages) // (self.workers * 4)))
+                    else:
+                        tokenized = [tokenize_page(page) for page in pages]
+
+                with STAGE_SECONDS.time(stage="index_write"):
+                    written = self.write_index(tokenized)
+                    if written:
+                        self.db.mark_pages_indexed(written)
+                unpublished = True
+
+                if time.monotonic() - last_published >= self.publish_interval:
+                    with STAGE_SECONDS.time(stage="publish"):
+                        self.publish()
+                    last_published = time.monotonic()
+                    unpublished = False
+
+                written = set(written)
+                self.analytics['pages_indexed'] += len(written)
+                self.analytics['words_indexed'] += sum(
+                    len(positions) for url, term_positions, _ in tokenized if url in written
+                    for positions in term_positions.values()
+                )
 
-            self.index_page(url, content)
-            self.db.mark_page_indexed(url)
+                self._display_stats()
 
-            self.analytics['pages_indexed'] += 1
+            print("No more pages to index.")
+        finally:
+            if unpublished:
+                with STAGE_SECONDS.time(stage="publish"):
+                    self.publish()
+            if merger:
+                merger.stop()
+            if pool:
+                pool.close()
+                pool.join()
+            if self.shard_writers:
+                self.shard_writers.shutdown()
 
-            print("\033[H\033[J")
-            print("\nIndexer Statistics:")
-            print(f"Pages to index: {self.analytics['number_of_pages']}")
-            print(f"Pages indexed: {self.analytics['pages_indexed']}")
-            print(f"Words indexed: {self.analytics['words_indexed']}")
-            print(f"Percentage complete: {self.analytics['pages_indexed'] / self.analytics['number_of_pages'] * 100:.2f}%")
+    def _display_stats(self):
+        """Redraw the indexer statistics, at most once per stats interval."""
+        if not self.display_throttle.ready():
+            return
+
+        print("\033[H\033[J")
+        print("\nIndexer Statistics:")
+        print(f"Pages to index: {self.analytics['number_of_pages']}")
+        print(f"Pages indexed: {self.analytics['pages_indexed']}")
+        print(f"Words indexed: {self.analytics['words_indexed']}")
+        print(f"Percentage complete: {self.analytics['pages_indexed'] / max(self.analytics['number_of_pages'], 1) * 100:.2f}%")
+        for stage in ("tokenize", "index_write", "publish"):
+            count, seconds = STAGE_SECONDS.summary(stage=stage)
+            if count:
+                print(f"Mean {stage} time: {seconds / count * 1000:.1f} ms over {count} batches")
+
+    def publish(self):
+        if self.segment_dir:
+            self.db.export_segments(self.segment_dir)
+        self.publish_generation()
+
+    def publish_generation(self):
+        for shard in self.shards:
+            shard.publish_generation()
+
+    def build_result_cards(self):
+        """Backfill the result cards of every indexed document, in every shard."""
+        if self.shard_writers is None:
+            self.db.build_result_cards()
+            return
+        for shard in self.shards:
+            for documents in shard.iter_documents(1000):
+                shard.store_result_cards(documents, self.db.page_cards([url for _, url in documents]))
+        self.db.logger.info("Result cards built.")
+
+    def rebalance(self, drained=(), batch_size=500):
+        """
+        Move every document to the shard its URL hashes to, see common/shards.py.
+
+        Run after changing INDEX_SHARDS, with the indexer stopped. Documents
+        are scanned shard by shard, and those of drained shards (removed from
+        INDEX_SHARDS) all move. A document is first written to its new shard
+        and only then removed from the old one, so an interrupted rebalance
+        leaves at worst a duplicate that running it again clears. Returns the
+        number of documents moved.
+        """
+        if self.shard_writers is None:
+            raise ValueError("Rebalancing needs a sharded index, set INDEX_SHARDS")
+
+        sources = self.shards + [Database(shard) for shard in drained]
+        moved = 0
+        for number, source in enumerate(sources):
+            for documents in source.iter_documents(batch_size):
+                targets = {
+                    doc_id: shard_of(url, len(self.shards)) for doc_id, url in documents
+                    if number >= len(self.shards) or shard_of(url, len(self.shards)) != number
+                }
+                if not targets:
+                    continue
+
+                try:
+                    pages, cards, unpositioned = source.read_documents(list(targets))
+                except Exception as error:
+                    source.logger.error(f"Error reading documents to move: {error}")
+                    source.connection.rollback()
+                    return moved
+
+                urls = {url: doc_id for doc_id, url in documents}
+                batches = {}
+                for page in pages:
+                    if page[0] not in unpositioned:
+                        batches.setdefault(targets[urls[page[0]]], []).append(page)
+                written = [
+                    urls[url] for target, batch in batches.items()
+                    if self.shards[target].insert_index_batch(batch, cards)
+                    for url, _, _ in batch
+                ]
+
+                # Postings migrated without positions cannot be copied, their pages are indexed again instead
+                if unpositioned:
+                    self.db.mark_pages_unindexed(unpositioned)
+                    written += [urls[url] for url in unpositioned]
+
+                if written and source.remove_documents(written):
+                    moved += len(written)
+                    self.db.logger.info(f"Moved {moved} documents so far, {len(written)} out of {source.shard.name}.")
+
+        self.publish_generation()
+        return moved
 
 
 if __name__ == "__main__":
-    indexer = Indexer()
-    indexer.run()
+    parser = argparse.ArgumentParser(description="Gibble indexer")
+    parser.add_argument("--migrate", action="store_true", help="Migrate the legacy reverse_index table and uncompressed positions, and exit")
+    parser.add_argument("--recompute-stats", action="store_true", help="Rebuild the ranking statistics and exit")
+    parser.add_argument("--build-cards", action="store_true", help="Backfill the search result cards and exit")
+    parser.add_argument("--workers", type=int, default=1, help="Tokenizer processes (1 tokenizes in this process)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Pages tokenized and written per transaction")
+    parser.add_argument("--publish-interval", type=float, default=60, help="Seconds between index generations published while indexing")
+    parser.add_argument("--segment-dir", default=None, help="Also export the index as on-disk segments into this directory")
+    parser.add_argument("--export-segments", action="store_true", help="Export unexported documents to --segment-dir and exit")
+    parser.add_argument("--merge-segments", action="store_true", help="Merge the segments in --segment-dir and exit")
+    parser.add_argument("--rebalance", action="store_true", help="Move every document to the index shard it hashes to, and exit")
+    parser.add_argument("--drain", action="append", default=[], help="Schema or connection string of a shard removed from INDEX_SHARDS, emptied by --rebalance (repeatable)")
+    parser.add_argument("--stats-interval", type=float, default=2.0, help="Seconds between console statistics redraws (0 disables them)")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on this local port")
+    parser.add_argument("--metrics-file", default=None, help="Periodically write Prometheus metrics to this file")
+    args = parser.parse_args()
+
+    if (args.export_segments or args.merge_segments) and not args.segment_dir:
+        parser.error("--export-segments and --merge-segments need --segment-dir")
+
+    load_dotenv()
+    try:
+        shards = load_shards()
+        drained = parse_shards(";".join(args.drain))
+    except ValueError as error:
+        parser.error(str(error))
+    if shards and args.segment_dir:
+        parser.error("Segments are exported from an unsharded index only, unset INDEX_SHARDS")
+    if args.drain and not args.rebalance:
+        parser.error("--drain goes with --rebalance")
+    if args.rebalance and not shards:
+        parser.error("--rebalance needs a sharded index, set INDEX_SHARDS")
+
+    indexer = Indexer(
+        workers=args.workers,
+        batch_size=args.batch_size,
+        publish_interval=args.publish_interval,
+        segment_dir=args.segment_dir,
+        stats_interval=args.stats_interval,
+        shards=shards,
+    )
+    if args.migrate:
+        # The legacy reverse_index is migrated into an unsharded index, which --rebalance can then split
+        if not shards:
+            indexer.db.migrate_reverse_index()
+        for shard in indexer.shards:
+            shard.compress_positions()
+        indexer.publish_generation()
+    elif args.recompute_stats:
+        for shard in indexer.shards:
+            shard.recompute_statistics()
+        indexer.publish_generation()
+    elif args.build_cards:
+        indexer.build_result_cards()
+        indexer.publish_generation()
+    elif args.rebalance:
+        moved = indexer.rebalance(drained)
+        print(f"Moved {moved} documents.")
+    elif args.export_segments:
+        indexer.db.export_segments(args.segment_dir)
+    elif args.merge_segments:
+        merger = SegmentMerger(args.segment_dir, logger=indexer.db.logger)
+        while merger.merge_once():
+            pass
+    else:
+        metrics_file = start_exporters(args.metrics_port, args.metrics_file)
+        try:
+            indexer.run()
+        finally:
+            if metrics_file:
+                metrics_file.close()
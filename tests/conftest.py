@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The crawler imports its modules as a script run from crawler/, the rest from the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "crawler")]
@@ -0,0 +1,140 @@
+import json
+
+import pytest
+
+from frontend.cache import QueryCache, SqliteQueryCache, normalize_query
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path, clock):
+    """Builds a cache of either backend on the fake clock."""
+
+    def make(**options):
+        if request.param == "memory":
+            return QueryCache(clock=clock, **options)
+        return SqliteQueryCache(str(tmp_path / "cache.sqlite3"), clock=clock, **options)
+
+    return make
+
+
+def entry_size(key, value):
+    return len(key) + len(json.dumps(value))
+
+
+def test_normalize_query():
+    assert normalize_query("  Hello   World ") == "hello world"
+
+
+def test_hit_and_miss(make_cache):
+    cache = make_cache()
+    assert cache.get("a", 1) is None
+    cache.set("a", 1, {"results": [1, 2]})
+    assert cache.get("a", 1) == {"results": [1, 2]}
+
+    stats = cache.describe()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_evicts_least_recently_used_first(make_cache, clock):
+    value = "x" * 10
+    cache = make_cache(max_bytes=3 * entry_size("a", value))
+    for key in ("a", "b", "c"):
+        cache.set(key, 1, value)
+        clock.now += 1
+
+    # Reading "a" makes "b" the least recently used entry
+    assert cache.get("a", 1) == value
+    clock.now += 1
+    cache.set("d", 1, value)
+
+    assert cache.get("b", 1) is None
+    assert [cache.get(key, 1) for key in ("a", "c", "d")] == [value] * 3
+    assert cache.describe()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl(make_cache, clock):
+    cache = make_cache(ttl=60)
+    cache.set("a", 1, [1])
+
+    clock.now += 60
+    assert cache.get("a", 1) == [1]
+    clock.now += 1
+    assert cache.get("a", 1) is None
+
+    stats = cache.describe()
+    assert (stats["entries"], stats["invalidations"]) == (0, 1)
+
+
+def test_size_accounting(make_cache):
+    cache = make_cache(max_bytes=100)
+    cache.set("a", 1, "x" * 10)
+    cache.set("bb", 1, [1, 2, 3])
+    assert cache.describe()["bytes"] == entry_size("a", "x" * 10) + entry_size("bb", [1, 2, 3])
+
+    # Replacing an entry counts only its new size
+    cache.set("a", 1, "y")
+    assert cache.describe()["bytes"] == entry_size("a", "y") + entry_size("bb", [1, 2, 3])
+
+    # A value larger than the whole cache is not stored and evicts nothing
+    cache.set("big", 1, "z" * 100)
+    stats = cache.describe()
+    assert (stats["entries"], stats["evictions"]) == (2, 0)
+    assert cache.get("big", 1) is None
+
+    cache.clear()
+    assert (cache.describe()["entries"], cache.describe()["bytes"]) == (0, 0)
+
+
+def test_new_index_generation_invalidates_entries(make_cache):
+    cache = make_cache()
+    cache.set("a", 1, [1])
+
+    assert cache.get("a", 2) is None
+    # The stale entry is dropped, not kept for the old generation
+    assert cache.get("a", 1) is None
+
+    stats = cache.describe()
+    assert (stats["entries"], stats["invalidations"], stats["misses"]) == (0, 1, 2)
+
+
+def test_sqlite_drops_stale_entries_before_recent_ones(tmp_path, clock):
+    value = "x" * 10
+    cache = SqliteQueryCache(str(tmp_path / "cache.sqlite3"), max_bytes=2 * entry_size("a", value), clock=clock)
+    cache.set("b", 2, value)
+    clock.now += 1
+    cache.set("a", 1, value)
+    clock.now += 1
+    cache.set("c", 2, value)
+
+    # "a" belongs to the old generation, so it goes even though "b" was used less recently
+    assert cache.get("b", 2) == value
+    assert cache.get("c", 2) == value
+    assert cache.describe()["entries"] == 2
+
+
+def test_sqlite_persists_across_instances(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    first = SqliteQueryCache(path, clock=clock)
+    first.set("a", 1, {"results": ["x"]})
+    first.connection.close()
+
+    second = SqliteQueryCache(path, clock=clock)
+    assert second.get("a", 1) == {"results": ["x"]}
+
+    # Writes from one instance are visible to another sharing the file
+    third = SqliteQueryCache(path, clock=clock)
+    third.set("b", 1, [2])
+    assert second.get("b", 1) == [2]
@@ -0,0 +1,95 @@
+import pytest
+
+from common.compression import BodyReader, PageCodec, text_hash, train_dictionary
+
+TEXTS = [
+    "",
+    "Rome",
+    "Café ünïcode — 東京 🚀",
+    "The Roman Empire was the post-Republican state of ancient Rome. " * 200,
+]
+
+
+def sample_pages(topic):
+    """Pages sharing boilerplate, as pages of one site do."""
+    return [
+        f"Jump to navigation. From the free encyclopedia about {topic}. Article {number} covers {topic} "
+        f"in period {number % 13}, with {number * 7} sources. Retrieved from the archive. Privacy policy. Contact us."
+        for number in range(500)
+    ]
+
+
+@pytest.fixture(scope="module")
+def dictionaries():
+    return {1: train_dictionary(sample_pages("history"), size=4096), 2: train_dictionary(sample_pages("cooking"), size=4096)}
+
+
+def reader_for(dictionaries, loaded=None):
+    def load_dictionary(dictionary_id):
+        if loaded is not None:
+            loaded.append(dictionary_id)
+        return dictionaries[dictionary_id]
+
+    return BodyReader(load_dictionary)
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_round_trip_without_a_dictionary(dictionaries, text):
+    codec = PageCodec()
+    assert codec.dictionary_id is None
+    assert reader_for(dictionaries).decompress(codec.name, None, codec.compress(text)) == text
+
+
+@pytest.mark.parametrize("text", TEXTS + sample_pages("history")[:3])
+def test_round_trip_with_a_trained_dictionary(dictionaries, text):
+    codec = PageCodec(level=5, dictionary=dictionaries[1], dictionary_id=1)
+    assert codec.dictionary_id == 1
+    # Bodies come back from psycopg2 as memoryview
+    assert reader_for(dictionaries).decompress(codec.name, 1, memoryview(codec.compress(text))) == text
+
+
+def test_trained_dictionary_shrinks_similar_pages(dictionaries):
+    page = sample_pages("history")[321]
+    with_dictionary = PageCodec(dictionary=dictionaries[1], dictionary_id=1).compress(page)
+    assert len(with_dictionary) < len(PageCodec().compress(page)) / 2
+
+
+def test_reader_loads_each_dictionary_once(dictionaries):
+    loaded = []
+    reader = reader_for(dictionaries, loaded)
+    codecs = {None: PageCodec(), 1: PageCodec(dictionary=dictionaries[1], dictionary_id=1),
+              2: PageCodec(dictionary=dictionaries[2], dictionary_id=2)}
+    for text in TEXTS * 3:
+        for dictionary_id, codec in codecs.items():
+            assert reader.decompress(codec.name, dictionary_id, codec.compress(text)) == text
+    assert loaded == [1, 2]
+
+
+def test_legacy_uncompressed_pages_are_read_as_is(dictionaries):
+    loaded = []
+    reader = reader_for(dictionaries, loaded)
+    # A page stored as JSONB before compression has its text and no body
+    assert reader.page_text("Old page text", None, None, None) == "Old page text"
+    # Its text wins over an older compressed body left behind
+    assert reader.page_text("New page text", "zstd", None, PageCodec().compress("Old page text")) == "New page text"
+    assert reader.page_text(None, "zstd", 2, PageCodec(dictionary=dictionaries[2], dictionary_id=2).compress("Body")) == "Body"
+    assert loaded == [2]
+
+
+def test_mismatched_dictionary_is_rejected(dictionaries):
+    body = PageCodec(dictionary=dictionaries[1], dictionary_id=1).compress(sample_pages("history")[7])
+    with pytest.raises(ValueError, match="dictionary 2"):
+        reader_for(dictionaries).decompress("zstd", 2, body)
+    with pytest.raises(ValueError, match="dictionary None"):
+        reader_for(dictionaries).decompress("zstd", None, body)
+
+
+def test_unknown_codec_is_rejected(dictionaries):
+    with pytest.raises(ValueError, match="codec"):
+        reader_for(dictionaries).decompress("gzip", None, b"")
+
+
+def test_text_hash():
+    assert text_hash("Rome") == text_hash("Rome")
+    assert text_hash("Rome") != text_hash("rome")
+    assert len(text_hash("")) == 16
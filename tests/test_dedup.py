@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+from dedup import NearDuplicateIndex, simhash
+
+
+def distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def random_text(rng, words=300):
+    return " ".join(f"word{rng.randrange(5000)}" for _ in range(words))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_simhash_keeps_near_duplicates_close_and_distinct_pages_apart(seed):
+    rng = random.Random(seed)
+    text = random_text(rng)
+    words = text.split()
+    words[rng.randrange(len(words))] = "changed"
+    edited = " ".join(words)
+
+    # A changed word moves the few shingles holding it, which flips only the bits whose vote was close
+    assert simhash(text) == simhash(text.upper())
+    assert distance(simhash(text), simhash(edited)) <= 10
+    assert distance(simhash(text), simhash(random_text(rng))) >= 16
+
+
+def test_near_duplicate_pages_are_caught_and_distinct_pages_are_not():
+    rng = random.Random(1)
+    index = NearDuplicateIndex(max_distance=3)
+    original = random_text(rng)
+    assert index.check("https://a.example.com/", simhash(original)) is None
+
+    words = original.split()
+    words[142] = "changed"
+    mirror = simhash(" ".join(words))
+    assert 0 < distance(simhash(original), mirror) <= index.max_distance
+    assert index.check("https://mirror.example.com/", mirror) == "https://a.example.com/"
+    assert index.check("https://b.example.com/", simhash(random_text(rng))) is None
+    # Duplicates cluster on the URL the page was first seen at, and are not indexed themselves
+    assert len(index) == 2
+
+
+@pytest.mark.parametrize("max_distance", [0, 3, 6])
+def test_find_agrees_with_brute_force(max_distance):
+    rng = random.Random(max_distance)
+    index = NearDuplicateIndex(max_distance)
+    indexed = {}
+    bases = [rng.getrandbits(64) for _ in range(50)]
+    for number in range(300):
+        fingerprint = rng.choice(bases)
+        for bit in rng.sample(range(64), rng.randint(0, 2 * max_distance + 2)):
+            fingerprint ^= 1 << bit
+
+        found = index.find(fingerprint)
+        near = {url for url, other in indexed.items() if distance(other, fingerprint) <= max_distance}
+        if near:
+            assert found in near
+        else:
+            assert found is None
+
+        url = f"https://example.com/{number}"
+        index.add(url, fingerprint)
+        indexed[url] = fingerprint
+
+
+def test_a_page_is_not_its_own_duplicate_and_readding_replaces_it():
+    index = NearDuplicateIndex(max_distance=3)
+    index.add("https://example.com/", 0b1111)
+    assert index.find(0b1111, "https://example.com/") is None
+    assert index.find(0b0111) == "https://example.com/"
+
+    index.add("https://example.com/", 1 << 63)
+    assert index.find(0b1111) is None
+    assert index.find(1 << 63) == "https://example.com/"
+    assert len(index) == 1
@@ -0,0 +1,62 @@
+import pytest
+
+from extraction import parse_document_bs4, parse_document_streaming
+
+DISALLOWED_EXTENSIONS = [".jpg", ".png", ".gif", ".svg", ".pdf", ".doc", ".zip", ".exe", ".tar.gz"]
+
+DOCUMENTS = {
+    "plain": "<html><head><title>Title</title></head><body><p>Hello <b>world</b></p></body></html>",
+    "named entities": "<title>Caf&eacute; &amp; bar</title><p>&lt;tag&gt; &copy; &nbsp;x &unknownentity; &amp</p>",
+    "numeric entities": "<title>&#169; &#xA9; &#x1F600;</title><p>&#65;&#x42; &#0; &#128; &#x110000; &#9999999999;</p>",
+    "charrefs without semicolon": "<p>&amp x &lt y &#65 z &copy2024 &notit; &notin</p>",
+    "unclosed tags": "<html><body><div><p>one<p>two<li>three<div>four",
+    "void tags": "<p>line<br>break<br/>again<img src=a.png><hr>rule<input value=x>end</p>",
+    "script style template noscript": (
+        "<head><style>p { color: red }</style><script>var a = '<p>not text</p>';</script></head>"
+        "<body><template><p>template text</p></template><noscript>noscript text</noscript>"
+        "<script type='application/ld+json'>{\"a\": 1}</script>visible</body>"
+    ),
+    "nested title": "<title>Outer <title>Inner</title> tail</title><p>body</p>",
+    "repeated title": "<head><title>First</title><title>Second</title></head><body>text</body>",
+    "empty title": "<title></title><p>text</p>",
+    "title with markup": "<title>Bold <b>move</b></title>",
+    "svg title": "<body><svg><title>Icon</title></svg><p>text</p></body>",
+    "no title": "<p>just text</p>",
+    "cdata and comments": "<p>before<!-- a comment --><![CDATA[ raw <data> ]]>after<!--unclosed",
+    "doctype and processing instruction": "<!DOCTYPE html><?xml version='1.0'?><p>text</p>",
+    "og description": (
+        "<meta property='og:description' content='  A   described   page '>"
+        "<meta name='description' content='ignored'><p>text</p>"
+    ),
+    "description from text": "<p>" + " ".join(f"word{number}" for number in range(300)) + "</p>",
+    "whitespace": "<p>\n\n  spaced\t\tout   \r\n text  </p>\n<pre>  keep\n  lines </pre>",
+    "links": (
+        "<base href='https://other.example.com/'>"
+        "<a href='/absolute'>a</a><a href='relative/path?utm_source=x&b=2'>b</a>"
+        "<a href='../up#fragment'>c</a><a href='javascript:alert(1)'>d</a><a href='mailto:me@example.com'>e</a>"
+        "<a href='https://example.com/image.JPG'>f</a><a href='//cdn.example.com/x'>g</a><a>no href</a>"
+        "<a href=''>empty</a><a href='  https://example.com/spaced  '>h</a><a href='/absolute'>again</a>"
+        "<A HREF='/upper'>i</A><area href='/area'><link href='/style.css'>"
+    ),
+    "attributes with entities": "<a href='/search?a=1&amp;b=2&copy=3'>x</a><a href='/x?q=&quot;y&quot;'>y</a>",
+    "mismatched end tags": "<div><span>one</div>two</span></p>three</body>four",
+    "uppercase tags": "<HTML><HEAD><TITLE>Upper</TITLE></HEAD><BODY><P>Text</P></BODY></HTML>",
+    "empty": "",
+}
+
+BYTES_DOCUMENTS = {
+    "utf-8 bytes": "<title>Ünïcode ✓</title><p>naïve café</p>".encode("utf-8"),
+    "latin-1 bytes": "<title>Café</title><p>naïve</p>".encode("latin-1"),
+    "declared charset": '<meta charset="windows-1252"><title>\x93quoted\x94</title>'.encode("latin-1"),
+    "invalid utf-8": b"<title>broken \xff\xfe bytes</title><p>\xc3(</p>",
+    "utf-16 bom": "<title>Sixteen</title><p>bits</p>".encode("utf-16"),
+}
+
+
+# The processing instruction case looks like XML to BeautifulSoup, which warns about it
+@pytest.mark.filterwarnings("ignore::bs4.XMLParsedAsHTMLWarning")
+@pytest.mark.parametrize("name", list(DOCUMENTS) + list(BYTES_DOCUMENTS))
+def test_streaming_extractor_matches_beautifulsoup(name):
+    content = DOCUMENTS.get(name, BYTES_DOCUMENTS.get(name))
+    arguments = ("https://example.com/page", "https://example.com/dir/page", DISALLOWED_EXTENSIONS)
+    assert parse_document_streaming(content, *arguments) == parse_document_bs4(content, *arguments)
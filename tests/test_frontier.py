@@ -0,0 +1,154 @@
+import pytest
+
+from frontier import Frontier, RobotsCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def drain(frontier):
+    """Every URL the frontier hands out right now, each reported done at once."""
+    urls = []
+    while True:
+        url = frontier.next_url()
+        if url is None:
+            return urls
+        frontier.done(url)
+        urls.append(url)
+
+
+def test_priority_order_across_hosts(clock):
+    frontier = Frontier(host_concurrency=10, host_delay=0, clock=clock)
+    frontier.add("https://a.com/low", 1)
+    frontier.add("https://b.com/high", 5)
+    frontier.add("https://a.com/mid", 3)
+    frontier.add("https://c.com/first", 3)
+
+    assert drain(frontier) == ["https://b.com/high", "https://a.com/mid", "https://c.com/first", "https://a.com/low"]
+    assert len(frontier) == 0
+
+
+def test_equal_priorities_keep_insertion_order(clock):
+    frontier = Frontier(host_delay=0, clock=clock)
+    for number in range(5):
+        frontier.add(f"https://a.com/{number}")
+    assert drain(frontier) == [f"https://a.com/{number}" for number in range(5)]
+
+
+def test_per_host_delay(clock):
+    frontier = Frontier(host_concurrency=10, host_delay=1.0, clock=clock)
+    for number in range(3):
+        frontier.add(f"https://a.com/{number}")
+    frontier.add("https://b.com/0")
+    frontier.set_delay("b.com", 5.0)
+
+    assert sorted([frontier.next_url(), frontier.next_url()]) == ["https://a.com/0", "https://b.com/0"]
+    assert frontier.next_url() is None
+    assert frontier.wait_time() == pytest.approx(1.0)
+
+    clock.now = 0.5
+    assert frontier.next_url() is None
+    clock.now = 1.0
+    assert frontier.next_url() == "https://a.com/1"
+    assert frontier.next_url() is None
+    clock.now = 2.0
+    assert frontier.next_url() == "https://a.com/2"
+
+
+def test_host_concurrency(clock):
+    frontier = Frontier(host_concurrency=2, host_delay=0, clock=clock)
+    for number in range(4):
+        frontier.add(f"https://a.com/{number}")
+    frontier.add("https://b.com/0", -1)
+
+    first, second = frontier.next_url(), frontier.next_url()
+    assert (first, second) == ("https://a.com/0", "https://a.com/1")
+    # a.com is busy with two fetches, so the worse b.com URL goes next
+    assert frontier.next_url() == "https://b.com/0"
+    assert frontier.next_url() is None
+    assert frontier.wait_time() is None
+    assert frontier.in_flight == 3
+
+    frontier.done(first)
+    assert frontier.next_url() == "https://a.com/2"
+    assert frontier.next_url() is None
+
+
+def test_idle_hosts_are_forgotten_once_their_delay_ends(clock):
+    frontier = Frontier(host_delay=1.0, clock=clock)
+    for number in range(100):
+        frontier.add(f"https://host{number}.com/")
+    for url in drain(frontier):
+        assert url.startswith("https://host")
+
+    # Done within their delay, the hosts are kept so a new URL still waits it out
+    assert len(frontier.hosts) == 100
+    frontier.add("https://host0.com/again")
+    assert frontier.next_url() is None
+
+    clock.now = 1.0
+    assert frontier.next_url() == "https://host0.com/again"
+    frontier.done("https://host0.com/again")
+    assert list(frontier.hosts) == ["host0.com"]
+    assert frontier.saturated_hosts(1) == []
+
+    clock.now = 2.0
+    assert frontier.next_url() is None
+    assert frontier.hosts == {}
+    assert frontier.in_flight == 0 and len(frontier) == 0
+
+
+def test_hosts_without_delay_are_forgotten_when_done(clock):
+    frontier = Frontier(host_delay=0, clock=clock)
+    frontier.add("https://a.com/")
+    frontier.done(frontier.next_url())
+    assert frontier.hosts == {}
+
+
+def test_saturated_hosts(clock):
+    frontier = Frontier(clock=clock)
+    for number in range(3):
+        frontier.add(f"https://a.com/{number}")
+    frontier.add("https://b.com/0")
+    assert frontier.saturated_hosts(3) == ["a.com"]
+    assert sorted(frontier.saturated_hosts(1)) == ["a.com", "b.com"]
+
+
+def test_robots_rules_and_crawl_delay(clock):
+    robots = RobotsCache("gibble", ttl=100, error_ttl=10, clock=clock)
+    url = "https://a.com/private/page"
+    assert robots.get(url) is None
+
+    rules = robots.store(url, 200, "User-agent: *\nDisallow: /private\nCrawl-delay: 3\n")
+    assert robots.get("https://a.com/other") is rules
+    assert not robots.allowed(rules, url)
+    assert robots.allowed(rules, "https://a.com/public")
+    assert robots.crawl_delay(rules) == 3.0
+
+    clock.now = 100
+    assert robots.get(url) is None
+
+
+def test_robots_errors(clock):
+    robots = RobotsCache("gibble", ttl=100, error_ttl=10, clock=clock)
+    missing = robots.store("https://a.com/", 404, "")
+    assert robots.allowed(missing, "https://a.com/anything")
+    assert robots.crawl_delay(missing) is None
+
+    # An unreachable robots.txt disallows everything, but only for error_ttl
+    for status in (503, None):
+        unreachable = robots.store("https://b.com/", status, "")
+        assert not robots.allowed(unreachable, "https://b.com/anything")
+    clock.now = 10
+    assert robots.get("https://b.com/") is None
+    assert robots.get("https://a.com/") is missing
@@ -0,0 +1,119 @@
+import base64
+import hashlib
+import json
+
+import pytest
+
+import frontend.main
+from frontend.main import app
+from frontend.pagination import decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize("query, offset", [("roman empire", 0), ('"roman empire"~2 city', 10), ("café ünïcode", 90), ("", 5)])
+def test_cursor_round_trip(query, offset):
+    cursor = encode_cursor(query, offset)
+    assert decode_cursor(cursor) == (query, offset)
+    assert cursor.replace("-", "").replace("_", "").isalnum()
+
+
+def forged(payload):
+    """A cursor-like token without a valid signature."""
+    return base64.urlsafe_b64encode(json.dumps(payload).encode() + b"\0" * 8).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "!!!!",
+    "é",
+    "a",
+    base64.urlsafe_b64encode(b"not json at all").decode(),
+    forged({"q": "roman", "o": 1000}),
+    forged([1, 2]),
+])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_tampered_cursors_are_rejected():
+    cursor = encode_cursor("roman", 10)
+    token = bytearray(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    for index in range(len(token)):
+        tampered = bytearray(token)
+        tampered[index] ^= 0x01
+        with pytest.raises(ValueError):
+            decode_cursor(base64.urlsafe_b64encode(bytes(tampered)).decode())
+    with pytest.raises(ValueError):
+        decode_cursor(cursor[:-2])
+
+
+def test_cursors_are_keyed_with_the_secret(monkeypatch):
+    cursor = encode_cursor("roman", 10)
+    monkeypatch.setenv("SEARCH_CURSOR_SECRET", "another deployment")
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+    assert decode_cursor(encode_cursor("roman", 10)) == ("roman", 10)
+
+
+def test_cursors_cannot_be_minted_without_the_secret(monkeypatch):
+    monkeypatch.delenv("SEARCH_CURSOR_SECRET", raising=False)
+    payload = json.dumps({"q": "roman", "o": 10}, separators=(",", ":")).encode()
+    # Signed as with an empty key, which anyone could compute
+    signature = hashlib.blake2b(payload, digest_size=8, key=b"").digest()
+    with pytest.raises(ValueError):
+        decode_cursor(base64.urlsafe_b64encode(payload + signature).decode().rstrip("="))
+    assert decode_cursor(encode_cursor("roman", 10)) == ("roman", 10)
+
+
+class FakeDatabase:
+    """Serves numbered results for any query, without a database."""
+
+    def __init__(self, total):
+        self.total = total
+
+    def search_page(self, query, limit=10, offset=0):
+        results = [
+            {"url": f"https://example.com/{number}", "title": f"Page {number}", "description": "", "added_at": "2024-01-02", "score": 1.0, "snippet": None}
+            for number in range(offset, min(offset + limit, self.total))
+        ]
+        return {"results": results, "offset": offset, "has_more": offset + limit < self.total}, {"total": 1.0}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(frontend.main.Database, "shared", classmethod(lambda cls: FakeDatabase(25)))
+    return app.test_client()
+
+
+def test_api_follows_cursors_to_the_last_page(client):
+    urls = []
+    response = client.get("/api/search?query=roman&limit=10")
+    while True:
+        assert response.status_code == 200
+        page = response.get_json()
+        assert page["query"] == "roman" and page["offset"] == len(urls)
+        urls += [result["url"] for result in page["results"]]
+        if not page["next_cursor"]:
+            break
+        response = client.get("/api/search", query_string={"cursor": page["next_cursor"], "limit": 10})
+    assert urls == [f"https://example.com/{number}" for number in range(25)]
+    assert response.headers["Server-Timing"] == "total;dur=1.0"
+
+
+@pytest.mark.parametrize("query_string", [
+    {"cursor": "!!!!"},
+    {"cursor": forged({"q": "roman", "o": 10})},
+    {"query": "other", "cursor": encode_cursor("roman", 10)},
+    {},
+])
+def test_api_answers_400_for_bad_cursors(client, query_string):
+    response = client.get("/api/search", query_string=query_string)
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_search_page_redirects_on_bad_cursors(client):
+    response = client.get("/search", query_string={"query": "roman", "cursor": "!!!!"})
+    assert response.status_code == 302
+    page = client.get("/search", query_string={"query": "roman", "cursor": encode_cursor("roman", 10)})
+    assert page.status_code == 200 and b"Results 11-20" in page.data
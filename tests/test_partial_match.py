@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+
+import psycopg2
+import pytest
+
+from common.segments import SegmentIndex, add_segment
+from common.shards import Shard
+from frontend.database import Database
+
+# Document frequency of every term of the fixture dictionary
+VOCABULARY = {
+    "nat": 1, "nation": 5, "national": 8, "nationwide": 2, "native": 3,
+    "international": 6, "rational": 2, "station": 4,
+}
+
+
+def add_documents(directory, doc_ids):
+    """A segment of doc_ids where document i holds every term whose frequency is above i."""
+    documents = [(doc_id, 10, {"url": f"https://example.com/{doc_id}"}) for doc_id in doc_ids]
+    postings = [
+        (term, [(ordinal, 1, [0]) for ordinal, doc_id in enumerate(doc_ids) if doc_id < df])
+        for term, df in sorted(VOCABULARY.items())
+    ]
+    add_segment(directory, documents, [(term, rows) for term, rows in postings if rows])
+
+
+@pytest.fixture
+def segments(tmp_path):
+    directory = str(tmp_path)
+    # Two segments, so frequencies are summed over both
+    add_documents(directory, [0, 1, 2, 3])
+    add_documents(directory, [4, 5, 6, 7])
+    return SegmentIndex(directory, reload_interval=0)
+
+
+@pytest.fixture
+def terms_cursor():
+    """A cursor whose terms table holds the fixture dictionary, skipped without a database."""
+    try:
+        connection = psycopg2.connect(**Shard("main").connection_parameters())
+    except (ValueError, psycopg2.OperationalError) as error:
+        pytest.skip(f"No database to test with: {error}")
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                CREATE TEMP TABLE terms (
+                    term_id SERIAL PRIMARY KEY,
+                    term TEXT NOT NULL,
+                    df INTEGER NOT NULL,
+                    max_tf INTEGER NOT NULL,
+                    min_length INTEGER NOT NULL
+                );
+            """)
+            cursor.executemany(
+                "INSERT INTO terms (term, df, max_tf, min_length) VALUES (%s, %s, 1, 10);", sorted(VOCABULARY.items())
+            )
+            yield cursor
+    finally:
+        connection.rollback()
+        connection.close()
+
+
+def test_segments_match_prefixes_most_frequent_first(segments):
+    snapshot = segments.snapshot()
+    assert segments.prefix_terms("nation", 10, snapshot) == [("national", 8), ("nation", 5), ("nationwide", 2)]
+    assert segments.prefix_terms("nat", 2, snapshot) == [("national", 8), ("nation", 5)]
+    assert segments.prefix_terms("zebra", 10, snapshot) == []
+
+
+def test_segments_scan_at_most_max_scan_terms_per_segment(segments):
+    # "nat" and "nation" come first in the first segment, "nation" and "national" in the second one
+    assert segments.prefix_terms("nat", 10, segments.snapshot(), max_scan=2) == [
+        ("nation", 5), ("national", 4), ("nat", 1),
+    ]
+
+
+def test_postgres_also_matches_inside_terms(segments, terms_cursor):
+    database = SimpleNamespace(has_trigram_index=None, similarity_threshold=0.3, partial_term_limit=100)
+    rows = Database.match_partial_terms(database, terms_cursor, ["nation"])
+    postgres_terms = {row[2] for row in rows}
+    segment_terms = {term for term, _ in segments.prefix_terms("nation", 100, segments.snapshot())}
+
+    # Every prefix match is a Postgres match too, which also finds the word inside longer terms
+    assert segment_terms == {"nation", "national", "nationwide"}
+    assert segment_terms <= postgres_terms
+    assert "international" in postgres_terms - segment_terms
+    assert {row[3] for row in rows if row[2] in segment_terms} == {VOCABULARY[term] for term in segment_terms}
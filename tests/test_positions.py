@@ -0,0 +1,141 @@
+import random
+
+import numpy as np
+import pytest
+
+from common.positions import decode_positions, decode_varints, encode_positions, encode_varints, match_phrase
+from common.tokenizer import index_term, tokenize
+from frontend.snippets import make_snippet
+
+
+def test_varints_round_trip():
+    rng = random.Random(0)
+    values = [0, 1, 127, 128, 255, 16383, 16384, 2 ** 32, 2 ** 64 - 1]
+    values += [rng.getrandbits(rng.randint(1, 64)) for _ in range(1000)]
+    out = bytearray()
+    encode_varints(values, out)
+    assert decode_varints(bytes(out)).tolist() == values
+    assert decode_varints(b"").tolist() == []
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_positions_round_trip(seed):
+    rng = random.Random(seed)
+    postings = [
+        sorted(rng.sample(range(rng.choice((10, 1000, 10 ** 6))), rng.randint(0, 8)))
+        for _ in range(rng.randint(1, 30))
+    ]
+    blobs = [encode_positions(positions) for positions in postings]
+    flat = decode_positions(blobs, [len(positions) for positions in postings])
+    assert flat.tolist() == [position for positions in postings for position in positions]
+
+
+def brute_force_phrase(documents, phrase, slop):
+    """Doc ids where every word sits at its offset from the rarest word's position, give or take slop."""
+    positions = {
+        offset: {doc_id: [position for position, word in enumerate(words) if word == term] for doc_id, words in documents.items()}
+        for offset, term in phrase
+    }
+    # The rarest word is the one with the fewest positions overall, the first of them on a tie
+    anchor = min(phrase, key=lambda item: sum(len(found) for found in positions[item[0]].values()))[0]
+    matches = []
+    for doc_id in sorted(documents):
+        for start in positions[anchor][doc_id]:
+            if all(
+                any(abs(position - (start - anchor + offset)) <= slop for position in positions[offset][doc_id])
+                for offset, _ in phrase
+            ):
+                matches.append(doc_id)
+                break
+    return matches
+
+
+def phrase_terms(documents, phrase):
+    """match_phrase() input for (offset, term) pairs over {doc_id: words}."""
+    terms = []
+    for offset, term in phrase:
+        doc_ids, counts, positions = [], [], []
+        for doc_id in sorted(documents):
+            found = [position for position, word in enumerate(documents[doc_id]) if word == term]
+            if found:
+                doc_ids.append(doc_id)
+                counts.append(len(found))
+                positions.extend(found)
+        terms.append((offset, *(np.asarray(values, dtype=np.int64) for values in (doc_ids, counts, positions))))
+    return terms
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_match_phrase_agrees_with_brute_force(seed):
+    rng = random.Random(seed)
+    vocabulary = ["roman", "empire", "river", "city", "army"][:rng.randint(2, 5)]
+    documents = {
+        rng.getrandbits(30): [rng.choice(vocabulary) for _ in range(rng.randint(0, 40))]
+        for _ in range(rng.randint(1, 20))
+    }
+    # Offsets may skip words, like the unindexed common words of a phrase
+    offset = 0
+    phrase = []
+    for _ in range(rng.randint(1, 3)):
+        phrase.append((offset, rng.choice(vocabulary)))
+        offset += rng.choice((1, 1, 2))
+    slop = rng.choice((0, 0, 1, 3))
+
+    assert match_phrase(phrase_terms(documents, phrase), slop).tolist() == brute_force_phrase(documents, phrase, slop)
+
+
+def test_match_phrase_exact_and_proximity():
+    documents = {1: "the roman empire fell".split(), 2: "empire of the roman kind".split(), 3: "roman city empire".split()}
+    phrase = [(0, "roman"), (1, "empire")]
+    assert match_phrase(phrase_terms(documents, phrase)).tolist() == [1]
+    assert match_phrase(phrase_terms(documents, phrase), slop=1).tolist() == [1, 3]
+    assert match_phrase([]).tolist() == []
+
+
+def test_tokenize_uses_the_index_term_rules():
+    text = "The Roman, empire! of 1984 ROMAN café roman-ish Empire"
+    assert tokenize(text) == {"roman": [1, 5], "empire": [2, 8]}
+    assert [index_term(word) for word in text.split()] == [None, "roman", "empire", None, None, "roman", None, None, "empire"]
+
+
+def snippet_text(fragments):
+    return "".join(text for text, _ in fragments).removeprefix("… ").removesuffix(" …")
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_snippet_window(seed):
+    rng = random.Random(seed)
+    # Filler words are unique, so the window shown can be located in the excerpt
+    words = [rng.choice(("Roman", "empire,", "river", f"w{index}", f"w{index}")) for index in range(rng.randint(1, 120))]
+    terms = set(rng.sample(["roman", "empire", "river"], rng.randint(1, 3)))
+    width = rng.choice((10, 30))
+
+    fragments = make_snippet(" ".join(words), terms, width=width)
+
+    hits = [position for position, word in enumerate(words) if word.lower().strip(",") in terms]
+    if not hits:
+        assert fragments is None
+        return
+
+    text = snippet_text(fragments)
+    begin = next(start for start in range(len(words)) if " ".join(words[start:start + width]) == text)
+    assert text == " ".join(words[begin:begin + width])
+    assert fragments[0][0].startswith("… ") == (begin > 0)
+    assert fragments[-1][0].endswith(" …") == (begin + width < len(words))
+
+    # Exactly the query terms are highlighted
+    highlighted = [word for text, is_highlighted in fragments if is_highlighted for word in text.split()]
+    assert highlighted == [words[position] for position in hits if begin <= position < begin + width]
+
+    # The window shows a hit that starts a window with the most distinct terms, then the most hits
+    def score(start):
+        window = [position for position in hits if start <= position < start + width]
+        return len({words[position].lower().strip(",") for position in window}), len(window)
+    best = max(score(start) for start in hits)
+    assert any(score(start) == best for start in hits if begin <= start < begin + width)
+
+
+def test_snippet_without_terms():
+    assert make_snippet("", {"roman"}) is None
+    assert make_snippet("roman empire", set()) is None
+    assert make_snippet("nothing to see", {"roman"}) is None
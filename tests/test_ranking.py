@@ -0,0 +1,95 @@
+import random
+
+import numpy as np
+import pytest
+
+from frontend.ranking import BM25
+
+
+def random_index(rng, doc_count, term_count):
+    """Random sorted postings {term: (doc_ids, tfs, lengths)} with few distinct tfs and lengths, so scores tie."""
+    lengths = {doc_id: rng.choice((5, 10, 20, 40)) for doc_id in range(1, doc_count + 1)}
+    postings = {}
+    for term in range(term_count):
+        df = rng.randint(0, doc_count) if rng.random() < 0.2 else rng.randint(1, max(1, doc_count // rng.choice((1, 4, 20))))
+        doc_ids = sorted(rng.sample(range(1, doc_count + 1), df))
+        postings[f"term{term}"] = (
+            np.asarray(doc_ids, dtype=np.int64),
+            np.asarray([rng.choice((1, 1, 2, 3)) for _ in doc_ids], dtype=np.int64),
+            np.asarray([lengths[doc_id] for doc_id in doc_ids], dtype=np.int64),
+        )
+    return postings, sum(lengths.values()) / doc_count
+
+
+def exhaustive_and_pruned(ranker, postings, avg_length, doc_count, k):
+    terms = {
+        key: (
+            ranker.idf(len(doc_ids), doc_count),
+            len(doc_ids),
+            int(tfs.max()) if len(tfs) else None,
+            int(lengths.min()) if len(lengths) else None,
+        )
+        for key, (doc_ids, tfs, lengths) in postings.items()
+    }
+
+    def fetch(keys):
+        return {key: postings[key] for key in keys}
+
+    def lookup(keys, doc_ids):
+        restricted = {}
+        for key in keys:
+            term_doc_ids, tfs, lengths = postings[key]
+            found = np.isin(term_doc_ids, doc_ids)
+            restricted[key] = (term_doc_ids[found], tfs[found], lengths[found])
+        return restricted
+
+    flat = [
+        (doc_id, terms[key][0], tf, length)
+        for key, (doc_ids, tfs, lengths) in postings.items()
+        for doc_id, tf, length in zip(doc_ids.tolist(), tfs.tolist(), lengths.tolist())
+    ]
+    doc_ids, weights, tfs, lengths = (list(column) for column in zip(*flat)) if flat else ([], [], [], [])
+    exhaustive = ranker.top_k(k, doc_ids, weights, tfs, lengths, avg_length)
+    pruned = ranker.top_k_pruned(k, terms, avg_length, fetch, lookup)
+    return exhaustive, pruned
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_max_score_matches_exhaustive_top_k(seed):
+    rng = random.Random(seed)
+    doc_count = rng.choice((5, 50, 300))
+    postings, avg_length = random_index(rng, doc_count, rng.randint(1, 5))
+    k = rng.choice((1, 3, 10, 100, 1000))
+
+    exhaustive, pruned = exhaustive_and_pruned(BM25(probe_ratio=rng.choice((1, 8))), postings, avg_length, doc_count, k)
+
+    assert [doc_id for doc_id, _ in pruned] == [doc_id for doc_id, _ in exhaustive]
+    assert [score for _, score in pruned] == pytest.approx([score for _, score in exhaustive])
+
+
+def test_k_larger_than_matches_returns_every_match():
+    rng = random.Random(1)
+    postings, avg_length = random_index(rng, 30, 3)
+    matches = set().union(*(doc_ids.tolist() for doc_ids, _, _ in postings.values()))
+
+    exhaustive, pruned = exhaustive_and_pruned(BM25(), postings, avg_length, 30, 10 * len(matches) + 1)
+
+    assert pruned == exhaustive
+    assert {doc_id for doc_id, _ in pruned} == matches
+
+
+def test_ties_are_broken_by_the_smaller_doc_id():
+    # Every document has the same tf and length, so they all score the same
+    doc_ids = np.arange(1, 21, dtype=np.int64)
+    postings = {"term": (doc_ids, np.ones(20, dtype=np.int64), np.full(20, 10, dtype=np.int64))}
+
+    exhaustive, pruned = exhaustive_and_pruned(BM25(), postings, 10.0, 100, 5)
+
+    assert [doc_id for doc_id, _ in exhaustive] == [1, 2, 3, 4, 5]
+    assert pruned == exhaustive
+
+
+def test_no_terms_or_postings():
+    ranker = BM25()
+    assert ranker.top_k_pruned(10, {}, 10.0, None, None) == []
+    assert ranker.top_k(10, [], [], [], [], 10.0) == []
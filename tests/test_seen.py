@@ -0,0 +1,57 @@
+from seen import ScalableBloomFilter
+
+
+def urls(prefix, count):
+    return [f"https://{prefix}.example.com/page/{number}" for number in range(count)]
+
+
+def test_no_false_negatives_after_growth():
+    seen = ScalableBloomFilter(initial_capacity=1000, error_rate=0.01)
+    added = urls("added", 20000)
+    assert seen.add_new(added) == added
+    assert len(seen.filters) > 1
+
+    assert all(url in seen for url in added)
+    assert seen.add_new(added) == []
+
+
+def test_false_positive_rate_stays_within_target_after_growth():
+    seen = ScalableBloomFilter(initial_capacity=1000, error_rate=0.01, tightening=0.5)
+    seen.add_new(urls("added", 30000))
+    assert len(seen.filters) >= 4
+
+    probes = urls("unseen", 50000)
+    false_positives = len(probes) - len(seen.add_new(probes))
+    assert false_positives / len(probes) <= seen.error_rate / (1 - seen.tightening)
+
+
+def test_add_new_keeps_order_and_drops_repeats():
+    seen = ScalableBloomFilter(initial_capacity=100)
+    assert seen.add_new(["b", "a", "b", "c"]) == ["b", "a", "c"]
+    assert seen.add_new(["c", "d", "a", "e"]) == ["d", "e"]
+    assert len(seen) == 5
+    assert seen.add_new([]) == []
+
+
+def test_save_and_load_preserve_membership(tmp_path):
+    seen = ScalableBloomFilter(initial_capacity=500, error_rate=0.001)
+    added = urls("added", 3000)
+    seen.add_new(added)
+    path = str(tmp_path / "seen.npz")
+    seen.save(path)
+
+    loaded = ScalableBloomFilter.load(path)
+    assert len(loaded) == len(seen)
+    assert [bloom.count for bloom in loaded.filters] == [bloom.count for bloom in seen.filters]
+    assert loaded.add_new(added) == []
+
+    # Both answer the same for unseen URLs, false positives included, and keep growing alike
+    probes = urls("unseen", 5000)
+    assert loaded.add_new(probes) == seen.add_new(probes)
+    assert len(loaded.filters) == len(seen.filters)
+
+    # Saving again replaces the file
+    loaded.save(path)
+    reloaded = ScalableBloomFilter.load(path)
+    assert len(reloaded) == len(loaded)
+    assert reloaded.add_new(added + probes) == []
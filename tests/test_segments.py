@@ -0,0 +1,164 @@
+import os
+import random
+
+import numpy as np
+import pytest
+
+from common.segments import (
+    Segment, SegmentIndex, SegmentMerger, add_segment, merge_segments, read_manifest, write_segment,
+)
+
+VOCABULARY = ["apple", "banana", "café", "cafe", "zebra", "a", "ab", "abc", "ünïcode", "river"]
+
+
+def random_documents(rng, doc_ids):
+    """{doc_id: (length, card, {term: positions})} with every document holding at least one term."""
+    documents = {}
+    for doc_id in doc_ids:
+        length = rng.randint(1, 300)
+        terms = {}
+        for term in rng.sample(VOCABULARY, rng.randint(1, 5)):
+            terms[term] = sorted(rng.sample(range(length + 200), rng.randint(1, 6)))
+        card = {"url": f"https://example.com/{doc_id}", "title": f"Page {doc_id}", "added_at": "2024-01-02"}
+        documents[doc_id] = (length, card, terms)
+    return documents
+
+
+def segment_input(documents):
+    """write_segment() arguments for a {doc_id: (length, card, terms)} model."""
+    doc_ids = sorted(documents)
+    rows = [(doc_id, documents[doc_id][0], documents[doc_id][1]) for doc_id in doc_ids]
+    postings = {}
+    for ordinal, doc_id in enumerate(doc_ids):
+        for term, positions in documents[doc_id][2].items():
+            postings.setdefault(term, []).append((ordinal, len(positions), positions))
+    return rows, sorted(postings.items())
+
+
+def live_view(index):
+    """{term: {doc_id: (tf, length, positions)}} as a SegmentIndex serves it."""
+    snapshot = index.snapshot()
+    view = {}
+    for term, _ in index.vocabulary(snapshot):
+        doc_ids, tfs, lengths = index.postings(term, snapshot)
+        position_doc_ids, counts, positions = index.positions(term, snapshot)
+        assert position_doc_ids.tolist() == doc_ids.tolist()
+        split = np.split(positions, np.cumsum(counts)[:-1]) if len(counts) else []
+        postings = {
+            doc_id: (tf, length, chunk.tolist())
+            for doc_id, tf, length, chunk in zip(doc_ids.tolist(), tfs.tolist(), lengths.tolist(), split)
+        }
+        if postings:
+            view[term] = postings
+    return view
+
+
+def expected_view(documents):
+    view = {}
+    for doc_id, (length, _, terms) in documents.items():
+        for term, positions in terms.items():
+            view.setdefault(term, {})[doc_id] = (len(positions), length, positions)
+    return view
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_segment_round_trip(tmp_path, seed):
+    rng = random.Random(seed)
+    documents = random_documents(rng, rng.sample(range(1, 10 ** 12), 40))
+    rows, postings = segment_input(documents)
+    path = str(tmp_path / "one.gseg")
+    write_segment(path, rows, postings)
+
+    segment = Segment(path)
+    assert segment.doc_ids.tolist() == sorted(documents)
+    assert segment.doc_lengths.tolist() == [documents[doc_id][0] for doc_id in sorted(documents)]
+    assert segment.total_length == sum(length for length, _, _ in documents.values())
+    assert [segment.card(ordinal) for ordinal in range(segment.doc_count)] == [card for _, _, card in rows]
+    assert [segment.term(index) for index in range(segment.term_count)] == [term for term, _ in postings]
+
+    for term, term_postings in postings:
+        index = segment.find(term)
+        ordinals, tfs = segment.postings(index)
+        assert ordinals.tolist() == [ordinal for ordinal, _, _ in term_postings]
+        assert tfs.tolist() == [tf for _, tf, _ in term_postings]
+        assert [positions.tolist() for positions in segment.positions(index)] == [positions for _, _, positions in term_postings]
+        counts, flat = segment.flat_positions(index, tfs)
+        assert counts.tolist() == tfs.tolist()
+        assert flat.tolist() == [position for _, _, positions in term_postings for position in positions]
+
+        record = segment.term_records[index]
+        assert int(record["df"]) == len(term_postings)
+        assert int(record["max_tf"]) == max(tf for _, tf, _ in term_postings)
+        assert int(record["min_length"]) == min(rows[ordinal][1] for ordinal, _, _ in term_postings)
+
+    assert segment.find("missing") == -1
+    start, end = segment.prefix_range("ab")
+    assert [segment.term(index) for index in range(start, end)] == [term for term, _ in postings if term.startswith("ab")]
+
+
+def test_newer_segments_supersede_and_merge_keeps_the_live_postings(tmp_path):
+    rng = random.Random(7)
+    directory = str(tmp_path)
+    live = {}
+    for batch in range(5):
+        # Every batch re-indexes some earlier documents and adds new ones
+        doc_ids = rng.sample(sorted(live), min(len(live), 10)) + list(range(batch * 100, batch * 100 + 20))
+        documents = random_documents(rng, doc_ids)
+        add_segment(directory, *segment_input(documents))
+        live.update(documents)
+
+    index = SegmentIndex(directory, reload_interval=0)
+    before = live_view(index)
+    assert before == expected_view(live)
+    assert index.doc_count == len(live)
+    assert index.total_length == sum(length for length, _, _ in live.values())
+
+    names = read_manifest(directory)["segments"]
+    merge_segments(directory, names[1:4])
+    merge_segments(directory, read_manifest(directory)["segments"])
+
+    assert live_view(SegmentIndex(directory)) == before
+    index.refresh(force=True)
+    assert live_view(index) == before
+    assert index.cards([0, 410, 10 ** 9], index.snapshot()) == {0: live[0][1], 410: live[410][1]}
+
+
+def test_manifest_after_merge(tmp_path):
+    rng = random.Random(3)
+    directory = str(tmp_path)
+    names = [add_segment(directory, *segment_input(random_documents(rng, range(start, start + 5)))) for start in (0, 10, 20, 30)]
+    manifest = read_manifest(directory)
+    assert manifest == {"segments": names, "next_segment": 5, "generation": 4}
+
+    merged = merge_segments(directory, names[1:3])
+
+    manifest = read_manifest(directory)
+    assert manifest == {"segments": [names[0], merged, names[3]], "next_segment": 6, "generation": 5}
+    assert sorted(name for name in os.listdir(directory) if name.endswith(".gseg")) == sorted(manifest["segments"])
+    assert Segment(os.path.join(directory, merged)).doc_ids.tolist() == list(range(10, 15)) + list(range(20, 25))
+
+    # Segments that are no longer neighbours are not merged
+    with pytest.raises(ValueError):
+        merge_segments(directory, [names[0], names[3]])
+    assert read_manifest(directory) == manifest
+
+
+def test_merger_folds_the_smallest_neighbours(tmp_path):
+    rng = random.Random(5)
+    directory = str(tmp_path)
+    sizes = [30, 2, 3, 4, 30]
+    names = []
+    start = 0
+    for size in sizes:
+        names.append(add_segment(directory, *segment_input(random_documents(rng, range(start, start + size)))))
+        start += size
+    before = live_view(SegmentIndex(directory))
+
+    merger = SegmentMerger(directory, max_segments=3, merge_factor=3)
+    assert merger.merge_once()
+    assert not merger.merge_once()
+
+    segments = read_manifest(directory)["segments"]
+    assert len(segments) == 3
+    assert segments[0] == names[0] and segments[2] == names[4]
+    assert live_view(SegmentIndex(directory)) == before
@@ -0,0 +1,136 @@
+import random
+
+import numpy as np
+import pytest
+
+from common.shards import parse_shards, shard_of
+from frontend.database import merge_top_documents, merge_vocabularies
+from frontend.ranking import BM25
+
+URLS = [f"https://example{number % 97}.com/page/{number}" for number in range(20000)]
+
+
+def test_shard_of_is_stable():
+    # Documents already written to a shard must keep hashing to it, in every process
+    assert [shard_of("https://example.com/", count) for count in (1, 2, 3, 8, 100)] == [0, 1, 1, 1, 55]
+    assert [shard_of(url, 4) for url in URLS[:8]] == [2, 2, 2, 2, 3, 1, 1, 1]
+    assert all(shard_of(url, 1) == 0 for url in URLS[:100])
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 7, 16])
+def test_shard_of_spreads_urls_evenly(count):
+    sizes = np.bincount([shard_of(url, count) for url in URLS], minlength=count)
+    assert len(sizes) == count
+    assert sizes.min() > 0.9 * len(URLS) / count
+    assert sizes.max() < 1.1 * len(URLS) / count
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 7, 16])
+def test_adding_a_shard_moves_urls_only_to_it(count):
+    moved = [url for url in URLS if shard_of(url, count) != shard_of(url, count + 1)]
+    assert all(shard_of(url, count + 1) == count for url in moved)
+    assert abs(len(moved) / len(URLS) - 1 / (count + 1)) < 0.02
+
+
+def test_parse_shards():
+    assert parse_shards(None) == []
+    assert parse_shards("  ") == []
+    assert [(shard.name, shard.schema) for shard in parse_shards("3")] == [
+        ("shard_0", "shard_0"), ("shard_1", "shard_1"), ("shard_2", "shard_2"),
+    ]
+
+    shards = parse_shards(" shard_a ; host=db2 dbname=gibble ;postgresql://db3/gibble;")
+    assert [(shard.name, shard.schema, shard.dsn) for shard in shards] == [
+        ("shard_a", "shard_a", None),
+        ("shard_1", None, "host=db2 dbname=gibble"),
+        ("shard_2", None, "postgresql://db3/gibble"),
+    ]
+
+
+@pytest.mark.parametrize("value", ["0", ";", " ; ; ", "Shard_0", "shard-0", "1shard", "shard_0;shard_0", "3;shard_0"])
+def test_parse_shards_rejects_malformed_values(value):
+    with pytest.raises(ValueError):
+        parse_shards(value)
+
+
+def test_merge_vocabularies_adds_up_frequencies_in_utf8_order():
+    merged = merge_vocabularies([
+        [("apple", 1), ("zebra", 2), ("ünïcode", 1)],
+        [("apple", 3), ("banana", 1), ("ünïcode", 4)],
+        [],
+        [("zebra", 1)],
+    ])
+    assert merged == [("apple", 4), ("banana", 1), ("zebra", 3), ("ünïcode", 5)]
+
+
+def random_corpus(rng, doc_count, term_count):
+    """{url: (length, {term: tf})} with a distinct length per document, so scores do not tie."""
+    lengths = rng.sample(range(5, 5 + 10 * doc_count), doc_count)
+    corpus = {}
+    for number, length in enumerate(lengths):
+        terms = rng.sample(range(term_count), rng.randint(1, term_count))
+        corpus[f"https://example.com/{number}"] = (length, {f"term{term}": rng.randint(1, 4) for term in terms})
+    return corpus
+
+
+def postings_of(corpus, doc_ids):
+    """Sorted postings {term: (doc_ids, tfs, lengths)} of the documents of a corpus."""
+    postings = {}
+    for url in sorted(doc_ids, key=doc_ids.get):
+        length, terms = corpus[url]
+        for term, tf in terms.items():
+            postings.setdefault(term, []).append((doc_ids[url], tf, length))
+    return {term: tuple(np.asarray(column, dtype=np.int64) for column in zip(*rows)) for term, rows in postings.items()}
+
+
+def rank(ranker, postings, weights, avg_length, k):
+    """Top k as a shard ranks it: weights of the whole index, bounds of its own postings."""
+    terms = {
+        term: (weights[term], len(doc_ids), int(tfs.max()), int(lengths.min()))
+        for term, (doc_ids, tfs, lengths) in postings.items()
+    }
+
+    def lookup(keys, doc_ids):
+        restricted = {}
+        for key in keys:
+            found = np.isin(postings[key][0], doc_ids)
+            restricted[key] = tuple(column[found] for column in postings[key])
+        return restricted
+
+    return ranker.top_k_pruned(k, terms, avg_length, lambda keys: {key: postings[key] for key in keys}, lookup)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_scatter_gather_matches_a_single_index(seed):
+    rng = random.Random(seed)
+    corpus = random_corpus(rng, rng.choice((10, 100, 500)), rng.randint(1, 4))
+    shard_count = rng.choice((2, 3, 5))
+    depth = rng.choice((1, 5, 20, 1000))
+    ranker = BM25()
+
+    # Every shard numbers its own documents, as each has a documents table of its own
+    doc_ids = {url: doc_id for doc_id, url in enumerate(corpus)}
+    shard_doc_ids = [{} for _ in range(shard_count)]
+    for url in corpus:
+        shard = shard_doc_ids[shard_of(url, shard_count)]
+        shard[url] = len(shard)
+
+    single = postings_of(corpus, doc_ids)
+    avg_length = sum(length for length, _ in corpus.values()) / len(corpus)
+    weights = {term: ranker.idf(len(postings[0]), len(corpus)) for term, postings in single.items()}
+
+    expected = rank(ranker, single, weights, avg_length, depth)
+    merged = merge_top_documents([
+        rank(ranker, postings_of(corpus, ids), weights, avg_length, depth) for ids in shard_doc_ids
+    ], depth)
+
+    urls = [{doc_id: url for url, doc_id in ids.items()} for ids in shard_doc_ids]
+    by_doc_id = {doc_id: url for url, doc_id in doc_ids.items()}
+    assert [urls[shard][doc_id] for shard, doc_id, _ in merged] == [by_doc_id[doc_id] for doc_id, _ in expected]
+    assert [score for _, _, score in merged] == pytest.approx([score for _, score in expected])
+
+
+def test_merge_top_documents_breaks_ties_by_shard_then_doc_id():
+    rankings = [[(5, 2.0), (1, 1.0)], [(3, 2.0), (2, 1.5)], []]
+    assert merge_top_documents(rankings, 3) == [(0, 5, 2.0), (1, 3, 2.0), (1, 2, 1.5)]
+    assert merge_top_documents([[], []], 10) == []
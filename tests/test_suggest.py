@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+from frontend.suggest import PrefixIndex
+
+VOCABULARY = {
+    "a": 3, "ab": 9, "abc": 9, "abd": 1, "rom": 2, "roma": 7, "roman": 12, "romance": 4, "rome": 12,
+    "romulus": 1, "zebra": 5, "zoo": 2, "zyx": 8, "ünïcode": 6,
+}
+
+
+def build(vocabulary, **options):
+    terms = sorted(vocabulary, key=lambda term: term.encode("utf-8"))
+    return PrefixIndex(terms, [vocabulary[term] for term in terms], **options)
+
+
+def expected(vocabulary, prefix, limit):
+    """Completions by brute force: most frequent first, ties in UTF-8 order."""
+    matches = [(term, df) for term, df in vocabulary.items() if term.startswith(prefix)]
+    return sorted(matches, key=lambda item: (-item[1], item[0].encode("utf-8")))[:limit]
+
+
+def test_orders_by_frequency_then_dictionary_order():
+    index = build(VOCABULARY)
+    assert index.complete("rom") == [("roman", 12), ("rome", 12), ("roma", 7), ("romance", 4), ("rom", 2), ("romulus", 1)]
+    assert index.complete("ab") == [("ab", 9), ("abc", 9), ("abd", 1)]
+
+
+def test_limit_cuts_off_completions():
+    index = build(VOCABULARY, max_limit=3)
+    assert index.complete("rom", limit=2) == [("roman", 12), ("rome", 12)]
+    assert index.complete("rom", limit=0) == []
+    # No more than max_limit, whatever is asked for
+    assert index.complete("rom", limit=10) == [("roman", 12), ("rome", 12), ("roma", 7)]
+
+
+def test_empty_prefix_completes_the_whole_dictionary():
+    index = build(VOCABULARY)
+    assert index.complete("", limit=4) == [("roman", 12), ("rome", 12), ("ab", 9), ("abc", 9)]
+    assert build({}).complete("") == []
+
+
+@pytest.mark.parametrize("prefix, completions", [
+    ("zy", [("zyx", 8)]),
+    ("zyx", [("zyx", 8)]),
+    ("zyxw", []),
+    ("ü", [("ünïcode", 6)]),
+    ("ünïcodes", []),
+    ("\U0010ffff", []),
+    ("b", []),
+])
+def test_prefixes_at_the_end_or_between_terms(prefix, completions):
+    assert build(VOCABULARY).complete(prefix) == completions
+
+
+def test_precomputed_and_on_demand_prefixes_agree():
+    # rank_threshold=2 precomputes "", "a", "r", "ro", "rom"... while the default ranks every prefix on demand
+    precomputed = build(VOCABULARY, rank_threshold=2)
+    on_demand = build(VOCABULARY)
+    assert {b"", b"a", b"ab", b"r", b"ro", b"rom", b"z"} <= set(precomputed.ranked)
+    assert set(on_demand.ranked) == {b""}
+
+    prefixes = {term[:length] for term in VOCABULARY for length in range(len(term) + 1)}
+    for prefix in prefixes:
+        for limit in (1, 2, 5, 20):
+            assert precomputed.complete(prefix, limit) == expected(VOCABULARY, prefix, limit), (prefix, limit)
+            assert on_demand.complete(prefix, limit) == expected(VOCABULARY, prefix, limit), (prefix, limit)
+
+
+def test_matches_brute_force_on_random_dictionaries():
+    rng = random.Random(3)
+    for _ in range(20):
+        # Few letters and few distinct frequencies, so ranges are long and ties common
+        vocabulary = {
+            "".join(rng.choice("abé") for _ in range(rng.randint(1, 6))): rng.randint(1, 4) for _ in range(200)
+        }
+        index = build(vocabulary, max_limit=5, rank_threshold=rng.choice([1, 8, 4096]))
+        for prefix in ["", "a", "b", "é", "ab", "ba", "aé", "abab", "c"]:
+            for limit in (1, 3, 5):
+                assert index.complete(prefix, limit) == expected(vocabulary, prefix, limit), (prefix, limit)